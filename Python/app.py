@@ -1,15 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime, timedelta
-import random
-import pickle
+from datetime import datetime
 import os
-import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-import pandas as pd
-from conexion import get_db_connection  # Importamos la función desde conexion.py
+import mysql.connector
+from conexion import get_db_connection, conexion_bd, ErrorConexion  # Importamos las funciones desde conexion.py
+from modelos import registro, precargar_ml
+from cache_respuestas import (
+    cache_respuestas, cacheado, CACHE_TTL_ZONAS, CACHE_TTL_DELEGACIONES, CACHE_TTL_AGREGADOS,
+    CACHE_TTL_PRONOSTICO,
+)
+from verificacion_indices import verificar_planes_al_iniciar
+from resumen_diario import ER_NO_SUCH_TABLE
+from entrenamiento import entrenar_en_paralelo, cola_entrenamiento
+from prediccion import (
+    obtener_prediccion, calcular_pronostico, obtener_predicciones_lote, serializar_lote, ErrorPrediccion
+)
+from metricas import metricas, iniciar_peticion, terminar_peticion, tramo
+from consultas import (
+    ZONAS_RIESGO_RESUMEN, ZONAS_RIESGO_INCIDENTES, CONFIRMADAS_PENDIENTES, interpretar_fecha,
+    consulta_incidentes,
+    leer_paginacion, leer_paginacion_filas, paginar_filas, cortar_pagina, formato_streaming,
+    leer_agregacion, consulta_agregados, armar_agregados, leer_pronostico, leer_prediccion_lote
+)
+
+# jsonify con la serialización medida como etapa "serializacion" en /metrics
+class ProveedorJSONMedido(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with tramo("serializacion"):
+            return super().response(*args, **kwargs)
 
 app = Flask(__name__)
+app.json = ProveedorJSONMedido(app)
 
 # Configurar CORS para permitir solicitudes desde las URLs de tu frontend en Vercel
 CORS(app, resources={
@@ -22,38 +44,58 @@ CORS(app, resources={
     }
 })
 
-# Ruta para modelos de aprendizaje
-# Usar una ruta relativa al directorio de trabajo actual
-MODELS_DIR = os.path.join(os.getcwd(), "models")
-os.makedirs(MODELS_DIR, exist_ok=True)
+# Filas por bloque al transmitir respuestas grandes
+STREAM_CHUNK = int(os.getenv("STREAM_CHUNK", 500))
+
+# Las bibliotecas de ML (pandas, scikit-learn) se importan en la primera predicción o entrenamiento;
+# con PRECARGAR_ML=1 se importan al arrancar (antes del fork si el servidor precarga la app)
+if os.getenv("PRECARGAR_ML", "0") == "1":
+    precargar_ml()
+
+# Precargar en memoria los modelos existentes al arrancar (opcional)
+if os.getenv("PRECARGAR_MODELOS", "0") == "1":
+    registro.precargar()
+
+# Avisar si las consultas frecuentes recorren tablas completas (EXPLAIN en segundo plano)
+verificar_planes_al_iniciar()
+
+# Duración de cada petición por ruta (plantilla de la ruta, no la URL, para acotar las series)
+@app.before_request
+def iniciar_metricas():
+    iniciar_peticion(request.url_rule.rule if request.url_rule else "no_encontrada", request.method)
+
+@app.after_request
+def terminar_metricas(respuesta):
+    terminar_peticion(respuesta.status_code)
+    return respuesta
+
+# Sin conexión a la base de datos (MySQL caído o pool agotado) cualquier ruta responde con el mismo error JSON
+@app.errorhandler(ErrorConexion)
+def error_conexion(e):
+    return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
+# Métricas del proceso en formato de Prometheus
+@app.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/api/zonas_riesgo', methods=['GET'])
+@cacheado(CACHE_TTL_ZONAS)
 def get_zonas_riesgo():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-
-    cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
-    
-    # Consulta para calcular los porcentajes de riesgo
-    cursor.execute(''' 
-        SELECT 
-            d.id, 
-            d.nombre,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'danger' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS red,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'warning' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS yellow,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'success' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS green,
-            COUNT(i.id) AS total
-        FROM delegaciones d
-        LEFT JOIN incidentes i ON d.id = i.delegacion_id
-        LEFT JOIN niveles_riesgo nr ON i.nivel_riesgo_id = nr.id
-        WHERE i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-        GROUP BY d.id
-    ''')
-    
-    zonas_riesgo = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
+        
+        # Porcentajes de riesgo de los últimos 30 días a partir del resumen diario (~30 filas por delegación)
+        try:
+            cursor.execute(ZONAS_RIESGO_RESUMEN)
+        except mysql.connector.Error as e:
+            if e.errno != ER_NO_SUCH_TABLE:
+                raise
+            # Sin la migración sql/002 se calcula directamente sobre incidentes
+            cursor.execute(ZONAS_RIESGO_INCIDENTES)
+        
+        zonas_riesgo = cursor.fetchall()
+        cursor.close()
     
     return jsonify(zonas_riesgo)
 
@@ -63,37 +105,31 @@ def get_estimaciones_riesgo():
     delegacion_id = request.args.get('delegacion_id', default=None, type=int)
     dias = request.args.get('dias', default=7, type=int)
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Llamada al procedimiento almacenado para obtener las predicciones
-    cursor.callproc('obtener_predicciones', [delegacion_id, dias])
-    
-    estimaciones_riesgo = []
-    for result in cursor.stored_results():
-        estimaciones_riesgo = result.fetchall()
-    
-    cursor.close()
-    conn.close()
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
+        
+        # Llamada al procedimiento almacenado para obtener las predicciones
+        cursor.callproc('obtener_predicciones', [delegacion_id, dias])
+        
+        estimaciones_riesgo = []
+        for result in cursor.stored_results():
+            estimaciones_riesgo = result.fetchall()
+        
+        cursor.close()
     
     return jsonify(estimaciones_riesgo)
 
 # Obtener lista de delegaciones
 @app.route("/delegaciones", methods=["GET"])
+@cacheado(CACHE_TTL_DELEGACIONES)
 def obtener_lista_delegaciones():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+    # La conexión se toma del pool y se devuelve al salir del bloque
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM v_lista_delegaciones")
+        delegaciones = cursor.fetchall()
+        cursor.close()
 
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM v_lista_delegaciones")
-    delegaciones = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
     return jsonify(delegaciones)
 
 # Obtener incidentes por delegación y fecha (históricos o predicciones)
@@ -107,548 +143,292 @@ def obtener_incidentes():
     if not delegacion_id:
         return jsonify({"error": "Falta el parámetro 'delegacion_id'"}), 400
 
-    # Manejo de fecha para predicciones mensuales
-    if periodo == "month":
-        if not fecha or fecha.strip() == "":
-            # Si no se proporciona fecha, usar el mes actual
-            fecha = datetime.now().strftime("%Y-%m")
-        
-        try:
-            # Validar formato de fecha para mes
-            year, month = map(int, fecha.split('-'))
-            fecha_consulta = datetime(year, month, 1)
-        except (ValueError, TypeError):
-            return jsonify({"error": "Formato de fecha inválido para periodo 'month'. Usa 'YYYY-MM'"}), 400
-
-        # Generar predicción si la fecha es futura
-        if fecha_consulta > datetime.now():
-            return generar_prediccion_incidentes(delegacion_id, fecha, periodo)
-
-    elif periodo in ["day", "week"]:
-        # Validación de fecha para día y semana
-        if not fecha or fecha.strip() == "":
-            fecha = datetime.now().strftime("%Y-%m-%d")
-        
-        try:
-            fecha_consulta = datetime.strptime(fecha, "%Y-%m-%d")
-        except ValueError:
-            return jsonify({"error": "Formato de fecha inválido. Usa 'YYYY-MM-DD'"}), 400
-
-        # Generar predicción si la fecha es futura
-        if fecha_consulta > datetime.now():
-            return generar_prediccion_incidentes(delegacion_id, fecha, periodo)
+    fecha, fecha_consulta, error_fecha = interpretar_fecha(periodo, fecha)
+    if error_fecha:
+        return jsonify({"error": error_fecha}), 400
 
-    # Conexión a la base de datos
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+    # Generar predicción si la fecha es futura
+    if fecha_consulta and fecha_consulta > datetime.now():
+        return respuesta_prediccion(delegacion_id, fecha, periodo)
 
-    cursor = conn.cursor(dictionary=True)
+    # Paginación opcional por keyset (?limit=N&cursor=...)
+    pagina, error_pagina = leer_paginacion(request.args)
+    if error_pagina:
+        return jsonify({"error": error_pagina}), 400
 
-    try:
-        # Consultas SQL por periodo
-        if periodo == "month":
-            query = """
-                SELECT 
-                    i.id,
-                    i.tipo,
-                    i.ubicacion,
-                    TIME_FORMAT(i.hora_incidente, '%H:%i') AS hora,
-                    r.nombre AS riesgo,
-                    r.codigo_color,
-                    i.fecha_incidente AS fecha
-                FROM 
-                    incidentes i
-                JOIN 
-                    niveles_riesgo r ON i.nivel_riesgo_id = r.id
-                WHERE 
-                    i.delegacion_id = %s
-                    AND YEAR(i.fecha_incidente) = %s
-                    AND MONTH(i.fecha_incidente) = %s
-                ORDER BY 
-                    i.fecha_incidente, i.hora_incidente
-            """
-            cursor.execute(query, (delegacion_id, year, month))
-
-        elif periodo == "week":
-            query = """
-                SELECT 
-                    i.id,
-                    i.tipo,
-                    i.ubicacion,
-                    TIME_FORMAT(i.hora_incidente, '%H:%i') AS hora,
-                    r.nombre AS riesgo,
-                    r.codigo_color,
-                    i.fecha_incidente AS fecha
-                FROM 
-                    incidentes i
-                JOIN 
-                    niveles_riesgo r ON i.nivel_riesgo_id = r.id
-                WHERE 
-                    i.delegacion_id = %s
-                    AND i.fecha_incidente >= %s
-                    AND i.fecha_incidente <= DATE_ADD(%s, INTERVAL 6 DAY)
-                ORDER BY 
-                    i.fecha_incidente, i.hora_incidente
-            """
-            cursor.execute(query, (delegacion_id, fecha, fecha))
-
-        elif periodo == "day":
-            query = """
-                SELECT 
-                    i.id,
-                    i.tipo,
-                    i.ubicacion,
-                    TIME_FORMAT(i.hora_incidente, '%H:%i') AS hora,
-                    r.nombre AS riesgo,
-                    r.codigo_color,
-                    i.fecha_incidente AS fecha
-                FROM 
-                    incidentes i
-                JOIN 
-                    niveles_riesgo r ON i.nivel_riesgo_id = r.id
-                WHERE 
-                    i.delegacion_id = %s
-                    AND i.fecha_incidente = %s
-                ORDER BY 
-                    i.hora_incidente
-            """
-            cursor.execute(query, (delegacion_id, fecha))
-        else:
-            return jsonify({"error": "Periodo inválido. Usa 'day', 'week' o 'month'"}), 400
+    consulta = consulta_incidentes(delegacion_id, periodo, fecha, fecha_consulta, pagina)
+    if consulta is None:
+        return jsonify({"error": "Periodo inválido. Usa 'day', 'week' o 'month'"}), 400
+    query, parametros = consulta
 
-        incidentes = cursor.fetchall()
+    # Modo streaming opcional para rangos grandes (?stream=1, ?stream=ndjson o Accept: application/x-ndjson)
+    formato_stream = None if pagina else formato_streaming(request.args, request.headers)
+    if formato_stream:
+        return respuesta_streaming(query, parametros, formato_stream)
 
-    except Exception as e:
-        return jsonify({"error": f"Error en la consulta: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    # Conexión a la base de datos (tomada del pool y devuelta al salir del bloque)
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, parametros)
+            incidentes = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"error": f"Error en la consulta: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
+    if pagina:
+        return respuesta_paginada(incidentes, pagina[1])
     return jsonify(incidentes)
 
-# Función para entrenar o actualizar el modelo de predicción
-def entrenar_modelo(delegacion_id):
+# Respuesta de una página con el token opaco de la siguiente
+def respuesta_paginada(filas, limite):
+    return jsonify(cortar_pagina(filas, limite))
+
+# Transmitir las filas de una consulta en bloques desde un cursor sin buffer
+# La memoria no depende del número de filas y el cliente recibe los primeros datos antes
+# La conexión vive lo que dura la respuesta (no cabe en un bloque with): liberar() la devuelve en todos los casos
+def respuesta_streaming(query, parametros, formato):
     conn = get_db_connection()
-    if not conn:
-        print("❌ No se pudo conectar a la base de datos para entrenar el modelo")
-        return None
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Obtener datos históricos para entrenamiento
-    query = """
-        SELECT 
-            HOUR(i.hora_incidente) as hora,
-            DAYOFWEEK(i.fecha_incidente) as dia_semana,
-            MONTH(i.fecha_incidente) as mes,
-            i.tipo,
-            i.ubicacion,
-            i.nivel_riesgo_id
-        FROM 
-            incidentes i
-        WHERE 
-            i.delegacion_id = %s
-        ORDER BY 
-            i.fecha_incidente DESC, i.hora_incidente DESC
-        LIMIT 1000
-    """
-    
     try:
-        cursor.execute(query, (delegacion_id,))
-        datos_entrenamiento = cursor.fetchall()
-        
-        if not datos_entrenamiento or len(datos_entrenamiento) < 10:
-            print(f"⚠️ Datos insuficientes para entrenar modelo de delegación {delegacion_id}")
+        cursor = conn.cursor(dictionary=True, buffered=False)
+    except Exception:
+        conn.close()
+        raise
+
+    def liberar():
+        try:
             cursor.close()
-            conn.close()
-            return None
-        
-        # Preparar datos para el modelo
-        df = pd.DataFrame(datos_entrenamiento)
-        
-        # Codificar variables categóricas
-        df_encoded = pd.get_dummies(df, columns=['tipo', 'ubicacion'])
-        
-        # Características (X) y objetivo (y)
-        X = df_encoded.drop('nivel_riesgo_id', axis=1)
-        y = df_encoded['nivel_riesgo_id']
-        
-        # Entrenar modelo (RandomForest como ejemplo)
-        model = RandomForestClassifier(n_estimators=100)
-        model.fit(X, y)
-        
-        # Guardar el modelo entrenado
-        model_path = os.path.join(MODELS_DIR, f"modelo_delegacion_{delegacion_id}.pkl")
-        
-        # Guardar también la estructura de las columnas para usar en predicciones
-        model_data = {
-            'model': model,
-            'columns': X.columns.tolist()
-        }
-        
-        with open(model_path, 'wb') as file:
-            pickle.dump(model_data, file)
-        
-        print(f"     Modelo entrenado y guardado para delegación {delegacion_id}")
-        
-        # Guardar también un modelo para tipos de incidentes
-        tipos_query = """
-            SELECT tipo, COUNT(*) as count 
-            FROM incidentes 
-            WHERE delegacion_id = %s 
-            GROUP BY tipo
-        """
-        cursor.execute(tipos_query, (delegacion_id,))
-        tipos_incidentes = {row['tipo']: row['count'] for row in cursor.fetchall()}
-        
-        tipos_path = os.path.join(MODELS_DIR, f"tipos_delegacion_{delegacion_id}.pkl")
-        with open(tipos_path, 'wb') as file:
-            pickle.dump(tipos_incidentes, file)
-        
-        # Guardar modelo para ubicaciones
-        ubicaciones_query = """
-            SELECT ubicacion, COUNT(*) as count 
-            FROM incidentes 
-            WHERE delegacion_id = %s 
-            GROUP BY ubicacion
-        """
-        cursor.execute(ubicaciones_query, (delegacion_id,))
-        ubicaciones = {row['ubicacion']: row['count'] for row in cursor.fetchall()}
-        
-        ubicaciones_path = os.path.join(MODELS_DIR, f"ubicaciones_delegacion_{delegacion_id}.pkl")
-        with open(ubicaciones_path, 'wb') as file:
-            pickle.dump(ubicaciones, file)
-        
-        cursor.close()
+        except Exception:
+            pass  # Con filas sin leer (cliente desconectado) el pool descarta el resto al devolver la conexión
         conn.close()
-        return model_data
-    
+
+    try:
+        cursor.execute(query, parametros)
     except Exception as e:
-        print(f"❌ Error al entrenar modelo: {e}")
-        cursor.close()
-        conn.close()
-        return None
+        liberar()
+        return jsonify({"error": f"Error en la consulta: {str(e)}"}), 500
 
-# Cargar modelo existente o entrenar uno nuevo
-def cargar_o_entrenar_modelo(delegacion_id):
-    model_path = os.path.join(MODELS_DIR, f"modelo_delegacion_{delegacion_id}.pkl")
-    
-    # Verificar si existe un modelo entrenado
-    if os.path.exists(model_path):
+    # Mismo formato que jsonify (fechas incluidas), sin espacios
+    def serializar(fila):
+        return app.json.dumps(fila, separators=(",", ":"))
+
+    def generar():
         try:
-            with open(model_path, 'rb') as file:
-                model_data = pickle.load(file)
-                # Verificar si el modelo tiene más de 30 días
-                if os.path.getmtime(model_path) < (datetime.now() - timedelta(days=30)).timestamp():
-                    print("⚠️ Modelo existente pero antiguo, reentrenando...")
-                    return entrenar_modelo(delegacion_id) or model_data
-                return model_data
-        except Exception as e:
-            print(f"❌ Error al cargar modelo existente: {e}")
-    
-    # Si no existe o hubo error, entrenar nuevo modelo
-    return entrenar_modelo(delegacion_id)
+            primero = True
+            if formato == "json":
+                yield "["
+            while True:
+                filas = cursor.fetchmany(STREAM_CHUNK)
+                if not filas:
+                    break
+                if formato == "ndjson":
+                    yield "".join(serializar(fila) + "\n" for fila in filas)
+                else:
+                    bloque = ",".join(serializar(fila) for fila in filas)
+                    yield bloque if primero else "," + bloque
+                primero = False
+            if formato == "json":
+                yield "]\n"
+        finally:
+            liberar()
+
+    mimetype = "application/x-ndjson" if formato == "ndjson" else "application/json"
+    return Response(generar(), mimetype=mimetype)
+
+# Predicciones de un periodo futuro (cacheadas por delegación, fecha, periodo y versión del modelo)
+def respuesta_prediccion(delegacion_id, fecha_base, periodo):
+    try:
+        payload = obtener_prediccion(delegacion_id, fecha_base, periodo)
+    except ErrorPrediccion as e:
+        return jsonify({"error": e.mensaje}), e.status
+    return Response(payload, mimetype="application/json")
+
+# Predicciones futuras de varias delegaciones en una sola respuesta (p. ej. la vista de toda la ciudad)
+# Las delegaciones que fallan aparecen en "errores" con su código HTTP; el resto se devuelve igualmente
+@app.route("/predicciones/lote", methods=["GET"])
+def obtener_predicciones_por_lote():
+    parametros, error = leer_prediccion_lote(request.args)
+    if error:
+        return jsonify({"error": error}), 400
 
-# Función mejorada para generar predicciones de incidentes
-def generar_prediccion_incidentes(delegacion_id, fecha_base, periodo):
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Obtener información de la delegación
-    cursor.execute("SELECT nombre FROM delegaciones WHERE id = %s", (delegacion_id,))
-    delegacion = cursor.fetchone()
-    
-    if not delegacion:
-        cursor.close()
-        conn.close()
-        return jsonify({"error": "Delegación no encontrada"}), 404
-    
-    # Cargar o entrenar modelo para esta delegación
-    model_data = cargar_o_entrenar_modelo(delegacion_id)
-    
-    # Cargar distribuciones de tipos y ubicaciones
-    tipos_path = os.path.join(MODELS_DIR, f"tipos_delegacion_{delegacion_id}.pkl")
-    ubicaciones_path = os.path.join(MODELS_DIR, f"ubicaciones_delegacion_{delegacion_id}.pkl")
-    
     try:
-        with open(tipos_path, 'rb') as file:
-            tipos_incidentes = pickle.load(file)
-    except:
-        # Si no existe, obtener de la base de datos
-        cursor.execute("""
-            SELECT tipo, COUNT(*) as count 
-            FROM incidentes 
-            WHERE delegacion_id = %s 
-            GROUP BY tipo 
-            ORDER BY count DESC 
-            LIMIT 10
-        """, (delegacion_id,))
-        tipos_incidentes = {row['tipo']: row['count'] for row in cursor.fetchall()}
-    
+        payloads, errores = obtener_predicciones_lote(**parametros)
+    except ErrorPrediccion as e:
+        return jsonify({"error": e.mensaje}), e.status
+    return Response(serializar_lote(parametros["fecha_base"], parametros["periodo"], payloads, errores),
+                    mimetype="application/json")
+
+# Bandas de percentiles de muchos escenarios simulados de un periodo (incidentes por día, color, tipo y hora)
+@app.route("/pronostico", methods=["GET"])
+@cacheado(CACHE_TTL_PRONOSTICO)
+def obtener_pronostico():
+    parametros, error = leer_pronostico(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
     try:
-        with open(ubicaciones_path, 'rb') as file:
-            ubicaciones_dict = pickle.load(file)
-            ubicaciones = [{"ubicacion": ubicacion} for ubicacion in ubicaciones_dict.keys()]
-    except:
-        # Si no existe, obtener de la base de datos
-        cursor.execute("""
-            SELECT DISTINCT ubicacion 
-            FROM incidentes 
-            WHERE delegacion_id = %s 
-            ORDER BY RAND() 
-            LIMIT 20
-        """, (delegacion_id,))
-        ubicaciones = cursor.fetchall()
-    
-    # Si no hay ubicaciones, crear algunas genéricas
-    if not ubicaciones:
-        ubicaciones = [
-            {"ubicacion": f"Calle Principal {i}, {delegacion['nombre']}"} 
-            for i in range(1, 6)
-        ]
-    
-    # Si no hay tipos de incidentes, crear algunos genéricos
-    if not tipos_incidentes:
-        tipos_incidentes = {
-            "Asalto a transeúnte": 10,
-            "Robo de vehículo": 8,
-            "Asalto a negocio": 6,
-            "Robo a casa habitación": 5,
-            "Asalto con violencia": 4
-        }
-    
-    # Obtener los niveles de riesgo
-    cursor.execute("SELECT id, nombre, codigo_color FROM niveles_riesgo")
-    niveles_riesgo = cursor.fetchall()
-    
-    # Crear mapa de ID a nivel de riesgo
-    riesgo_map = {nivel['id']: nivel for nivel in niveles_riesgo}
-    
-    # Generar predicciones según el periodo
-    fecha_base_obj = datetime.strptime(fecha_base, "%Y-%m-%d")
-    predicciones = []
-    
-    if periodo == "day":
-        # Para un día, generar entre 3-8 incidentes
-        num_incidentes = random.randint(3, 8)
-        for i in range(num_incidentes):
-            predicciones.append(generar_incidente_con_modelo(
-                fecha_base_obj, 
-                tipos_incidentes, 
-                ubicaciones, 
-                riesgo_map,
-                model_data
-            ))
-    
-    elif periodo == "week":
-        # Para una semana, generar incidentes para cada día
-        for i in range(7):
-            fecha_dia = fecha_base_obj + timedelta(days=i)
-            num_incidentes = random.randint(2, 6)
-            for j in range(num_incidentes):
-                predicciones.append(generar_incidente_con_modelo(
-                    fecha_dia, 
-                    tipos_incidentes, 
-                    ubicaciones, 
-                    riesgo_map,
-                    model_data
-                ))
-    
-    elif periodo == "month":
-        # Para un mes, extraer año y mes
-        year, month = fecha_base.split('-')
-        # Determinar el número de días en el mes
-        if month == '02':
-            if (int(year) % 4 == 0 and int(year) % 100 != 0) or (int(year) % 400 == 0):
-                dias_en_mes = 29
-            else:
-                dias_en_mes = 28
-        elif month in ['04', '06', '09', '11']:
-            dias_en_mes = 30
-        else:
-            dias_en_mes = 31
-            
-        # Generar incidentes para cada día del mes
-        for i in range(dias_en_mes):
-            fecha_dia = datetime(int(year), int(month), i+1)
-            num_incidentes = random.randint(1, 5)
-            for j in range(num_incidentes):
-                predicciones.append(generar_incidente_con_modelo(
-                    fecha_dia, 
-                    tipos_incidentes, 
-                    ubicaciones, 
-                    riesgo_map,
-                    model_data
-                ))
-    
-    cursor.close()
-    conn.close()
-    
-    # Ordenar predicciones por fecha y hora
-    predicciones.sort(key=lambda x: (x['fecha'], x['hora']))
-    
-    return jsonify(predicciones)
-
-# Función para generar un incidente usando el modelo entrenado
-def generar_incidente_con_modelo(fecha, tipos_incidentes, ubicaciones, riesgo_map, model_data):
-    # Elegir un tipo de incidente con probabilidad ponderada por su frecuencia
-    tipos = list(tipos_incidentes.keys())
-    pesos = list(tipos_incidentes.values())
-    selected_tipo = random.choices(tipos, weights=pesos)[0]
-    
-    # Elegir una ubicación aleatoria
-    selected_ubicacion = random.choice(ubicaciones)['ubicacion']
-    
-    # Generar una hora que tenga en cuenta patrones temporales
-    # Las horas se generan con mayor probabilidad en horas con más incidentes históricos
-    hour = random.choices(
-        range(24),
-        weights=[3, 2, 1, 1, 1, 2, 3, 5, 7, 6, 5, 6, 7, 6, 5, 6, 7, 8, 10, 12, 15, 13, 10, 5]
-    )[0]
-    minute = random.randint(0, 59)
-    
-    # Si tenemos un modelo entrenado, usarlo para predecir el nivel de riesgo
-    if model_data:
-        try:
-            model = model_data['model']
-            columns = model_data['columns']
-            
-            # Crear un dataframe con las características del incidente
-            data = {
-                'hora': [hour],
-                'dia_semana': [fecha.weekday() + 1],  # 1-7 para día de la semana
-                'mes': [fecha.month]
-            }
-            
-            # Crear dataframe inicial
-            df_pred = pd.DataFrame(data)
-            
-            # Crear columnas dummy para tipo y ubicación
-            for col in columns:
-                if col.startswith('tipo_'):
-                    tipo_col = col.replace('tipo_', '')
-                    df_pred[col] = 1 if tipo_col == selected_tipo else 0
-                elif col.startswith('ubicacion_'):
-                    ubicacion_col = col.replace('ubicacion_', '')
-                    df_pred[col] = 1 if ubicacion_col == selected_ubicacion else 0
-                elif col not in df_pred.columns:
-                    df_pred[col] = 0  # Añadir columna faltante con valor 0
-            
-            # Asegurar que tenemos todas las columnas necesarias
-            missing_cols = set(columns) - set(df_pred.columns)
-            for col in missing_cols:
-                df_pred[col] = 0
-                
-            # Ordenar columnas igual que el modelo
-            df_pred = df_pred[columns]
-            
-            # Predecir nivel de riesgo
-            nivel_riesgo_id = model.predict(df_pred)[0]
-            nivel_riesgo = riesgo_map.get(nivel_riesgo_id)
-            
-            if not nivel_riesgo:
-                # Si no podemos encontrar el nivel en el mapa, usar uno aleatorio
-                nivel_riesgo = random.choice(list(riesgo_map.values()))
-        
-        except Exception as e:
-            print(f"❌ Error al usar modelo para predicción: {e}")
-            # En caso de error, usar un nivel aleatorio
-            nivel_riesgo = random.choice(list(riesgo_map.values()))
-    else:
-        # Si no hay modelo, elegir un nivel aleatorio
-        nivel_riesgo = random.choice(list(riesgo_map.values()))
-    
-    return {
-        'id': f"pred-{random.randint(10000, 99999)}",
-        'tipo': selected_tipo,
-        'ubicacion': selected_ubicacion,
-        'hora': f"{hour:02d}:{minute:02d}",
-        'riesgo': nivel_riesgo['nombre'],
-        'codigo_color': nivel_riesgo['codigo_color'],
-        'fecha': fecha.strftime("%Y-%m-%d"),
-        'es_prediccion': True
-    }
+        return jsonify(calcular_pronostico(**parametros))
+    except ErrorPrediccion as e:
+        return jsonify({"error": e.mensaje}), e.status
+
+# Campos obligatorios de un registro de retroalimentación
+CAMPOS_RETROALIMENTACION = ["incidente_id", "delegacion_id", "tipo", "ubicacion", "fecha", "hora", "nivel_riesgo_id"]
+
+# Registros máximos por llamada a /retroalimentacion/lote
+RETROALIMENTACION_LOTE_MAX = int(os.getenv("RETROALIMENTACION_LOTE_MAX", 1000))
+
+INSERT_RETROALIMENTACION = """
+    INSERT INTO predicciones_confirmadas (
+        incidente_original_id, delegacion_id, tipo, ubicacion, 
+        fecha_incidente, hora_incidente, nivel_riesgo_id, confirmado
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Devuelve el mensaje de error de un registro de retroalimentación, o None si es válido
+def validar_retroalimentacion(data):
+    if not data or not isinstance(data, dict):
+        return "Datos inválidos"
+    for field in CAMPOS_RETROALIMENTACION:
+        if field not in data:
+            return f"Falta el campo '{field}'"
+    # Verificar si es una predicción (debe tener prefijo "pred-")
+    if not isinstance(data["incidente_id"], str) or not data["incidente_id"].startswith("pred-"):
+        return "Solo se puede registrar retroalimentación para predicciones"
+    # Se comprueba antes del INSERT: un id que no es entero haría fallar después el reentrenamiento
+    try:
+        int(data["delegacion_id"])
+    except (TypeError, ValueError):
+        return "delegacion_id inválido"
+    return None
+
+def fila_retroalimentacion(data):
+    return (
+        data["incidente_id"],
+        int(data["delegacion_id"]),
+        data["tipo"],
+        data["ubicacion"],
+        data["fecha"],
+        data["hora"],
+        data["nivel_riesgo_id"],
+        data.get("confirmado", True)
+    )
 
 # Ruta para registrar retroalimentación sobre predicciones
 @app.route("/retroalimentacion", methods=["POST"])
 def registrar_retroalimentacion():
     data = request.json
     
-    if not data or not isinstance(data, dict):
-        return jsonify({"error": "Datos inválidos"}), 400
-    
-    # Verificar datos requeridos
-    required_fields = ["incidente_id", "delegacion_id", "tipo", "ubicacion", "fecha", "hora", "nivel_riesgo_id"]
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Falta el campo '{field}'"}), 400
-    
-    # Verificar si es una predicción (debe tener prefijo "pred-")
-    if not data["incidente_id"].startswith("pred-"):
-        return jsonify({"error": "Solo se puede registrar retroalimentación para predicciones"}), 400
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+    error = validar_retroalimentacion(data)
+    if error:
+        return jsonify({"error": error}), 400
     
-    cursor = conn.cursor()
+    with conexion_bd() as conn:
+        cursor = conn.cursor()
+        try:
+            # Insertar la retroalimentación en una tabla de entrenamiento
+            cursor.execute(INSERT_RETROALIMENTACION, fila_retroalimentacion(data))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"error": f"Error al registrar retroalimentación: {str(e)}"}), 500
+        finally:
+            cursor.close()
     
-    try:
-        # Insertar la retroalimentación en una tabla de entrenamiento
-        query = """
-            INSERT INTO predicciones_confirmadas (
-                incidente_original_id, delegacion_id, tipo, ubicacion, 
-                fecha_incidente, hora_incidente, nivel_riesgo_id, confirmado
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        cursor.execute(query, (
-            data["incidente_id"],
-            data["delegacion_id"],
-            data["tipo"],
-            data["ubicacion"],
-            data["fecha"],
-            data["hora"],
-            data["nivel_riesgo_id"],
-            data.get("confirmado", True)
-        ))
-        
-        conn.commit()
-        
-        # Reentrenar el modelo
-        entrenar_modelo(data["delegacion_id"])
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({"success": True, "message": "Retroalimentación registrada correctamente"})
+    # Reentrenar el modelo en segundo plano (las ráfagas de retroalimentación se agrupan)
+    # Los /pronostico cacheados se invalidan cuando termina el entrenamiento, no ahora
+    trabajo = cola_entrenamiento.programar(int(data["delegacion_id"]))
     
-    except Exception as e:
-        conn.rollback()
-        cursor.close()
-        conn.close()
-        return jsonify({"error": f"Error al registrar retroalimentación: {str(e)}"}), 500
+    return jsonify({
+        "success": True,
+        "message": "Retroalimentación registrada correctamente",
+        "entrenamiento": trabajo
+    })
 
-# Ruta para migrar predicciones confirmadas a la tabla de incidentes reales
-@app.route("/migrar_predicciones", methods=["POST"])
-def migrar_predicciones():
+# Ruta para registrar varias retroalimentaciones en una sola llamada
+@app.route("/retroalimentacion/lote", methods=["POST"])
+def registrar_retroalimentacion_lote():
     """
-    Migra las predicciones confirmadas a la tabla de incidentes reales.
-    Esto se puede ejecutar diariamente mediante un trabajo programado.
+    Recibe una lista de registros (o {"registros": [...]}) con los mismos
+    campos que /retroalimentacion. Los válidos se insertan con un solo
+    executemany en una transacción y se programa un reentrenamiento por
+    delegación afectada; los inválidos se reportan por índice sin hacer
+    fallar el resto del lote.
     """
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-    
+    data = request.get_json(silent=True)
+    registros = data.get("registros") if isinstance(data, dict) else data
+    if not isinstance(registros, list) or not registros:
+        return jsonify({"error": "Se esperaba una lista de registros"}), 400
+    if len(registros) > RETROALIMENTACION_LOTE_MAX:
+        return jsonify({"error": f"El lote admite como máximo {RETROALIMENTACION_LOTE_MAX} registros"}), 400
+    
+    errores = []
+    validos = []  # (índice, fila)
+    for indice, registro in enumerate(registros):
+        error = validar_retroalimentacion(registro)
+        if error:
+            errores.append({"indice": indice, "error": error})
+        else:
+            validos.append((indice, fila_retroalimentacion(registro)))
+    
+    insertados = []
+    if validos:
+        with conexion_bd() as conn:
+            cursor = conn.cursor()
+            try:
+                try:
+                    cursor.executemany(INSERT_RETROALIMENTACION, [fila for _, fila in validos])
+                    insertados = validos
+                except mysql.connector.Error:
+                    # Algún registro viola una restricción (p. ej. clave foránea): repetir
+                    # fila por fila en la misma transacción para aislar los que fallan
+                    conn.rollback()
+                    for indice, fila in validos:
+                        try:
+                            cursor.execute(INSERT_RETROALIMENTACION, fila)
+                            insertados.append((indice, fila))
+                        except mysql.connector.Error as e:
+                            errores.append({"indice": indice, "error": f"Error al registrar retroalimentación: {str(e)}"})
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                return jsonify({"error": f"Error al registrar retroalimentación: {str(e)}"}), 500
+            finally:
+                cursor.close()
+    
+    # Un solo reentrenamiento por delegación, por muchos registros que traiga el lote
+    entrenamientos = []
+    if insertados:
+        for delegacion_id in sorted({fila[1] for _, fila in insertados}):
+            entrenamientos.append(cola_entrenamiento.programar(delegacion_id))
+    
+    return jsonify({
+        "success": bool(insertados),
+        "message": f"{len(insertados)} de {len(registros)} retroalimentaciones registradas",
+        "registrados": len(insertados),
+        "errores": sorted(errores, key=lambda error: error["indice"]),
+        "entrenamientos": entrenamientos
+    })
+
+# Predicciones confirmadas que se migran por transacción en /migrar_predicciones
+MIGRACION_LOTE = int(os.getenv("MIGRACION_LOTE", 1000))
+
+# Migrar a incidentes el siguiente lote de predicciones confirmadas pendientes (id > desde_id).
+# El INSERT (los triggers de sql/002 suman las filas al resumen diario) y la marca de migrado van
+# en la misma transacción, así que un lote se migra completo o no se migra. Devuelve (último id, delegaciones, cantidad).
+def migrar_lote(conn, desde_id, limite):
     cursor = conn.cursor()
-    
     try:
-        # Migrar predicciones confirmadas
-        query = """
+        # Bloquear las filas del lote para que otra migración simultánea no las duplique
+        cursor.execute(CONFIRMADAS_PENDIENTES + "FOR UPDATE", (desde_id, limite))
+        filas = cursor.fetchall()
+        if not filas:
+            conn.rollback()
+            return desde_id, set(), 0
+        
+        ids = [fila[0] for fila in filas]
+        marcadores = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"""
             INSERT INTO incidentes (
                 delegacion_id, tipo, ubicacion, fecha_incidente, 
                 hora_incidente, nivel_riesgo_id, origen
@@ -659,40 +439,96 @@ def migrar_predicciones():
             FROM 
                 predicciones_confirmadas
             WHERE 
-                confirmado = TRUE
-                AND migrado = FALSE
-        """
-        
-        cursor.execute(query)
-        rows_affected = cursor.rowcount
-        
-        # Marcar como migradas
-        if rows_affected > 0:
-            cursor.execute("UPDATE predicciones_confirmadas SET migrado = TRUE WHERE confirmado = TRUE AND migrado = FALSE")
-        
+                id IN ({marcadores})
+            ORDER BY id
+        """, ids)
+        cursor.execute(f"UPDATE predicciones_confirmadas SET migrado = TRUE WHERE id IN ({marcadores})", ids)
         conn.commit()
-        
-        # Reentrenar todos los modelos afectados
-        cursor.execute("SELECT DISTINCT delegacion_id FROM predicciones_confirmadas WHERE migrado = TRUE")
-        delegaciones = cursor.fetchall()
-        
-        for row in delegaciones:
-            delegacion_id = row[0]
-            entrenar_modelo(delegacion_id)
-        
+        return ids[-1], {fila[1] for fila in filas}, len(ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         cursor.close()
-        conn.close()
-        
+
+# Ruta para migrar predicciones confirmadas a la tabla de incidentes reales
+@app.route("/migrar_predicciones", methods=["POST"])
+def migrar_predicciones():
+    """
+    Migra las predicciones confirmadas a la tabla de incidentes reales.
+    Esto se puede ejecutar diariamente mediante un trabajo programado.
+
+    La migración avanza en lotes por id (?lote=, por defecto MIGRACION_LOTE),
+    cada uno en su propia transacción: si falla a mitad, lo ya migrado queda
+    marcado y una nueva llamada continúa con lo pendiente. Solo se reentrenan
+    las delegaciones que recibieron incidentes en esta llamada.
+
+    Con ?modo_entrenamiento=paralelo los modelos afectados se reentrenan en un
+    pool de procesos dentro de la petición y se devuelve el reporte de tiempos;
+    por defecto se encolan en segundo plano.
+    """
+    modo_entrenamiento = request.args.get("modo_entrenamiento", "cola")
+    if modo_entrenamiento not in ("cola", "paralelo"):
+        return jsonify({"error": "modo_entrenamiento inválido. Usa 'cola' o 'paralelo'"}), 400
+    lote = request.args.get("lote", MIGRACION_LOTE, type=int)
+    if lote < 1:
+        return jsonify({"error": "lote debe ser un entero positivo"}), 400
+    
+    rows_affected, lotes, delegaciones, error = 0, 0, set(), None
+    ultimo_id = 0
+    with conexion_bd() as conn:
+        try:
+            while True:
+                ultimo_id, delegaciones_lote, cantidad = migrar_lote(conn, ultimo_id, lote)
+                if not cantidad:
+                    break
+                rows_affected += cantidad
+                lotes += 1
+                delegaciones |= delegaciones_lote
+                if cantidad < lote:
+                    break
+        except Exception as e:
+            error = f"Error al migrar predicciones: {str(e)}"
+    
+    if rows_affected > 0:
+        cache_respuestas.invalidar()
+    
+    delegaciones = sorted(delegaciones)
+    if error:
+        # Los lotes ya confirmados quedan migrados: reentrenar sus delegaciones y reportar el avance
         return jsonify({
-            "success": True, 
-            "message": f"Se migraron {rows_affected} predicciones confirmadas a incidentes reales"
-        })
+            "error": error,
+            "migradas": rows_affected,
+            "delegaciones": delegaciones,
+            "entrenamientos": [cola_entrenamiento.programar(d) for d in delegaciones]
+        }), 500
+    
+    respuesta = {
+        "success": True, 
+        "message": f"Se migraron {rows_affected} predicciones confirmadas a incidentes reales",
+        "lotes": lotes,
+        "delegaciones": delegaciones
+    }
+    if modo_entrenamiento == "paralelo":
+        respuesta["reporte_entrenamiento"] = entrenar_en_paralelo(delegaciones)
+    else:
+        respuesta["entrenamientos"] = [cola_entrenamiento.programar(d) for d in delegaciones]
     
-    except Exception as e:
-        conn.rollback()
-        cursor.close()
-        conn.close()
-        return jsonify({"error": f"Error al migrar predicciones: {str(e)}"}), 500
+    return jsonify(respuesta)
+
+# Estado de los trabajos de entrenamiento en segundo plano
+@app.route("/entrenamiento/<trabajo_id>", methods=["GET"])
+def obtener_trabajo_entrenamiento(trabajo_id):
+    trabajo = cola_entrenamiento.estado(trabajo_id)
+    if not trabajo:
+        # El estado de los trabajos es de cada worker: puede haberlo programado otro
+        return jsonify({"error": "Trabajo de entrenamiento no encontrado en este worker"}), 404
+    return jsonify(trabajo)
+
+@app.route("/entrenamiento", methods=["GET"])
+def listar_trabajos_entrenamiento():
+    delegacion_id = request.args.get("delegacion_id", default=None, type=int)
+    return jsonify(cola_entrenamiento.listar(delegacion_id))
 
 # Rutas adicionales
 @app.route("/estadisticas_historicas", methods=["GET"])
@@ -703,18 +539,38 @@ def obtener_estadisticas_historicas():
     if not delegacion_id:
         return jsonify({"error": "Falta el parámetro 'delegacion_id'"}), 400
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+    # Con ?limit=N&cursor=... se pagina la salida del procedimiento (ordenada por sus columnas)
+    pagina, error_pagina = leer_paginacion_filas(request.args)
+    if error_pagina:
+        return jsonify({"error": error_pagina}), 400
 
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("CALL obtener_estadisticas_historicas(%s, %s)", (delegacion_id, dias))
-    data = cursor.fetchall()
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("CALL obtener_estadisticas_historicas(%s, %s)", (delegacion_id, dias))
+        data = cursor.fetchall()
+        cursor.close()
 
-    cursor.close()
-    conn.close()
+    if pagina:
+        return jsonify(paginar_filas(data, pagina))
     return jsonify(data)
 
+# Conteos de incidentes agrupados para las gráficas (por hora, día de la semana, día, tipo, ubicación o color)
+# Todas las agrupaciones se cuentan sobre incidentes (rango del índice por delegación y fecha), así que los totales coinciden
+@app.route("/agregados", methods=["GET"])
+@cacheado(CACHE_TTL_AGREGADOS)
+def obtener_agregados():
+    parametros, error = leer_agregacion(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(*consulta_agregados(**parametros))
+        filas = cursor.fetchall()
+        cursor.close()
+
+    return jsonify(armar_agregados(parametros, filas))
+
 # Ruta de prueba para ver si la API corre
 @app.route("/")
 def home():
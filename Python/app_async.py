@@ -0,0 +1,453 @@
+"""
+Servidor ASGI para las rutas de lectura del tablero.
+
+Atiende /incidentes, /delegaciones, /api/zonas_riesgo, /api/estimaciones_riesgo,
+/estadisticas_historicas, /agregados, /pronostico y /predicciones/lote con las
+mismas rutas, parámetros y JSON que app.py, pero con un driver MySQL asíncrono
+(aiomysql) y su propio pool: mientras una petición espera a la base de datos el proceso
+sigue atendiendo otras, así que un solo worker soporta cientos de clientes
+concurrentes. La inferencia del modelo (CPU) se ejecuta en un pool de hilos
+para no bloquear el bucle de eventos.
+
+Las escrituras y el entrenamiento siguen en app.py. Se puede servir junto a
+ella y enrutar las lecturas aquí:
+
+    uvicorn app_async:app --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time as hora_dia, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from functools import wraps
+from uuid import UUID
+
+import aiomysql
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from conexion_async import conexion_bd_async, iniciar_pool, cerrar_pool
+from modelos import registro, precargar_ml
+from cache_respuestas import CACHE_TTL_ZONAS, CACHE_TTL_DELEGACIONES, CACHE_TTL_AGREGADOS, CACHE_TTL_PRONOSTICO
+from verificacion_indices import verificar_planes_al_iniciar
+from resumen_diario import ER_NO_SUCH_TABLE
+from prediccion import (
+    obtener_prediccion, calcular_pronostico, obtener_predicciones_lote, serializar_lote, ErrorPrediccion
+)
+from metricas import metricas, iniciar_peticion, terminar_peticion, tramo
+from consultas import (
+    ZONAS_RIESGO_RESUMEN, ZONAS_RIESGO_INCIDENTES, interpretar_fecha, consulta_incidentes,
+    leer_paginacion, leer_paginacion_filas, paginar_filas, cortar_pagina, formato_streaming,
+    leer_agregacion, consulta_agregados, armar_agregados, leer_pronostico, leer_prediccion_lote
+)
+
+# Mismos orígenes que app.py (frontend en Vercel)
+ORIGENES_PERMITIDOS = [
+    "https://prvzu.vercel.app",
+    "https://prvzu-git-master-diego-ivans-projects-6ce116bc.vercel.app",
+    "https://prvzu-tcagwng99-diego-ivans-projects-6ce116bc.vercel.app"
+]
+
+# Filas por bloque al transmitir respuestas grandes
+STREAM_CHUNK = int(os.getenv("STREAM_CHUNK", 500))
+
+# Hilos para la inferencia de modelos (y el acceso síncrono a la cache de predicciones)
+ASYNC_INFERENCIA_WORKERS = int(os.getenv("ASYNC_INFERENCIA_WORKERS", 4))
+
+ejecutor_inferencia = ThreadPoolExecutor(max_workers=ASYNC_INFERENCIA_WORKERS, thread_name_prefix="inferencia")
+
+
+# Serialización idéntica a la de jsonify en app.py: fechas en formato HTTP, Decimal como texto
+def _fecha_http(valor):
+    if not isinstance(valor, datetime):
+        valor = datetime.combine(valor, hora_dia())
+    if valor.tzinfo is None:
+        valor = valor.replace(tzinfo=timezone.utc)
+    return format_datetime(valor.astimezone(timezone.utc), usegmt=True)
+
+
+def _por_defecto(valor):
+    if isinstance(valor, date):
+        return _fecha_http(valor)
+    if isinstance(valor, (Decimal, UUID)):
+        return str(valor)
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
+
+
+def a_json(datos, fin="\n"):
+    return json.dumps(datos, default=_por_defecto, sort_keys=True, separators=(",", ":")) + fin
+
+
+def respuesta_json(datos, status=200):
+    with tramo("serializacion"):
+        cuerpo = a_json(datos)
+    return Response(cuerpo, status_code=status, media_type="application/json")
+
+
+def error_json(mensaje, status):
+    return respuesta_json({"error": mensaje}, status)
+
+
+def _entero(valor, por_defecto=None):
+    # Igual que request.args.get(..., type=int) de Flask: el valor por defecto si no es un entero
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return por_defecto
+
+
+EntradaCache = namedtuple("EntradaCache", ["cuerpo", "media_type", "etag", "expira"])
+
+
+class CacheAsync:
+    """
+    Versión para el bucle de eventos de CacheRespuestas (cache_respuestas.py):
+    respuestas con tiempo de vida y una sola consulta por clave aunque fallen
+    varias peticiones a la vez. Las escrituras ocurren en app.py, así que aquí
+    las entradas solo se renuevan al expirar el TTL.
+    """
+
+    def __init__(self):
+        self._entradas = {}
+        self._en_vuelo = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    async def obtener_o_calcular(self, clave, ttl, calcular):
+        while True:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada.expira > time.monotonic():
+                self.aciertos += 1
+                return entrada, None
+            en_vuelo = self._en_vuelo.get(clave)
+            if en_vuelo is None:
+                break
+            # Otra petición ya está calculando esta clave: esperar y volver a mirar
+            await asyncio.shield(en_vuelo)
+
+        self.fallos += 1
+        en_vuelo = self._en_vuelo[clave] = asyncio.get_running_loop().create_future()
+        try:
+            respuesta = await calcular()
+            entrada = None
+            if respuesta.status_code == 200:
+                entrada = self._entradas[clave] = EntradaCache(
+                    respuesta.body,
+                    respuesta.media_type,
+                    '"' + hashlib.sha1(respuesta.body).hexdigest() + '"',
+                    time.monotonic() + ttl,
+                )
+            return entrada, respuesta
+        finally:
+            del self._en_vuelo[clave]
+            en_vuelo.set_result(None)
+
+
+cache_async = CacheAsync()
+
+
+def cacheado_async(ttl):
+    """Decorador para rutas GET: cachea la respuesta por ruta y parámetros de consulta."""
+    def decorador(vista):
+        @wraps(vista)
+        async def envoltura(request):
+            clave = request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+            entrada, respuesta = await cache_async.obtener_o_calcular(clave, ttl, lambda: vista(request))
+            if entrada is None:
+                # Errores y respuestas no cacheables se devuelven tal cual
+                return respuesta
+            cabeceras = {"ETag": entrada.etag, "Cache-Control": f"public, max-age={ttl}, must-revalidate"}
+            if entrada.etag in request.headers.get("If-None-Match", ""):
+                return Response(status_code=304, headers=cabeceras)
+            return Response(entrada.cuerpo, media_type=entrada.media_type, headers=cabeceras)
+        return envoltura
+    return decorador
+
+
+# aiomysql (PyMySQL) sustituye los parámetros con el operador %, así que los % literales de las
+# consultas compartidas con app.py (p. ej. TIME_FORMAT(..., '%H:%i')) deben ir duplicados
+def _sql(query):
+    return query.replace("%", "%%").replace("%%s", "%s")
+
+
+# Ejecutar una consulta y leer todas las filas como diccionarios
+async def consultar(query, parametros=()):
+    async with conexion_bd_async() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(_sql(query), parametros)
+            return list(await cursor.fetchall())
+
+
+# Último conjunto de resultados de un procedimiento almacenado (como stored_results() en app.py)
+async def consultar_procedimiento(query, parametros=()):
+    async with conexion_bd_async() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(_sql(query), parametros)
+            filas = []
+            while True:
+                if cursor.description:
+                    filas = list(await cursor.fetchall())
+                if not await cursor.nextset():
+                    return filas
+
+
+@cacheado_async(CACHE_TTL_ZONAS)
+async def get_zonas_riesgo(request):
+    try:
+        try:
+            zonas_riesgo = await consultar(ZONAS_RIESGO_RESUMEN)
+        except aiomysql.ProgrammingError as e:
+            if e.args[0] != ER_NO_SUCH_TABLE:
+                raise
+            # Sin la migración sql/002 se calcula directamente sobre incidentes
+            zonas_riesgo = await consultar(ZONAS_RIESGO_INCIDENTES)
+    except aiomysql.Error as e:
+        return error_json(f"Error en la consulta: {str(e)}", 500)
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    return respuesta_json(zonas_riesgo)
+
+
+async def get_estimaciones_riesgo(request):
+    delegacion_id = _entero(request.query_params.get('delegacion_id'))
+    dias = _entero(request.query_params.get('dias'), 7)
+
+    try:
+        estimaciones_riesgo = await consultar_procedimiento(
+            "CALL obtener_predicciones(%s, %s)", (delegacion_id, dias)
+        )
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    return respuesta_json(estimaciones_riesgo)
+
+
+@cacheado_async(CACHE_TTL_DELEGACIONES)
+async def obtener_lista_delegaciones(request):
+    try:
+        delegaciones = await consultar("SELECT * FROM v_lista_delegaciones")
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    return respuesta_json(delegaciones)
+
+
+async def obtener_incidentes(request):
+    args = request.query_params
+    delegacion_id = args.get("delegacion_id")
+    periodo = args.get("periodo", "day")
+
+    if not delegacion_id:
+        return error_json("Falta el parámetro 'delegacion_id'", 400)
+
+    fecha, fecha_consulta, error_fecha = interpretar_fecha(periodo, args.get("fecha"))
+    if error_fecha:
+        return error_json(error_fecha, 400)
+
+    # Generar predicción si la fecha es futura (inferencia en el pool de hilos)
+    if fecha_consulta and fecha_consulta > datetime.now():
+        try:
+            # copy_context: las etapas medidas en el hilo se atribuyen a esta petición
+            payload = await asyncio.get_running_loop().run_in_executor(
+                ejecutor_inferencia, contextvars.copy_context().run, obtener_prediccion, delegacion_id, fecha, periodo
+            )
+        except ErrorPrediccion as e:
+            return error_json(e.mensaje, e.status)
+        return Response(payload, media_type="application/json")
+
+    # Paginación opcional por keyset (?limit=N&cursor=...)
+    pagina, error_pagina = leer_paginacion(args)
+    if error_pagina:
+        return error_json(error_pagina, 400)
+
+    consulta = consulta_incidentes(delegacion_id, periodo, fecha, fecha_consulta, pagina)
+    if consulta is None:
+        return error_json("Periodo inválido. Usa 'day', 'week' o 'month'", 400)
+    query, parametros = consulta
+
+    # Modo streaming opcional para rangos grandes (?stream=1, ?stream=ndjson o Accept: application/x-ndjson)
+    formato_stream = None if pagina else formato_streaming(args, request.headers)
+    if formato_stream:
+        return respuesta_streaming(query, parametros, formato_stream)
+
+    try:
+        incidentes = await consultar(query, parametros)
+    except aiomysql.Error as e:
+        return error_json(f"Error en la consulta: {str(e)}", 500)
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    if pagina:
+        return respuesta_json(cortar_pagina(incidentes, pagina[1]))
+    return respuesta_json(incidentes)
+
+
+# Transmitir las filas en bloques desde un cursor sin buffer (SSDictCursor), como respuesta_streaming en app.py
+# Si el cliente se desconecta, el generador se cancela y la conexión se cierra con las filas pendientes
+def respuesta_streaming(query, parametros, formato):
+    async def generar():
+        async with conexion_bd_async() as conn:
+            async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+                await cursor.execute(_sql(query), parametros)
+                primero = True
+                if formato == "json":
+                    yield "["
+                while True:
+                    filas = await cursor.fetchmany(STREAM_CHUNK)
+                    if not filas:
+                        break
+                    if formato == "ndjson":
+                        yield "".join(a_json(fila) for fila in filas)
+                    else:
+                        bloque = ",".join(a_json(fila, fin="") for fila in filas)
+                        yield bloque if primero else "," + bloque
+                    primero = False
+                if formato == "json":
+                    yield "]\n"
+
+    media_type = "application/x-ndjson" if formato == "ndjson" else "application/json"
+    return StreamingResponse(generar(), media_type=media_type)
+
+
+async def obtener_estadisticas_historicas(request):
+    args = request.query_params
+    delegacion_id = args.get("delegacion_id")
+    dias = args.get("dias", 30)
+
+    if not delegacion_id:
+        return error_json("Falta el parámetro 'delegacion_id'", 400)
+
+    # Con ?limit=N&cursor=... se pagina la salida del procedimiento (ordenada por sus columnas)
+    pagina, error_pagina = leer_paginacion_filas(args)
+    if error_pagina:
+        return error_json(error_pagina, 400)
+
+    try:
+        data = await consultar_procedimiento("CALL obtener_estadisticas_historicas(%s, %s)", (delegacion_id, dias))
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    if pagina:
+        return respuesta_json(paginar_filas(data, pagina))
+    return respuesta_json(data)
+
+
+@cacheado_async(CACHE_TTL_AGREGADOS)
+async def obtener_agregados(request):
+    parametros, error = leer_agregacion(request.query_params)
+    if error:
+        return error_json(error, 400)
+
+    try:
+        filas = await consultar(*consulta_agregados(**parametros))
+    except aiomysql.Error as e:
+        return error_json(f"Error en la consulta: {str(e)}", 500)
+    except Exception:
+        return error_json("No se pudo conectar a la base de datos", 500)
+
+    return respuesta_json(armar_agregados(parametros, filas))
+
+
+async def obtener_predicciones_por_lote(request):
+    parametros, error = leer_prediccion_lote(request.query_params)
+    if error:
+        return error_json(error, 400)
+
+    try:
+        payloads, errores = await asyncio.get_running_loop().run_in_executor(
+            ejecutor_inferencia, contextvars.copy_context().run, lambda: obtener_predicciones_lote(**parametros)
+        )
+    except ErrorPrediccion as e:
+        return error_json(e.mensaje, e.status)
+    return Response(serializar_lote(parametros["fecha_base"], parametros["periodo"], payloads, errores),
+                    media_type="application/json")
+
+
+@cacheado_async(CACHE_TTL_PRONOSTICO)
+async def obtener_pronostico(request):
+    parametros, error = leer_pronostico(request.query_params)
+    if error:
+        return error_json(error, 400)
+
+    try:
+        pronostico = await asyncio.get_running_loop().run_in_executor(
+            ejecutor_inferencia, contextvars.copy_context().run, lambda: calcular_pronostico(**parametros)
+        )
+    except ErrorPrediccion as e:
+        return error_json(e.mensaje, e.status)
+    return respuesta_json(pronostico)
+
+
+async def exportar_metricas(request):
+    return Response(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
+async def home(request):
+    return PlainTextResponse("🔥 El servidor asíncrono está corriendo correctamente (rutas de lectura).")
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    await iniciar_pool()
+    # Importar las bibliotecas de ML al arrancar en lugar de en la primera predicción (opcional)
+    if os.getenv("PRECARGAR_ML", "0") == "1":
+        await asyncio.get_running_loop().run_in_executor(ejecutor_inferencia, precargar_ml)
+    # Precargar en memoria los modelos existentes al arrancar (opcional)
+    if os.getenv("PRECARGAR_MODELOS", "0") == "1":
+        await asyncio.get_running_loop().run_in_executor(ejecutor_inferencia, registro.precargar)
+    verificar_planes_al_iniciar()
+    yield
+    await cerrar_pool()
+    ejecutor_inferencia.shutdown(wait=False)
+
+
+rutas = [
+    Route("/api/zonas_riesgo", get_zonas_riesgo, methods=["GET"]),
+    Route("/api/estimaciones_riesgo", get_estimaciones_riesgo, methods=["GET"]),
+    Route("/delegaciones", obtener_lista_delegaciones, methods=["GET"]),
+    Route("/incidentes", obtener_incidentes, methods=["GET"]),
+    Route("/estadisticas_historicas", obtener_estadisticas_historicas, methods=["GET"]),
+    Route("/agregados", obtener_agregados, methods=["GET"]),
+    Route("/pronostico", obtener_pronostico, methods=["GET"]),
+    Route("/predicciones/lote", obtener_predicciones_por_lote, methods=["GET"]),
+    Route("/metrics", exportar_metricas, methods=["GET"]),
+    Route("/", home),
+]
+RUTAS_CONOCIDAS = {ruta.path for ruta in rutas}
+
+
+# Duración de cada petición por ruta (las rutas desconocidas se agrupan para acotar las series)
+async def medir_peticion(request, call_next):
+    ruta = request.url.path if request.url.path in RUTAS_CONOCIDAS else "no_encontrada"
+    iniciar_peticion(ruta, request.method)
+    respuesta = await call_next(request)
+    terminar_peticion(respuesta.status_code)
+    return respuesta
+
+
+app = Starlette(
+    routes=rutas,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=ORIGENES_PERMITIDOS, allow_methods=["GET"], allow_headers=["*"]),
+        Middleware(BaseHTTPMiddleware, dispatch=medir_peticion),
+    ],
+    lifespan=ciclo_de_vida,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("PORT", 5000))
+    uvicorn.run(app, host="0.0.0.0", port=port)
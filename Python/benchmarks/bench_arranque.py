@@ -0,0 +1,143 @@
+"""
+Tiempo de arranque y memoria de un worker de app.py, en procesos nuevos:
+
+  - lectura: arranque por defecto; importa la app y atiende las rutas de solo
+    lectura. pandas, numpy y scikit-learn no deberían llegar a importarse.
+  - precargado: con PRECARGAR_ML=1, como un maestro que importa la pila de ML
+    antes del fork.
+
+Para cada modo se mide el tiempo de `import app`, el RSS tras importar y tras
+las peticiones, y qué bibliotecas de ML quedaron cargadas. Además se ejecuta
+`python -X importtime` y se reporta el tiempo de importación por paquete.
+
+Sin base de datos las rutas responden con error, pero igualmente muestran qué
+módulos cargan; con una base sembrada (sembrar_mysql.py) se mide el caso real.
+
+    python benchmarks/bench_arranque.py --repeticiones 5 --json arranque.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+
+import comun
+
+MODULOS_ML = ["numpy", "pandas", "scipy", "sklearn", "joblib"]
+
+# Se ejecuta en un proceso nuevo con el directorio Python/ como directorio de trabajo
+SONDA = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter() - inicio
+
+def rss_mb():
+    with open("/proc/self/status") as file:
+        for linea in file:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) / 1024
+    return None
+
+def ml():
+    return sorted(m for m in {modulos!r} if m in sys.modules)
+
+resultado = {{"import_ms": importado * 1000, "rss_importado_mb": rss_mb(), "ml_importado": ml()}}
+cliente = app.app.test_client()
+inicio = time.perf_counter()
+for ruta in {rutas!r}:
+    cliente.get(ruta)
+resultado["peticiones_ms"] = (time.perf_counter() - inicio) * 1000
+resultado["rss_peticiones_mb"] = rss_mb()
+resultado["ml_peticiones"] = ml()
+print("RESULTADO " + json.dumps(resultado))
+"""
+
+
+def rutas_lectura():
+    pasado = (date.today() - timedelta(days=10)).isoformat()
+    return [
+        "/",
+        "/delegaciones",
+        "/api/zonas_riesgo",
+        f"/incidentes?delegacion_id=1&fecha={pasado}&periodo=day",
+        "/estadisticas_historicas?delegacion_id=1&dias=30",
+        "/agregados?delegacion_id=1&agrupar=hora",
+        "/metrics",
+    ]
+
+
+def entorno(precargar_ml):
+    env = dict(os.environ, VERIFICAR_INDICES="0", PRECARGAR_MODELOS="0")
+    env["PRECARGAR_ML"] = "1" if precargar_ml else "0"
+    return env
+
+
+def ejecutar_sonda(precargar_ml, rutas):
+    codigo = SONDA.format(modulos=MODULOS_ML, rutas=rutas)
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=comun.RAIZ, env=entorno(precargar_ml),
+                            capture_output=True, text=True, check=True).stdout
+    linea = next(linea for linea in salida.splitlines() if linea.startswith("RESULTADO "))
+    return json.loads(linea[len("RESULTADO "):])
+
+
+# Tiempo propio de importación (ms) agregado por paquete de primer nivel, según -X importtime
+def tiempos_por_paquete(precargar_ml):
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=comun.RAIZ,
+                            env=entorno(precargar_ml), capture_output=True, text=True, check=True).stderr
+    por_paquete = defaultdict(float)
+    total = 0.0
+    for linea in stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, _, nombre = linea[len("import time:"):].split("|")
+        por_paquete[nombre.strip().split(".")[0]] += int(propio) / 1000
+        if nombre.strip() == "app":
+            total = int(_.strip()) / 1000
+    return total, dict(sorted(por_paquete.items(), key=lambda par: -par[1]))
+
+
+def medir_modo(precargar_ml, repeticiones, rutas, paquetes):
+    muestras = [ejecutar_sonda(precargar_ml, rutas) for _ in range(repeticiones)]
+    mediana = lambda clave: round(statistics.median(m[clave] for m in muestras), 1)  # noqa: E731
+    total, por_paquete = tiempos_por_paquete(precargar_ml)
+    return {
+        "import_ms": mediana("import_ms"),
+        "import_max_ms": round(max(m["import_ms"] for m in muestras), 1),
+        "rss_importado_mb": mediana("rss_importado_mb"),
+        "rss_peticiones_mb": mediana("rss_peticiones_mb"),
+        "peticiones_lectura_ms": mediana("peticiones_ms"),
+        "ml_tras_importar": muestras[-1]["ml_importado"],
+        "ml_tras_peticiones": muestras[-1]["ml_peticiones"],
+        "importtime_app_ms": round(total, 1),
+        "importtime_paquetes_ms": {k: round(v, 1) for k, v in list(por_paquete.items())[:paquetes]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--paquetes", type=int, default=12, help="paquetes más lentos que se reportan")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    rutas = rutas_lectura()
+    resultados = {}
+    for modo, precargar_ml in (("lectura", False), ("precargado", True)):
+        r = resultados[modo] = medir_modo(precargar_ml, args.repeticiones, rutas, args.paquetes)
+        print(f"  {modo:<10}: import app {r['import_ms']:8.1f} ms | RSS {r['rss_importado_mb']:6.1f} MB"
+              f" → {r['rss_peticiones_mb']:6.1f} MB tras {len(rutas)} rutas de lectura"
+              f" | ML cargado: {', '.join(r['ml_tras_peticiones']) or 'nada'}")
+        for paquete, ms in r["importtime_paquetes_ms"].items():
+            print(f"      {paquete:<24} {ms:8.1f} ms")
+
+    if args.json:
+        ruta = args.json if os.path.isabs(args.json) else os.path.join(comun.RAIZ, args.json)
+        comun.guardar_resultados(ruta, "arranque", {k: v for k, v in vars(args).items() if k != "json"}, resultados)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
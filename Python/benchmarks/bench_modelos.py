@@ -0,0 +1,110 @@
+"""
+Micro-benchmarks de entrenamiento e inferencia contra una base sembrada con
+sembrar_mysql.py:
+
+  - entrenar_modelo: reentrenamiento completo por delegación.
+  - actualizar_modelo: actualización incremental sin incidentes nuevos (solo la consulta de la marca de agua).
+  - calcular_prediccion: predicción de un periodo futuro sin cache (consultas + muestreo + inferencia);
+    es lo que antes hacía generar_prediccion_incidentes en app.py.
+  - obtener_prediccion en caliente: respuesta desde la cache de predicciones.
+  - generar_predicciones: solo muestreo e inferencia, sin base de datos.
+
+Los modelos se escriben en una carpeta temporal, no en models/.
+
+    python benchmarks/bench_modelos.py --delegaciones 1 2 3 --repeticiones 5 --json modelos.json
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import comun
+
+# modelos.py fija MODELS_DIR al importarse a partir del directorio de trabajo
+os.chdir(tempfile.mkdtemp(prefix="bench_modelos_"))
+
+from modelos import registro  # noqa: E402
+from entrenamiento import entrenar_modelo, actualizar_modelo  # noqa: E402
+from prediccion import calcular_prediccion, obtener_prediccion, generar_predicciones  # noqa: E402
+
+
+def medir(funcion, repeticiones, *args):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "min_ms": round(min(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+    }
+
+
+def fechas_futuras():
+    hoy = date.today()
+    siguiente_mes = (hoy.replace(day=1) + timedelta(days=32)).strftime("%Y-%m")
+    return {
+        "day": (hoy + timedelta(days=1)).isoformat(),
+        "week": (hoy + timedelta(days=7 - hoy.weekday())).isoformat(),
+        "month": siguiente_mes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delegaciones", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--repeticiones", type=int, default=5, help="repeticiones de entrenamiento")
+    parser.add_argument("--repeticiones-inferencia", type=int, default=50)
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    fechas = fechas_futuras()
+    resultados = {}
+    for delegacion_id in args.delegaciones:
+        r = {}
+        r["entrenar_modelo"] = medir(entrenar_modelo, args.repeticiones, delegacion_id)
+        artefactos = registro.obtener(delegacion_id)
+        if artefactos.model_data is None:
+            print(f"⚠️ Delegación {delegacion_id} sin modelo (¿datos insuficientes?), se omite")
+            continue
+        r["columnas_modelo"] = len(artefactos.model_data["columns"])
+        r["actualizar_modelo_sin_cambios"] = medir(actualizar_modelo, args.repeticiones, delegacion_id)
+
+        riesgo_map = {
+            1: {"id": 1, "nombre": "Alto", "codigo_color": "danger"},
+            2: {"id": 2, "nombre": "Medio", "codigo_color": "warning"},
+            3: {"id": 3, "nombre": "Bajo", "codigo_color": "success"},
+        }
+        ubicaciones = [{"ubicacion": u} for u in artefactos.ubicaciones]
+        for periodo, fecha in fechas.items():
+            r[f"calcular_prediccion_{periodo}"] = medir(
+                calcular_prediccion, args.repeticiones_inferencia, delegacion_id, fecha, periodo
+            )
+            obtener_prediccion(delegacion_id, fecha, periodo)
+            r[f"prediccion_cacheada_{periodo}"] = medir(
+                obtener_prediccion, args.repeticiones_inferencia, delegacion_id, fecha, periodo
+            )
+            r[f"generar_predicciones_{periodo}"] = medir(
+                generar_predicciones, args.repeticiones_inferencia, fecha, periodo, artefactos.tipos,
+                ubicaciones, riesgo_map, artefactos.model_data, 0
+            )
+        resultados[str(delegacion_id)] = r
+        print(f"  delegación {delegacion_id:>4}: entrenar {r['entrenar_modelo']['mediana_ms']:9.1f} ms"
+              f" | incremental {r['actualizar_modelo_sin_cambios']['mediana_ms']:7.1f} ms"
+              f" | predicción mes {r['calcular_prediccion_month']['mediana_ms']:7.1f} ms"
+              f" (cache {r['prediccion_cacheada_month']['mediana_ms']:.2f} ms)")
+
+    resultados["rss_pico_mb"] = round(comun.rss_pico_propio() / 2**20, 1)
+    print(f"     RSS máximo del proceso: {resultados['rss_pico_mb']} MB")
+
+    if args.json:
+        ruta = args.json if os.path.isabs(args.json) else os.path.join(comun.RAIZ, args.json)
+        comun.guardar_resultados(ruta, "modelos", {k: v for k, v in vars(args).items() if k != "json"}, resultados)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Benchmark de generación de predicciones: implementación anterior (un
+DataFrame y un model.predict por incidente) frente a la actual (muestreo del
+periodo completo, matriz NumPy y una sola predicción por lote).
+
+También mide /pronostico (MotorSimulacion.pronostico) con un número creciente
+de escenarios: el modelo solo evalúa las combinaciones distintas, así que el
+costo crece mucho más despacio que los escenarios.
+
+No necesita base de datos: entrena un RandomForest con datos sintéticos.
+
+Uso (desde la carpeta Python/):
+    python benchmarks/bench_prediccion.py [--repeticiones 20] [--json resultados.json]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+import comun
+import prediccion  # noqa: E402
+from simulacion import PESOS_HORA_POR_DEFECTO, INCIDENTES_POR_DIA, MotorSimulacion, dias_del_periodo
+
+TIPOS = ["Asalto a transeúnte", "Robo de vehículo", "Asalto a negocio", "Robo a casa habitación",
+         "Asalto con violencia", "Vandalismo", "Riña", "Robo a transporte público"]
+RIESGO_MAP = {
+    1: {"id": 1, "nombre": "Alto", "codigo_color": "danger"},
+    2: {"id": 2, "nombre": "Medio", "codigo_color": "warning"},
+    3: {"id": 3, "nombre": "Bajo", "codigo_color": "success"},
+}
+
+
+def datos_sinteticos(filas, num_ubicaciones, semilla=42):
+    rnd = random.Random(semilla)
+    ubicaciones = [f"Calle {i}" for i in range(num_ubicaciones)]
+    datos = [
+        {
+            "hora": rnd.randint(0, 23),
+            "dia_semana": rnd.randint(1, 7),
+            "mes": rnd.randint(1, 12),
+            "tipo": rnd.choice(TIPOS),
+            "ubicacion": rnd.choice(ubicaciones),
+            "nivel_riesgo_id": rnd.choice(list(RIESGO_MAP)),
+        }
+        for _ in range(filas)
+    ]
+    return datos, ubicaciones
+
+
+def entrenar_sintetico(datos):
+    df_encoded = pd.get_dummies(pd.DataFrame(datos), columns=["tipo", "ubicacion"])
+    X = df_encoded.drop("nivel_riesgo_id", axis=1)
+    model = RandomForestClassifier(n_estimators=100)
+    model.fit(X, df_encoded["nivel_riesgo_id"])
+    return {"model": model, "columns": X.columns.tolist()}
+
+
+# --- Implementación anterior, copiada como referencia ---------------------------
+
+def _incidente_por_fila(fecha, tipos_incidentes, ubicaciones, riesgo_map, model_data):
+    tipos = list(tipos_incidentes.keys())
+    pesos = list(tipos_incidentes.values())
+    selected_tipo = random.choices(tipos, weights=pesos)[0]
+    selected_ubicacion = random.choice(ubicaciones)["ubicacion"]
+    hour = random.choices(range(24), weights=PESOS_HORA_POR_DEFECTO)[0]
+    minute = random.randint(0, 59)
+
+    model = model_data["model"]
+    columns = model_data["columns"]
+    df_pred = pd.DataFrame({"hora": [hour], "dia_semana": [fecha.weekday() + 1], "mes": [fecha.month]})
+    for col in columns:
+        if col.startswith("tipo_"):
+            df_pred[col] = 1 if col.replace("tipo_", "") == selected_tipo else 0
+        elif col.startswith("ubicacion_"):
+            df_pred[col] = 1 if col.replace("ubicacion_", "") == selected_ubicacion else 0
+        elif col not in df_pred.columns:
+            df_pred[col] = 0
+    df_pred = df_pred[columns]
+    nivel_riesgo = riesgo_map.get(model.predict(df_pred)[0]) or random.choice(list(riesgo_map.values()))
+
+    return {
+        "id": f"pred-{random.randint(10000, 99999)}",
+        "tipo": selected_tipo,
+        "ubicacion": selected_ubicacion,
+        "hora": f"{hour:02d}:{minute:02d}",
+        "riesgo": nivel_riesgo["nombre"],
+        "codigo_color": nivel_riesgo["codigo_color"],
+        "fecha": fecha.strftime("%Y-%m-%d"),
+        "es_prediccion": True,
+    }
+
+
+def predicciones_por_fila(fecha_base, periodo, tipos_incidentes, ubicaciones, riesgo_map, model_data):
+    predicciones = []
+    for fecha_dia in dias_del_periodo(fecha_base, periodo):
+        for _ in range(random.randint(*INCIDENTES_POR_DIA[periodo])):
+            predicciones.append(_incidente_por_fila(fecha_dia, tipos_incidentes, ubicaciones, riesgo_map, model_data))
+    predicciones.sort(key=lambda x: (x["fecha"], x["hora"]))
+    return predicciones
+
+# ---------------------------------------------------------------------------------
+
+
+def medir(funcion, repeticiones, *args):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "min_ms": round(min(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--filas", type=int, default=1000, help="filas de entrenamiento sintéticas")
+    parser.add_argument("--ubicaciones", type=int, default=50, help="ubicaciones distintas (columnas dummy)")
+    parser.add_argument("--escenarios", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="escenarios del pronóstico mensual")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    datos, nombres_ubicacion = datos_sinteticos(args.filas, args.ubicaciones)
+    model_data = entrenar_sintetico(datos)
+    tipos_incidentes = {tipo: random.randint(1, 20) for tipo in TIPOS}
+    ubicaciones = [{"ubicacion": u} for u in nombres_ubicacion]
+
+    futuro = datetime.now() + timedelta(days=60)
+    fechas = {"day": futuro.strftime("%Y-%m-%d"), "week": futuro.strftime("%Y-%m-%d"), "month": futuro.strftime("%Y-%m")}
+
+    resultados = {}
+    for periodo, fecha in fechas.items():
+        parametros = (fecha, periodo, tipos_incidentes, ubicaciones, RIESGO_MAP, model_data)
+        antes = medir(predicciones_por_fila, args.repeticiones, *parametros)
+        despues = medir(prediccion.generar_predicciones, args.repeticiones, *parametros)
+        resultados[periodo] = {
+            "por_fila": antes,
+            "por_lote": despues,
+            "aceleracion": round(antes["mediana_ms"] / despues["mediana_ms"], 1) if despues["mediana_ms"] else None,
+        }
+        print(f"{periodo:>6}: por fila {antes['mediana_ms']:9.2f} ms | por lote {despues['mediana_ms']:8.2f} ms"
+              f" | x{resultados[periodo]['aceleracion']}")
+
+    import numpy as np
+    motor = MotorSimulacion(tipos_incidentes, ubicaciones, RIESGO_MAP, model_data)
+    resultados["pronostico_month"] = {}
+    for escenarios in args.escenarios:
+        r = resultados["pronostico_month"][str(escenarios)] = medir(
+            lambda: motor.pronostico(fechas["month"], "month", np.random.default_rng(0), escenarios),
+            max(1, args.repeticiones // 4),
+        )
+        print(f"pronóstico month, {escenarios:>5} escenarios: {r['mediana_ms']:9.2f} ms")
+
+    if args.json:
+        parametros = dict(vars(args), columnas_modelo=len(model_data["columns"]))
+        parametros.pop("json")
+        comun.guardar_resultados(args.json, "prediccion", parametros, resultados)
+
+
+if __name__ == "__main__":
+    main()
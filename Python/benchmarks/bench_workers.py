@@ -0,0 +1,157 @@
+"""
+Memoria de gunicorn según el número de workers, con y sin modelos compartidos
+(MODELOS_COMPARTIDOS en gunicorn.conf.py):
+
+  - independiente: cada worker importa la app y carga su propia copia de los
+    modelos (PRECARGAR_MODELOS=1 sin preload_app).
+  - compartido: el maestro los carga una vez antes del fork.
+
+Entrena modelos sintéticos en una carpeta temporal (no hace falta base de
+datos), arranca gunicorn con cada configuración y suma la PSS (memoria
+proporcional: las páginas compartidas se reparten entre los procesos que las
+usan) de todo el árbol de procesos. Solo Linux.
+
+    python benchmarks/bench_workers.py --delegaciones 16 --workers 1 2 4 --json workers.json
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import comun
+from carga_http import esperar_servidor
+
+# modelos.py fija MODELS_DIR al importarse a partir del directorio de trabajo
+CARPETA = tempfile.mkdtemp(prefix="bench_workers_")
+os.chdir(CARPETA)
+
+from modelos import guardar_artefacto  # noqa: E402
+
+
+def sembrar_modelos(delegaciones, filas, arboles, semilla=42):
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    from codificador import CodificadorIncidentes
+
+    rnd = random.Random(semilla)
+    for delegacion_id in range(1, delegaciones + 1):
+        tipos = [f"Tipo {i}" for i in range(12)]
+        ubicaciones = [f"Calle {i}, Delegación {delegacion_id}" for i in range(80)]
+        df = pd.DataFrame({
+            "hora": [rnd.randrange(24) for _ in range(filas)],
+            "dia_semana": [rnd.randint(1, 7) for _ in range(filas)],
+            "mes": [rnd.randint(1, 12) for _ in range(filas)],
+            "tipo": [rnd.choice(tipos) for _ in range(filas)],
+            "ubicacion": [rnd.choice(ubicaciones) for _ in range(filas)],
+            "nivel_riesgo_id": [rnd.randint(1, 3) for _ in range(filas)],
+        })
+        codificador = CodificadorIncidentes().ajustar(df)
+        model = RandomForestClassifier(n_estimators=arboles, random_state=semilla)
+        model.fit(codificador.transformar(df), df["nivel_riesgo_id"].to_numpy())
+        model_data = {
+            "model": model,
+            "columns": codificador.columns,
+            "codificador": codificador,
+            "watermark": filas,
+            "entrenado_en": "2024-01-01T00:00:00",
+            "actualizaciones_incrementales": 0,
+            "version": f"bench-{delegacion_id}",
+        }
+        guardar_artefacto(delegacion_id, model_data, {t: 1 for t in tipos}, {u: 1 for u in ubicaciones})
+
+
+def _smaps(pid):
+    valores = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for linea in file:
+                partes = linea.split()
+                if len(partes) == 3 and partes[2] == "kB":
+                    valores[partes[0].rstrip(":")] = int(partes[1]) / 1024
+    except OSError:
+        pass
+    return valores
+
+
+def memoria_arbol(pid):
+    procesos = [_smaps(p) for p in comun.procesos_del_arbol(pid)]
+    procesos = [p for p in procesos if p]
+    return {
+        "procesos": len(procesos),
+        "pss_total_mb": round(sum(p.get("Pss", 0) for p in procesos), 1),
+        "rss_total_mb": round(sum(p.get("Rss", 0) for p in procesos), 1),
+        "privada_max_mb": round(max(p.get("Private_Clean", 0) + p.get("Private_Dirty", 0) for p in procesos), 1),
+    }
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir(compartido, workers, estabilizar):
+    puerto = puerto_libre()
+    env = dict(os.environ, MODELOS_COMPARTIDOS="1" if compartido else "0", WEB_CONCURRENCY=str(workers),
+               PRECARGAR_ML="1", PRECARGAR_MODELOS="1", MODEL_CACHE_MAX="auto", VERIFICAR_INDICES="0")
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(comun.RAIZ, "gunicorn.conf.py"),
+         "--chdir", CARPETA, "--pythonpath", comun.RAIZ, "--bind", f"127.0.0.1:{puerto}", "app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not esperar_servidor(f"http://127.0.0.1:{puerto}", 120):
+            raise RuntimeError("gunicorn no respondió")
+        # Esperar a que todos los workers terminen de cargar (la PSS deja de crecer)
+        anterior = None
+        while True:
+            time.sleep(estabilizar)
+            actual = memoria_arbol(servidor.pid)
+            if anterior and actual["procesos"] == workers + 1 and abs(actual["pss_total_mb"] - anterior["pss_total_mb"]) < 1:
+                return actual
+            anterior = actual
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delegaciones", type=int, default=16)
+    parser.add_argument("--filas", type=int, default=1000, help="filas de entrenamiento por modelo")
+    parser.add_argument("--arboles", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--estabilizar", type=float, default=1.0, help="segundos entre mediciones de memoria")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    sembrar_modelos(args.delegaciones, args.filas, args.arboles)
+    tamano = sum(os.path.getsize(os.path.join(CARPETA, "models", f)) for f in os.listdir(os.path.join(CARPETA, "models")))
+    print(f"     {args.delegaciones} modelos sintéticos, {tamano / 2**20:.1f} MB en disco")
+
+    resultados = {"modelos_en_disco_mb": round(tamano / 2**20, 1)}
+    for modo, compartido in (("independiente", False), ("compartido", True)):
+        r = resultados[modo] = {}
+        for workers in args.workers:
+            r[str(workers)] = medir(compartido, workers, args.estabilizar)
+            print(f"  {modo:<13} {workers:>2} workers: PSS total {r[str(workers)]['pss_total_mb']:8.1f} MB"
+                  f" | RSS total {r[str(workers)]['rss_total_mb']:8.1f} MB"
+                  f" | privada máx. {r[str(workers)]['privada_max_mb']:7.1f} MB")
+        if len(args.workers) > 1:
+            menor, mayor = min(args.workers), max(args.workers)
+            r["incremento_por_worker_mb"] = round(
+                (r[str(mayor)]["pss_total_mb"] - r[str(menor)]["pss_total_mb"]) / (mayor - menor), 1
+            )
+            print(f"  {modo:<13} memoria por worker adicional: {r['incremento_por_worker_mb']} MB")
+
+    if args.json:
+        ruta = args.json if os.path.isabs(args.json) else os.path.join(comun.RAIZ, args.json)
+        comun.guardar_resultados(ruta, "workers", {k: v for k, v in vars(args).items() if k != "json"}, resultados)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Prueba de carga de la API: recorre las rutas de app.py (o de app_async.py)
+con N clientes concurrentes y mide latencia p50/p95/p99, throughput, errores y
+memoria residente máxima del servidor.
+
+El servidor debe apuntar a una base sembrada con sembrar_mysql.py. Se puede
+usar uno ya en marcha (--url, y --pid para medir su memoria) o dejar que el
+script lo arranque y lo detenga (--comando):
+
+    python benchmarks/carga_http.py --comando "gunicorn -w 4 -b 127.0.0.1:8000 app:app" \\
+        --url http://127.0.0.1:8000 --concurrencia 32 --peticiones 500 --json carga.json
+    python benchmarks/carga_http.py --comando "uvicorn app_async:app --port 8001" \\
+        --url http://127.0.0.1:8001 --concurrencia 200 --json carga_async.json
+
+Las rutas que escriben (/retroalimentacion, /retroalimentacion/lote,
+/migrar_predicciones) solo se incluyen con --escrituras.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import comun
+
+
+# Escenarios: (nombre, método, ruta, cuerpo); las rutas con {d} rotan entre las delegaciones
+def escenarios(escrituras=False):
+    hoy = date.today()
+    pasado = hoy - timedelta(days=10)
+    inicio_mes = hoy.replace(day=1)
+    mes_pasado = (inicio_mes - timedelta(days=1)).strftime("%Y-%m")
+    mes_siguiente = (inicio_mes + timedelta(days=32)).strftime("%Y-%m")
+    manana = (hoy + timedelta(days=1)).isoformat()
+
+    lista = [
+        ("home", "GET", "/", None),
+        ("zonas_riesgo", "GET", "/api/zonas_riesgo", None),
+        ("estimaciones_riesgo", "GET", "/api/estimaciones_riesgo?delegacion_id={d}&dias=7", None),
+        ("delegaciones", "GET", "/delegaciones", None),
+        ("incidentes_dia", "GET", f"/incidentes?delegacion_id={{d}}&fecha={pasado}&periodo=day", None),
+        ("incidentes_semana", "GET", f"/incidentes?delegacion_id={{d}}&fecha={hoy - timedelta(days=30)}&periodo=week", None),
+        ("incidentes_mes", "GET", f"/incidentes?delegacion_id={{d}}&fecha={mes_pasado}&periodo=month", None),
+        ("incidentes_mes_paginado", "GET", f"/incidentes?delegacion_id={{d}}&fecha={mes_pasado}&periodo=month&limit=100", None),
+        ("incidentes_mes_stream", "GET", f"/incidentes?delegacion_id={{d}}&fecha={mes_pasado}&periodo=month&stream=ndjson", None),
+        ("prediccion_dia", "GET", f"/incidentes?delegacion_id={{d}}&fecha={manana}&periodo=day", None),
+        ("prediccion_mes", "GET", f"/incidentes?delegacion_id={{d}}&fecha={mes_siguiente}&periodo=month", None),
+        # Vista de toda la ciudad: las predicciones de todas las delegaciones en una petición
+        ("prediccion_lote_semana", "GET", f"/predicciones/lote?fecha={manana}&periodo=week", None),
+        # Bandas de percentiles con el motor Monte-Carlo (cacheadas por CACHE_TTL_PRONOSTICO)
+        ("pronostico_semana", "GET", f"/pronostico?delegacion_id={{d}}&fecha={manana}&periodo=week&escenarios=500", None),
+        ("estadisticas_historicas", "GET", "/estadisticas_historicas?delegacion_id={d}&dias=30", None),
+        ("estadisticas_paginadas", "GET", "/estadisticas_historicas?delegacion_id={d}&dias=90&limit=20", None),
+        ("agregados_anio_dia_semana", "GET", f"/agregados?delegacion_id={{d}}&agrupar=dia_semana,codigo_color&desde={hoy - timedelta(days=364)}&hasta={hoy}", None),
+        ("agregados_mes_hora", "GET", f"/agregados?delegacion_id={{d}}&agrupar=hora&desde={mes_pasado}-01&hasta={hoy}", None),
+        ("entrenamiento_lista", "GET", "/entrenamiento", None),
+        ("entrenamiento_trabajo", "GET", "/entrenamiento/inexistente", None),
+    ]
+    if escrituras:
+        lista += [
+            ("retroalimentacion", "POST", "/retroalimentacion", {
+                "incidente_id": "pred-12345", "delegacion_id": "{d}", "tipo": "Riña",
+                "ubicacion": "Calle 1, Delegación {d}", "fecha": manana, "hora": "21:30", "nivel_riesgo_id": 1,
+            }),
+            # Una semana de predicciones confirmadas en una sola llamada
+            ("retroalimentacion_lote", "POST", "/retroalimentacion/lote", [{
+                "incidente_id": f"pred-{i}", "delegacion_id": "{d}", "tipo": "Riña",
+                "ubicacion": "Calle 1, Delegación {d}", "fecha": (hoy + timedelta(days=i % 7 + 1)).isoformat(),
+                "hora": "21:30", "nivel_riesgo_id": 1,
+            } for i in range(50)]),
+            ("migrar_predicciones", "POST", "/migrar_predicciones?modo_entrenamiento=cola", None),
+        ]
+    return lista
+
+
+def _completar(valor, delegacion_id):
+    if isinstance(valor, str):
+        return valor.replace("{d}", str(delegacion_id))
+    if isinstance(valor, dict):
+        return {k: _completar(v, delegacion_id) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_completar(v, delegacion_id) for v in valor]
+    return valor
+
+
+class MuestreoMemoria(threading.Thread):
+    # Mide cada `intervalo` segundos el RSS del servidor (y sus workers) y guarda el máximo
+    def __init__(self, pid, intervalo=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo = intervalo
+        self.maximo = None
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            rss = comun.rss_arbol(self.pid)
+            if rss is not None:
+                self.maximo = max(self.maximo or 0, rss)
+            self._parar.wait(self.intervalo)
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+        return self.maximo
+
+
+def ejecutar_escenario(url, escenario, delegaciones, peticiones, concurrencia, timeout):
+    nombre, metodo, ruta, cuerpo = escenario
+    destino = urlsplit(url)
+    contador = itertools.count()
+    bloqueo = threading.Lock()
+    tiempos, estados, errores = [], Counter(), Counter()
+
+    def cliente():
+        # Una conexión persistente (keep-alive) por cliente
+        conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=timeout)
+        try:
+            while True:
+                i = next(contador)
+                if i >= peticiones:
+                    return
+                delegacion_id = delegaciones[i % len(delegaciones)]
+                datos = json.dumps(_completar(cuerpo, delegacion_id)) if cuerpo else None
+                cabeceras = {"Content-Type": "application/json"} if datos else {}
+                inicio = time.perf_counter()
+                try:
+                    conexion.request(metodo, _completar(ruta, delegacion_id), body=datos, headers=cabeceras)
+                    respuesta = conexion.getresponse()
+                    respuesta.read()
+                    duracion = (time.perf_counter() - inicio) * 1000
+                    with bloqueo:
+                        tiempos.append(duracion)
+                        estados[respuesta.status] += 1
+                except Exception as e:
+                    with bloqueo:
+                        errores[type(e).__name__] += 1
+                    conexion.close()
+                    conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=timeout)
+        finally:
+            conexion.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        for _ in range(concurrencia):
+            ejecutor.submit(cliente)
+    total_s = time.perf_counter() - inicio
+
+    fallidas = sum(n for estado, n in estados.items() if estado >= 500) + sum(errores.values())
+    return dict(
+        comun.resumen_latencias(tiempos),
+        throughput_req_s=round(len(tiempos) / total_s, 2) if total_s else None,
+        duracion_s=round(total_s, 3),
+        estados={str(k): v for k, v in sorted(estados.items())},
+        errores=dict(errores),
+        fallidas=fallidas,
+    )
+
+
+def esperar_servidor(url, timeout):
+    destino = urlsplit(url)
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=2)
+            conexion.request("GET", "/")
+            conexion.getresponse().read()
+            conexion.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--comando", help="arrancar el servidor con este comando (desde la carpeta Python/)")
+    parser.add_argument("--pid", type=int, help="pid de un servidor ya en marcha, para medir su memoria")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=300, help="peticiones por escenario")
+    parser.add_argument("--calentamiento", type=int, default=20, help="peticiones previas no medidas por escenario")
+    parser.add_argument("--delegaciones", type=int, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--escenarios", nargs="+", help="ejecutar solo estos escenarios")
+    parser.add_argument("--escrituras", action="store_true", help="incluir /retroalimentacion y /migrar_predicciones")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    servidor = None
+    pid = args.pid
+    if args.comando:
+        servidor = subprocess.Popen(shlex.split(args.comando), cwd=comun.RAIZ, env=os.environ.copy())
+        pid = servidor.pid
+        if not esperar_servidor(args.url, 60):
+            servidor.terminate()
+            parser.error("el servidor no respondió en 60 s")
+
+    lista = [e for e in escenarios(args.escrituras) if not args.escenarios or e[0] in args.escenarios]
+    resultados = {}
+    try:
+        for escenario in lista:
+            if args.calentamiento:
+                ejecutar_escenario(args.url, escenario, args.delegaciones, args.calentamiento,
+                                   min(args.concurrencia, args.calentamiento), args.timeout)
+            memoria = MuestreoMemoria(pid) if pid else None
+            if memoria:
+                memoria.start()
+            r = ejecutar_escenario(args.url, escenario, args.delegaciones, args.peticiones, args.concurrencia, args.timeout)
+            r["rss_pico_mb"] = round(memoria.detener() / 2**20, 1) if memoria and memoria.maximo else None
+            resultados[escenario[0]] = r
+            print(f"{escenario[0]:>26}: p50 {r.get('p50_ms', 0):8.2f} ms | p95 {r.get('p95_ms', 0):8.2f} ms"
+                  f" | p99 {r.get('p99_ms', 0):8.2f} ms | {r['throughput_req_s']:8.1f} req/s"
+                  f" | fallidas {r['fallidas']}" + (f" | RSS {r['rss_pico_mb']} MB" if r["rss_pico_mb"] else ""))
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    if args.json:
+        parametros = {k: v for k, v in vars(args).items() if k not in ("json", "pid")}
+        comun.guardar_resultados(args.json, "carga_http", parametros, resultados)
+
+
+if __name__ == "__main__":
+    main()
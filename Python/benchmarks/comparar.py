@@ -0,0 +1,69 @@
+"""
+Compara dos archivos de resultados de benchmarks (de dos commits) y marca las
+regresiones: latencias (*_ms) y memoria (*_mb) que suben, o throughput
+(*_req_s) que baja, más de --umbral por ciento.
+
+    python benchmarks/comparar.py base.json nuevo.json --umbral 10
+
+Termina con código 1 si hay regresiones (útil en CI).
+"""
+import argparse
+import json
+import sys
+
+
+def aplanar(datos, prefijo=""):
+    planos = {}
+    for clave, valor in datos.items():
+        ruta = f"{prefijo}.{clave}" if prefijo else str(clave)
+        if isinstance(valor, dict):
+            planos.update(aplanar(valor, ruta))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            planos[ruta] = valor
+    return planos
+
+
+# +1 si un valor mayor es peor, -1 si un valor menor es peor, None si la métrica no se compara
+def sentido(ruta):
+    metrica = ruta.rsplit(".", 1)[-1]
+    if metrica.endswith("_ms") or metrica.endswith("_mb") or metrica == "fallidas":
+        return 1
+    if metrica.endswith("_req_s"):
+        return -1
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    parser.add_argument("--umbral", type=float, default=10, help="porcentaje de cambio tolerado")
+    args = parser.parse_args()
+
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.nuevo) as file:
+        nuevo = json.load(file)
+
+    print(f"base:  {base['metadatos'].get('commit')} ({base['metadatos'].get('fecha')})")
+    print(f"nuevo: {nuevo['metadatos'].get('commit')} ({nuevo['metadatos'].get('fecha')})")
+
+    antes, despues = aplanar(base["resultados"]), aplanar(nuevo["resultados"])
+    regresiones = 0
+    for ruta in sorted(antes.keys() & despues.keys()):
+        signo = sentido(ruta)
+        if signo is None:
+            continue
+        a, d = antes[ruta], despues[ruta]
+        cambio = ((d - a) / a * 100) if a else (0 if d == a else float("inf"))
+        peor = cambio * signo > args.umbral
+        regresiones += peor
+        marca = "❌" if peor else ("✅" if cambio * signo < -args.umbral else "  ")
+        print(f"{marca} {ruta:<60} {a:>12.2f} → {d:>12.2f} ({cambio:+.1f}%)")
+
+    print(f"     {regresiones} regresiones por encima del {args.umbral}%")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Utilidades compartidas por los benchmarks: percentiles, memoria de procesos y
+guardado de resultados en JSON con los metadatos necesarios para comparar
+entre commits (ver comparar.py).
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def percentil(valores_ordenados, p):
+    # Percentil por interpolación lineal sobre una lista ya ordenada
+    if not valores_ordenados:
+        return None
+    posicion = (len(valores_ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    return valores_ordenados[inferior] + (valores_ordenados[superior] - valores_ordenados[inferior]) * (posicion - inferior)
+
+
+def resumen_latencias(tiempos_ms):
+    ordenados = sorted(tiempos_ms)
+    if not ordenados:
+        return {"n": 0}
+    return {
+        "n": len(ordenados),
+        "p50_ms": round(percentil(ordenados, 50), 3),
+        "p95_ms": round(percentil(ordenados, 95), 3),
+        "p99_ms": round(percentil(ordenados, 99), 3),
+        "media_ms": round(sum(ordenados) / len(ordenados), 3),
+        "max_ms": round(ordenados[-1], 3),
+    }
+
+
+def _leer_status(pid, campo):
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for linea in file:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def procesos_del_arbol(pid):
+    # El proceso y todos sus descendientes (p. ej. los workers de gunicorn); solo Linux
+    hijos = {}
+    for nombre in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not nombre.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nombre}/stat") as file:
+                ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        hijos.setdefault(ppid, []).append(int(nombre))
+    arbol, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        arbol.append(actual)
+        pendientes.extend(hijos.get(actual, []))
+    return arbol
+
+
+def rss_arbol(pid):
+    # Memoria residente actual (bytes) del proceso y sus descendientes
+    total = [_leer_status(p, "VmRSS") for p in procesos_del_arbol(pid)]
+    total = [t for t in total if t is not None]
+    return sum(total) if total else None
+
+
+def rss_pico_propio():
+    # Pico de memoria residente de este proceso (bytes); ru_maxrss está en KB en Linux y en bytes en macOS
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo if sys.platform == "darwin" else maximo * 1024
+
+
+def metadatos():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def guardar_resultados(ruta, tipo, parametros, resultados):
+    with open(ruta, "w") as file:
+        json.dump({
+            "tipo": tipo,
+            "metadatos": metadatos(),
+            "parametros": parametros,
+            "resultados": resultados,
+        }, file, indent=2, ensure_ascii=False, default=str)
+    print(f"     Resultados guardados en {ruta}")
@@ -0,0 +1,238 @@
+"""
+Crea en un MySQL local un esquema equivalente al de producción (delegaciones,
+niveles_riesgo, incidentes, predicciones_confirmadas, la vista
+v_lista_delegaciones, los procedimientos obtener_predicciones y
+obtener_estadisticas_historicas y las tablas de sql/) y lo llena con datos
+sintéticos del tamaño indicado. Los procedimientos son sustitutos con la misma
+firma: devuelven agregados de incidentes, no el cálculo exacto de producción.
+
+Usa las mismas variables de entorno que la API. Ejemplo con Docker:
+    docker run -d --name prvzu-bench -p 3307:3306 -e MYSQL_ROOT_PASSWORD=bench -e MYSQL_DATABASE=prvzu_bench mysql:8
+    export DATABASE_HOST=127.0.0.1 DATABASE_PORT=3307 DATABASE_USERNAME=root DATABASE_PASSWORD=bench \\
+           DATABASE=prvzu_bench DATABASE_SSL=0
+    python benchmarks/sembrar_mysql.py --recrear --delegaciones 16 --incidentes 20000
+
+Por seguridad se niega a recrear una base cuyo nombre no contenga "bench" o
+"test" (salvo con --forzar).
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import comun  # noqa: F401  (añade la carpeta Python/ al path)
+from conexion import conexion_bd
+from resumen_diario import reconstruir
+
+TIPOS = ["Asalto a transeúnte", "Robo de vehículo", "Asalto a negocio", "Robo a casa habitación",
+         "Asalto con violencia", "Vandalismo", "Riña", "Robo a transporte público", "Robo de autopartes",
+         "Fraude", "Lesiones", "Robo a cuentahabiente"]
+NIVELES = [(1, "Alto", "danger"), (2, "Medio", "warning"), (3, "Bajo", "success")]
+PESOS_HORA = [3, 2, 1, 1, 1, 2, 3, 5, 7, 6, 5, 6, 7, 6, 5, 6, 7, 8, 10, 12, 15, 13, 10, 5]
+
+TABLAS = ["predicciones_cache", "incidentes_resumen_diario", "predicciones_confirmadas", "incidentes",
+          "niveles_riesgo", "delegaciones"]
+
+ESQUEMA = [
+    """
+    CREATE TABLE delegaciones (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        nombre VARCHAR(100) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE niveles_riesgo (
+        id INT PRIMARY KEY,
+        nombre VARCHAR(50) NOT NULL,
+        codigo_color VARCHAR(20) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE incidentes (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        delegacion_id INT NOT NULL,
+        tipo VARCHAR(100) NOT NULL,
+        ubicacion VARCHAR(200) NOT NULL,
+        fecha_incidente DATE NOT NULL,
+        hora_incidente TIME NOT NULL,
+        nivel_riesgo_id INT,
+        origen VARCHAR(20) NOT NULL DEFAULT 'registro',
+        KEY idx_incidentes_delegacion_fecha_hora (delegacion_id, fecha_incidente, hora_incidente),
+        KEY idx_incidentes_delegacion_tipo (delegacion_id, tipo)
+    )
+    """,
+    """
+    CREATE TABLE predicciones_confirmadas (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        incidente_original_id VARCHAR(30) NOT NULL,
+        delegacion_id INT NOT NULL,
+        tipo VARCHAR(100) NOT NULL,
+        ubicacion VARCHAR(200) NOT NULL,
+        fecha_incidente DATE NOT NULL,
+        hora_incidente TIME NOT NULL,
+        nivel_riesgo_id INT,
+        confirmado BOOLEAN NOT NULL DEFAULT FALSE,
+        migrado BOOLEAN NOT NULL DEFAULT FALSE,
+        KEY idx_confirmadas_pendientes (confirmado, migrado, id)
+    )
+    """,
+    """
+    CREATE OR REPLACE VIEW v_lista_delegaciones AS
+    SELECT id, nombre FROM delegaciones ORDER BY nombre
+    """,
+    "DROP PROCEDURE IF EXISTS obtener_predicciones",
+    """
+    CREATE PROCEDURE obtener_predicciones(IN p_delegacion_id INT, IN p_dias INT)
+    SELECT i.delegacion_id, r.nombre AS riesgo, r.codigo_color, COUNT(*) AS total
+    FROM incidentes i
+    JOIN niveles_riesgo r ON i.nivel_riesgo_id = r.id
+    WHERE (p_delegacion_id IS NULL OR i.delegacion_id = p_delegacion_id)
+      AND i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL p_dias DAY)
+    GROUP BY i.delegacion_id, r.nombre, r.codigo_color
+    """,
+    "DROP PROCEDURE IF EXISTS obtener_estadisticas_historicas",
+    """
+    CREATE PROCEDURE obtener_estadisticas_historicas(IN p_delegacion_id INT, IN p_dias INT)
+    SELECT i.tipo, r.codigo_color, COUNT(*) AS total
+    FROM incidentes i
+    JOIN niveles_riesgo r ON i.nivel_riesgo_id = r.id
+    WHERE i.delegacion_id = p_delegacion_id
+      AND i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL p_dias DAY)
+    GROUP BY i.tipo, r.codigo_color
+    """,
+]
+
+# Migraciones del repositorio que crean tablas derivadas (y los triggers que mantienen el resumen diario)
+MIGRACIONES = ["002_resumen_diario_incidentes.sql", "003_predicciones_cache.sql"]
+
+
+# Sentencias de un archivo .sql, respetando los bloques DELIMITER como el cliente mysql
+def _sentencias_de(ruta):
+    sentencias, actual, delimitador = [], [], ";"
+    for linea in open(ruta, encoding="utf-8"):
+        limpia = linea.strip()
+        if not limpia or limpia.startswith("--"):
+            continue
+        if limpia.upper().startswith("DELIMITER "):
+            delimitador = limpia.split()[1]
+            continue
+        actual.append(linea)
+        if limpia.endswith(delimitador):
+            sentencia = "".join(actual).strip()
+            sentencias.append(sentencia[:-len(delimitador)].strip())
+            actual = []
+    if "".join(actual).strip():
+        sentencias.append("".join(actual).strip())
+    return sentencias
+
+
+def crear_esquema(cursor):
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for tabla in TABLAS:
+        cursor.execute(f"DROP TABLE IF EXISTS {tabla}")
+    for sentencia in ESQUEMA:
+        cursor.execute(sentencia)
+    for nombre in MIGRACIONES:
+        for sentencia in _sentencias_de(os.path.join(comun.RAIZ, "sql", nombre)):
+            cursor.execute(sentencia)
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+# Nivel de riesgo correlacionado con la hora y el tipo, para que el modelo tenga algo que aprender
+def _nivel(rnd, hora, tipo):
+    puntos = (2 if hora >= 20 or hora < 5 else 0) + (1 if "violencia" in tipo or "Asalto" in tipo else 0)
+    pesos = [[1, 3, 6], [2, 4, 4], [4, 4, 2], [6, 3, 1]][puntos]
+    return rnd.choices([1, 2, 3], weights=pesos)[0]
+
+
+def filas_incidentes(rnd, delegacion_id, cantidad, ubicaciones, dias):
+    hoy = date.today()
+    for _ in range(cantidad):
+        hora = rnd.choices(range(24), weights=PESOS_HORA)[0]
+        tipo = rnd.choice(TIPOS)
+        yield (
+            delegacion_id,
+            tipo,
+            rnd.choice(ubicaciones),
+            hoy - timedelta(days=rnd.randint(0, dias)),
+            f"{hora:02d}:{rnd.randint(0, 59):02d}:00",
+            _nivel(rnd, hora, tipo),
+        )
+
+
+def insertar_por_lotes(conn, cursor, query, filas, lote):
+    bloque, total = [], 0
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= lote:
+            cursor.executemany(query, bloque)
+            conn.commit()
+            total += len(bloque)
+            bloque = []
+    if bloque:
+        cursor.executemany(query, bloque)
+        conn.commit()
+        total += len(bloque)
+    return total
+
+
+def sembrar(delegaciones, incidentes, ubicaciones, dias, confirmadas, semilla=42, lote=5000):
+    rnd = random.Random(semilla)
+    inicio = time.perf_counter()
+    with conexion_bd() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO niveles_riesgo (id, nombre, codigo_color) VALUES (%s, %s, %s)", NIVELES)
+        cursor.executemany("INSERT INTO delegaciones (nombre) VALUES (%s)",
+                           [(f"Delegación {i}",) for i in range(1, delegaciones + 1)])
+        conn.commit()
+
+        total = 0
+        for delegacion_id in range(1, delegaciones + 1):
+            nombres = [f"Calle {j}, Delegación {delegacion_id}" for j in range(ubicaciones)]
+            total += insertar_por_lotes(conn, cursor, """
+                INSERT INTO incidentes (delegacion_id, tipo, ubicacion, fecha_incidente, hora_incidente, nivel_riesgo_id)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, filas_incidentes(rnd, delegacion_id, incidentes, nombres, dias), lote)
+
+            # Retroalimentación pendiente de migrar (para /migrar_predicciones)
+            pendientes = [
+                (f"pred-{rnd.randint(10000, 99999)}",) + fila + (True,)
+                for fila in filas_incidentes(rnd, delegacion_id, confirmadas, nombres, 30)
+            ]
+            insertar_por_lotes(conn, cursor, """
+                INSERT INTO predicciones_confirmadas (incidente_original_id, delegacion_id, tipo, ubicacion,
+                    fecha_incidente, hora_incidente, nivel_riesgo_id, confirmado)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, pendientes, lote)
+            print(f"     Delegación {delegacion_id}: {incidentes} incidentes")
+        cursor.close()
+
+    filas_resumen = reconstruir()
+    print(f"     {total} incidentes y {filas_resumen} filas de resumen en {time.perf_counter() - inicio:.1f} s")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delegaciones", type=int, default=16)
+    parser.add_argument("--incidentes", type=int, default=20000, help="incidentes por delegación")
+    parser.add_argument("--ubicaciones", type=int, default=150, help="ubicaciones distintas por delegación")
+    parser.add_argument("--dias", type=int, default=730, help="antigüedad máxima de los incidentes")
+    parser.add_argument("--confirmadas", type=int, default=50, help="predicciones confirmadas pendientes por delegación")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--recrear", action="store_true", help="borrar y crear de nuevo las tablas")
+    parser.add_argument("--forzar", action="store_true", help="permitir --recrear en una base sin 'bench'/'test' en el nombre")
+    args = parser.parse_args()
+
+    base = os.getenv("DATABASE") or ""
+    if args.recrear:
+        if not args.forzar and "bench" not in base.lower() and "test" not in base.lower():
+            parser.error(f"la base '{base}' no parece de pruebas; usa --forzar si de verdad quieres recrearla")
+        with conexion_bd() as conn:
+            cursor = conn.cursor()
+            crear_esquema(cursor)
+            cursor.close()
+        print(f"     Esquema creado en '{base}'")
+
+    sembrar(args.delegaciones, args.incidentes, args.ubicaciones, args.dias, args.confirmadas, args.semilla)
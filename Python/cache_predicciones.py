@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import mysql.connector
+
+from conexion import conexion_bd, ErrorConexion
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Entradas en memoria por proceso (además de la tabla predicciones_cache, compartida)
+PREDICCIONES_CACHE_MAX = int(os.getenv("PREDICCIONES_CACHE_MAX", 512))
+
+# Error de MySQL cuando la tabla no existe (migración sql/003 sin aplicar)
+ER_NO_SUCH_TABLE = 1146
+
+# Generación del algoritmo de simulación: cambiarla descarta las entradas generadas con el anterior,
+# que con la misma versión del modelo ya no coinciden con lo que se calcularía ahora
+GENERACION_PREDICCIONES = 2
+
+
+# Consultas sobre predicciones_cache (también las revisa verificacion_indices con EXPLAIN)
+CONSULTA_CACHE = """
+    SELECT payload FROM predicciones_cache
+    WHERE delegacion_id = %s AND periodo = %s AND fecha = %s AND version_modelo = %s
+"""
+CONSULTA_CACHE_LOTE = """
+    SELECT delegacion_id, version_modelo, payload FROM predicciones_cache
+    WHERE delegacion_id IN ({marcadores}) AND periodo = %s AND fecha = %s
+"""
+
+
+class CachePredicciones:
+    """
+    Cache de predicciones ya serializadas, por (delegación, fecha, periodo, versión del modelo).
+
+    Tiene dos niveles: un LRU en memoria del proceso y la tabla
+    predicciones_cache, que comparten todos los workers y el trabajo nocturno
+    de pregeneración. Como la versión del modelo forma parte de la clave, un
+    reentrenamiento deja inservibles las entradas anteriores; invalidar() además
+    las borra. La versión se guarda junto con GENERACION_PREDICCIONES.
+    """
+
+    def __init__(self, max_entradas=PREDICCIONES_CACHE_MAX):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._tabla_disponible = True
+        self.aciertos_memoria = 0
+        self.aciertos_bd = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _version(version):
+        return f"{version}+g{GENERACION_PREDICCIONES}"
+
+    @classmethod
+    def _clave(cls, delegacion_id, fecha, periodo, version):
+        return (str(delegacion_id), fecha, periodo, cls._version(version))
+
+    def _guardar_memoria(self, clave, payload):
+        with self._lock:
+            self._entradas[clave] = payload
+            self._entradas.move_to_end(clave)
+            while self.max_entradas and len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def _tabla_falta(self, error):
+        # Sin conexión (pool agotado o MySQL caído) la cache se omite y la predicción se calcula igualmente
+        if getattr(error, "errno", None) == ER_NO_SUCH_TABLE:
+            if self._tabla_disponible:
+                logger.warning("⚠️ Falta la tabla predicciones_cache; aplica sql/003_predicciones_cache.sql")
+            self._tabla_disponible = False
+            return True
+        return False
+
+    def obtener(self, delegacion_id, fecha, periodo, version):
+        clave = self._clave(delegacion_id, fecha, periodo, version)
+        with self._lock:
+            payload = self._entradas.get(clave)
+            if payload is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos_memoria += 1
+                return payload
+
+        if self._tabla_disponible:
+            try:
+                with conexion_bd() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(CONSULTA_CACHE, (delegacion_id, periodo, fecha, self._version(version)))
+                    fila = cursor.fetchone()
+                    cursor.close()
+                if fila:
+                    with self._lock:
+                        self.aciertos_bd += 1
+                    self._guardar_memoria(clave, fila[0])
+                    return fila[0]
+            except (mysql.connector.Error, ErrorConexion) as e:
+                if not self._tabla_falta(e):
+                    logger.warning(f"⚠️ No se pudo leer la cache de predicciones: {e}")
+
+        with self._lock:
+            self.fallos += 1
+        return None
+
+    def obtener_lote(self, versiones, fecha, periodo):
+        # Varias delegaciones del mismo periodo con una sola consulta: {delegacion_id: versión} -> {delegacion_id: payload}
+        encontrados, faltan = {}, {}
+        with self._lock:
+            for delegacion_id, version in versiones.items():
+                clave = self._clave(delegacion_id, fecha, periodo, version)
+                payload = self._entradas.get(clave)
+                if payload is None:
+                    faltan[str(delegacion_id)] = (delegacion_id, version)
+                    continue
+                self._entradas.move_to_end(clave)
+                self.aciertos_memoria += 1
+                encontrados[delegacion_id] = payload
+
+        if faltan and self._tabla_disponible:
+            try:
+                with conexion_bd() as conn:
+                    cursor = conn.cursor()
+                    marcadores = ", ".join(["%s"] * len(faltan))
+                    cursor.execute(CONSULTA_CACHE_LOTE.format(marcadores=marcadores),
+                                   (*(d for d, _ in faltan.values()), periodo, fecha))
+                    filas = cursor.fetchall()
+                    cursor.close()
+                for delegacion_bd, version_bd, payload in filas:
+                    delegacion_id, version = faltan.get(str(delegacion_bd), (None, None))
+                    if delegacion_id is None or version_bd != self._version(version):
+                        continue
+                    del faltan[str(delegacion_bd)]
+                    encontrados[delegacion_id] = payload
+                    with self._lock:
+                        self.aciertos_bd += 1
+                    self._guardar_memoria(self._clave(delegacion_id, fecha, periodo, version), payload)
+            except (mysql.connector.Error, ErrorConexion) as e:
+                if not self._tabla_falta(e):
+                    logger.warning(f"⚠️ No se pudo leer la cache de predicciones: {e}")
+
+        with self._lock:
+            self.fallos += len(faltan)
+        return encontrados
+
+    def guardar(self, delegacion_id, fecha, periodo, version, payload):
+        self._guardar_memoria(self._clave(delegacion_id, fecha, periodo, version), payload)
+        if not self._tabla_disponible:
+            return
+        try:
+            with conexion_bd() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO predicciones_cache (delegacion_id, periodo, fecha, version_modelo, payload)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE payload = VALUES(payload), creado = CURRENT_TIMESTAMP
+                """, (delegacion_id, periodo, fecha, self._version(version), payload))
+                conn.commit()
+                cursor.close()
+        except (mysql.connector.Error, ErrorConexion) as e:
+            if not self._tabla_falta(e):
+                logger.warning(f"⚠️ No se pudo guardar la cache de predicciones: {e}")
+
+    def invalidar(self, delegacion_id, version_vigente=None):
+        # Descartar las predicciones de una delegación calculadas con otra versión del modelo
+        clave_delegacion = str(delegacion_id)
+        version_vigente = self._version(version_vigente) if version_vigente else ""
+        with self._lock:
+            for clave in [c for c in self._entradas if c[0] == clave_delegacion and c[3] != version_vigente]:
+                del self._entradas[clave]
+        if not self._tabla_disponible:
+            return
+        try:
+            with conexion_bd() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM predicciones_cache WHERE delegacion_id = %s AND version_modelo <> %s",
+                    (delegacion_id, version_vigente)
+                )
+                conn.commit()
+                cursor.close()
+        except (mysql.connector.Error, ErrorConexion) as e:
+            if not self._tabla_falta(e):
+                logger.warning(f"⚠️ No se pudo invalidar la cache de predicciones: {e}")
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas_memoria": len(self._entradas),
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_bd": self.aciertos_bd,
+                "fallos": self.fallos,
+            }
+
+
+# Cache única del proceso
+cache_predicciones = CachePredicciones()
+
+metricas.estadisticas("prvzu_cache_predicciones", lambda: cache_predicciones.estadisticas(), {
+    "aciertos_memoria": ("counter", "Predicciones servidas desde la memoria del proceso"),
+    "aciertos_bd": ("counter", "Predicciones servidas desde la tabla predicciones_cache"),
+    "fallos": ("counter", "Predicciones calculadas por no estar en la cache"),
+    "entradas_memoria": ("gauge", "Predicciones en la memoria del proceso"),
+})
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import request, make_response
+
+from metricas import metricas
+
+# Tiempos de vida por defecto (segundos) de las rutas de lectura cacheadas
+CACHE_TTL_ZONAS = int(os.getenv("CACHE_TTL_ZONAS", 60))
+CACHE_TTL_DELEGACIONES = int(os.getenv("CACHE_TTL_DELEGACIONES", 300))
+CACHE_TTL_AGREGADOS = int(os.getenv("CACHE_TTL_AGREGADOS", 300))
+CACHE_TTL_PRONOSTICO = int(os.getenv("CACHE_TTL_PRONOSTICO", 300))
+
+EntradaCache = namedtuple("EntradaCache", ["cuerpo", "mimetype", "etag", "expira"])
+
+
+class CacheRespuestas:
+    """
+    Cache en memoria de respuestas JSON con tiempo de vida.
+
+    Si varias peticiones fallan a la vez sobre la misma clave, solo una ejecuta
+    la consulta y las demás esperan su resultado. La cache es por proceso: con
+    varios workers, invalidar() solo limpia el worker que atendió la escritura y
+    el resto se actualiza al expirar el TTL.
+    """
+
+    def __init__(self, espera_max=30):
+        self.espera_max = espera_max
+        self._entradas = {}
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener_o_calcular(self, clave, ttl, calcular):
+        while True:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada and entrada.expira > time.monotonic():
+                    self.aciertos += 1
+                    return entrada, None
+                evento = self._en_vuelo.get(clave)
+                lider = evento is None
+                if lider:
+                    evento = self._en_vuelo[clave] = threading.Event()
+                    generacion = self._generacion
+                    self.fallos += 1
+
+            if not lider:
+                # Otra petición ya está calculando esta clave: esperar y volver a mirar
+                evento.wait(self.espera_max)
+                continue
+
+            try:
+                respuesta = calcular()
+                entrada = None
+                if respuesta.status_code == 200:
+                    cuerpo = respuesta.get_data()
+                    entrada = EntradaCache(
+                        cuerpo,
+                        respuesta.mimetype,
+                        '"' + hashlib.sha1(cuerpo).hexdigest() + '"',
+                        time.monotonic() + ttl,
+                    )
+                    with self._lock:
+                        # No guardar un resultado calculado antes de una invalidación
+                        if generacion == self._generacion:
+                            self._entradas[clave] = entrada
+                return entrada, respuesta
+            finally:
+                with self._lock:
+                    self._en_vuelo.pop(clave, None)
+                evento.set()
+
+    def invalidar(self, prefijo=None):
+        with self._lock:
+            self._generacion += 1
+            if prefijo is None:
+                self._entradas.clear()
+            else:
+                for clave in [c for c in self._entradas if c.startswith(prefijo)]:
+                    del self._entradas[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos}
+
+
+# Cache única del proceso
+cache_respuestas = CacheRespuestas()
+
+metricas.estadisticas("prvzu_cache_respuestas", lambda: cache_respuestas.estadisticas(), {
+    "aciertos": ("counter", "Respuestas servidas desde la cache"),
+    "fallos": ("counter", "Respuestas calculadas por no estar en la cache"),
+    "entradas": ("gauge", "Respuestas en la cache"),
+})
+
+
+# Respuesta con cabeceras de validación; 304 si el navegador ya tiene esta versión
+def _responder(entrada, ttl):
+    if entrada.etag in request.headers.get("If-None-Match", ""):
+        respuesta = make_response("", 304)
+    else:
+        respuesta = make_response(entrada.cuerpo)
+        respuesta.mimetype = entrada.mimetype
+    respuesta.headers["ETag"] = entrada.etag
+    respuesta.headers["Cache-Control"] = f"public, max-age={ttl}, must-revalidate"
+    return respuesta
+
+
+def cacheado(ttl):
+    """Decorador para rutas GET: cachea la respuesta por ruta y parámetros de consulta."""
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            clave = request.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.args.items(multi=True)))
+            entrada, respuesta = cache_respuestas.obtener_o_calcular(
+                clave, ttl, lambda: make_response(vista(*args, **kwargs))
+            )
+            if entrada is None:
+                # Errores y respuestas no cacheables se devuelven tal cual
+                return respuesta
+            return _responder(entrada, ttl)
+        return envoltura
+    return decorador
@@ -0,0 +1,128 @@
+import os
+import weakref
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+
+# Límite de categorías con columna propia; el resto va a la columna "<campo>__otros" (0 = sin límite)
+ENCODER_MAX_TIPOS = int(os.getenv("ENCODER_MAX_TIPOS", 0))
+ENCODER_MAX_UBICACIONES = int(os.getenv("ENCODER_MAX_UBICACIONES", 200))
+# A partir de este número de columnas se generan matrices dispersas (CSR)
+ENCODER_DISPERSO_DESDE = int(os.getenv("ENCODER_DISPERSO_DESDE", 1000))
+
+NUMERICAS = ('hora', 'dia_semana', 'mes')
+CATEGORICAS = ('tipo', 'ubicacion')
+
+
+class CodificadorIncidentes:
+    """
+    Codificación one-hot de incidentes ajustada una sola vez y guardada con el modelo.
+
+    Las columnas se llaman igual que las de pd.get_dummies ('tipo_<valor>',
+    'ubicacion_<valor>'). Cada categoría se resuelve a su índice de columna con
+    un diccionario, así que codificar no recorre las columnas. Las categorías
+    que no tienen columna propia (no vistas, o fuera del top-K) van a la
+    columna '<campo>__otros' si existe, o quedan en cero.
+    """
+
+    def __init__(self, max_categorias=None, disperso_desde=ENCODER_DISPERSO_DESDE):
+        self.max_categorias = max_categorias or {'tipo': ENCODER_MAX_TIPOS, 'ubicacion': ENCODER_MAX_UBICACIONES}
+        self.disperso_desde = disperso_desde
+        self.columns = []
+        self.indices_numericas = {}
+        self.indices = {campo: {} for campo in CATEGORICAS}
+        self.indice_otros = {campo: None for campo in CATEGORICAS}
+
+    def ajustar(self, datos):
+        # `datos`: DataFrame o dict de columnas con al menos los campos categóricos
+        self.columns = list(NUMERICAS)
+        self.indices_numericas = {col: i for i, col in enumerate(NUMERICAS)}
+        for campo in CATEGORICAS:
+            conteo = Counter(datos[campo])
+            limite = self.max_categorias.get(campo) or 0
+            # Orden estable: primero por frecuencia, luego alfabético
+            valores = sorted(conteo, key=lambda v: (-conteo[v], str(v)))
+            conservados = valores[:limite] if limite else valores
+            self.indices[campo] = {}
+            for valor in sorted(conservados, key=str):
+                self.indices[campo][valor] = len(self.columns)
+                self.columns.append(f"{campo}_{valor}")
+            self.indice_otros[campo] = None
+            if len(conservados) < len(valores):
+                self.indice_otros[campo] = len(self.columns)
+                self.columns.append(f"{campo}__otros")
+        return self
+
+    @classmethod
+    def desde_columnas(cls, columns):
+        # Reconstruir el codificador de un modelo entrenado con pd.get_dummies (formato anterior)
+        codificador = cls()
+        codificador.columns = list(columns)
+        for idx, col in enumerate(columns):
+            if col.startswith('tipo_'):
+                codificador.indices['tipo'][col[len('tipo_'):]] = idx
+            elif col.startswith('ubicacion_'):
+                codificador.indices['ubicacion'][col[len('ubicacion_'):]] = idx
+            else:
+                codificador.indices_numericas[col] = idx
+        return codificador
+
+    # Conocida: tiene columna propia o cae en la columna "otros" del campo (categorías fuera del top-K)
+    def conoce(self, campo, valor):
+        return valor in self.indices[campo] or self.indice_otros[campo] is not None
+
+    def _indices_categoria(self, campo, valores):
+        indices = self.indices[campo]
+        otros = self.indice_otros[campo]
+        por_defecto = -1 if otros is None else otros
+        return np.fromiter((indices.get(v, por_defecto) for v in valores), dtype=np.int64, count=len(valores))
+
+    def transformar(self, datos, disperso=None):
+        """
+        Codifica `datos` (DataFrame o dict de columnas: hora, dia_semana, mes,
+        tipo, ubicacion) en una matriz con las columnas del codificador.
+        Devuelve un ndarray, o una matriz CSR si `disperso` (por defecto: si hay
+        más de `disperso_desde` columnas).
+        """
+        n = len(datos[CATEGORICAS[0]])
+        num_columnas = len(self.columns)
+        if disperso is None:
+            disperso = num_columnas >= self.disperso_desde
+
+        filas, columnas, valores = [], [], []
+        for campo, idx in self.indices_numericas.items():
+            filas.append(np.arange(n))
+            columnas.append(np.full(n, idx))
+            valores.append(np.asarray(datos[campo], dtype=np.float32))
+        for campo in CATEGORICAS:
+            idx = self._indices_categoria(campo, list(datos[campo]))
+            validas = idx >= 0
+            filas.append(np.nonzero(validas)[0])
+            columnas.append(idx[validas])
+            valores.append(np.ones(int(validas.sum()), dtype=np.float32))
+
+        filas = np.concatenate(filas)
+        columnas = np.concatenate(columnas)
+        valores = np.concatenate(valores)
+
+        if disperso:
+            return sp.csr_matrix((valores, (filas, columnas)), shape=(n, num_columnas), dtype=np.float32)
+        X = np.zeros((n, num_columnas), dtype=np.float32)
+        X[filas, columnas] = valores
+        return X
+
+
+# Codificadores reconstruidos para modelos del formato anterior (uno por modelo)
+_codificadores_anteriores = weakref.WeakKeyDictionary()
+
+
+def codificador_de(model_data):
+    codificador = model_data.get('codificador')
+    if codificador is not None:
+        return codificador
+    model = model_data['model']
+    codificador = _codificadores_anteriores.get(model)
+    if codificador is None:
+        codificador = _codificadores_anteriores[model] = CodificadorIncidentes.desde_columnas(model_data['columns'])
+    return codificador
@@ -1,6 +1,12 @@
 import mysql.connector
 import os
+import collections
+import threading
+import time
 import logging
+from contextlib import contextmanager
+
+from metricas import metricas, observar_etapa, tramo
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -9,6 +15,7 @@ logger = logging.getLogger(__name__)
 # Configuración de la base de datos usando variables de entorno
 config = {
     "host": os.getenv("DATABASE_HOST"),
+    "port": int(os.getenv("DATABASE_PORT", 3306)),
     "user": os.getenv("DATABASE_USERNAME"),
     "password": os.getenv("DATABASE_PASSWORD"),
     "database": os.getenv("DATABASE"),
@@ -16,23 +23,306 @@ config = {
     "protocol": "tcp"  # Forzar el uso de TCP/IP en lugar de named pipes
 }
 
-# Configuración de SSL
-if os.getenv("RENDER"):  # Si estamos en Render
-    config["ssl_ca"] = "/etc/ssl/certs/ca-certificates.crt"
-else:  # Si estamos en local
-    config["ssl_ca"] = os.path.join(os.path.dirname(__file__), "ca-certificates.crt")
+# Configuración de SSL (DATABASE_SSL=0 para un MySQL local sin certificado, p. ej. en los benchmarks)
+if os.getenv("DATABASE_SSL", "1") == "0":
+    config["ssl_disabled"] = True
+else:
+    if os.getenv("RENDER"):  # Si estamos en Render
+        config["ssl_ca"] = "/etc/ssl/certs/ca-certificates.crt"
+    else:  # Si estamos en local
+        config["ssl_ca"] = os.path.join(os.path.dirname(__file__), "ca-certificates.crt")
 
-config["ssl_verify_cert"] = True
+    config["ssl_verify_cert"] = True
 
-# Función para conectar con la base de datos
-def get_db_connection():
+# Configuración del pool de conexiones
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))  # Conexiones máximas por proceso
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # Segundos de espera por una conexión libre
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Edad máxima (s) antes de reabrir una conexión
+POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", 30))  # Inactividad (s) tras la que se verifica con ping
+
+
+class ErrorConexion(Exception):
+    """No se pudo obtener una conexión: MySQL no responde o el pool está agotado."""
+
+
+# Abrir una conexión nueva con la configuración anterior
+def _abrir_conexion():
     try:
-        conexion = mysql.connector.connect(**config)
-        logger.info("✅ Conexión exitosa a la base de datos")
-        return conexion
+        # Sin log por conexión: las conexiones abiertas se cuentan en /metrics (prvzu_pool_conexiones_creadas_total)
+        with tramo("conexion_nueva"):
+            return mysql.connector.connect(**config)
     except mysql.connector.Error as e:
         logger.error(f"❌ Error al conectar a MySQL: {e}")
-        raise Exception(f"No se pudo conectar a la base de datos: {e}")
+        raise ErrorConexion(f"No se pudo conectar a la base de datos: {e}")
     except Exception as e:
         logger.error(f"❌ Error inesperado: {e}")
-        raise Exception(f"No se pudo conectar a la base de datos: {e}")
+        raise ErrorConexion(f"No se pudo conectar a la base de datos: {e}")
+
+
+class CursorMedido:
+    """
+    Envoltura sobre un cursor que mide por separado la ejecución de la
+    consulta y la lectura de filas (etapas "consulta" y "lectura" de /metrics).
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args, **kwargs):
+        with tramo("consulta"):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with tramo("consulta"):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        with tramo("consulta"):
+            return self._cursor.callproc(*args, **kwargs)
+
+    def fetchone(self):
+        with tramo("lectura"):
+            return self._cursor.fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with tramo("lectura"):
+            return self._cursor.fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with tramo("lectura"):
+            return self._cursor.fetchall()
+
+
+class ConexionAgrupada:
+    """
+    Envoltura sobre una conexión del pool. Se usa igual que una conexión de
+    mysql.connector, pero close() la devuelve al pool en lugar de cerrarla.
+    """
+
+    def __init__(self, pool, conexion, creada_en):
+        self._pool = pool
+        self._conexion = conexion
+        self._creada_en = creada_en
+        self._devuelta = False
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._conexion.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self._devuelta:
+            self._devuelta = True
+            self._pool.devolver(self._conexion, self._creada_en)
+
+    def __del__(self):
+        # Si una ruta olvida cerrar la conexión (p. ej. por una excepción), recuperarla igualmente
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones MySQL compartido por todo el proceso.
+
+    Mantiene hasta `tamano` conexiones abiertas, verifica con ping las que
+    llevan tiempo inactivas y recicla las que superan `reciclar` segundos.
+    """
+
+    def __init__(self, tamano=POOL_SIZE, timeout=POOL_TIMEOUT, reciclar=POOL_RECYCLE,
+                 intervalo_ping=POOL_PING_INTERVAL):
+        self.tamano = max(1, tamano)
+        self.timeout = timeout
+        self.reciclar = reciclar
+        self.intervalo_ping = intervalo_ping
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # Tras un fork, las conexiones heredadas comparten socket con el padre: se descartan
+        self._pid = os.getpid()
+        self._disponible = threading.Condition(self._lock)
+        self._libres = collections.deque()
+        self._abiertas = 0
+        self._estadisticas = {
+            "checkouts": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "conexiones_creadas": 0,
+            "conexiones_recicladas": 0,
+            "conexiones_descartadas": 0,
+            "tiempo_checkout_total": 0.0,
+            "tiempo_checkout_max": 0.0,
+            "tiempo_checkout_ultimo": 0.0,
+        }
+
+    def _verificar_proceso(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reiniciar()
+
+    def _descartar(self, conexion):
+        try:
+            conexion.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._abiertas -= 1
+            self._disponible.notify()
+
+    def _conexion_sana(self, conexion, creada_en, liberada_en):
+        ahora = time.monotonic()
+        if self.reciclar and ahora - creada_en > self.reciclar:
+            with self._lock:
+                self._estadisticas["conexiones_recicladas"] += 1
+            return False
+        if ahora - liberada_en < self.intervalo_ping:
+            return True
+        try:
+            conexion.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._estadisticas["conexiones_descartadas"] += 1
+            return False
+
+    def _reservar(self, inicio):
+        # Devuelve una conexión libre, o None si hay cupo para abrir una nueva
+        espero = False
+        with self._lock:
+            while not self._libres and self._abiertas >= self.tamano:
+                espero = True
+                restante = self.timeout - (time.monotonic() - inicio)
+                if restante <= 0 or not self._disponible.wait(restante):
+                    if not self._libres and self._abiertas >= self.tamano:
+                        self._estadisticas["timeouts"] += 1
+                        logger.error("❌ Tiempo de espera agotado al obtener una conexión del pool")
+                        raise ErrorConexion("No se pudo conectar a la base de datos: pool de conexiones agotado")
+            if espero:
+                self._estadisticas["esperas"] += 1
+            if self._libres:
+                return self._libres.pop()
+            self._abiertas += 1
+            return None
+
+    def obtener(self):
+        self._verificar_proceso()
+        inicio = time.monotonic()
+
+        while True:
+            libre = self._reservar(inicio)
+            if libre is None:
+                # Hay cupo: abrir una conexión nueva
+                try:
+                    conexion = _abrir_conexion()
+                except Exception:
+                    with self._lock:
+                        self._abiertas -= 1
+                        self._disponible.notify()
+                    raise
+                creada_en = time.monotonic()
+                with self._lock:
+                    self._estadisticas["conexiones_creadas"] += 1
+                break
+
+            conexion, creada_en, liberada_en = libre
+            if self._conexion_sana(conexion, creada_en, liberada_en):
+                break
+            self._descartar(conexion)
+
+        duracion = time.monotonic() - inicio
+        observar_etapa("conexion", duracion)
+        with self._lock:
+            self._estadisticas["checkouts"] += 1
+            self._estadisticas["tiempo_checkout_total"] += duracion
+            self._estadisticas["tiempo_checkout_ultimo"] = duracion
+            self._estadisticas["tiempo_checkout_max"] = max(self._estadisticas["tiempo_checkout_max"], duracion)
+
+        return ConexionAgrupada(self, conexion, creada_en)
+
+    def devolver(self, conexion, creada_en):
+        if self._pid != os.getpid():
+            return
+        try:
+            # No dejar resultados pendientes ni transacciones abiertas para la siguiente petición
+            if conexion.unread_result:
+                conexion.consume_results()
+            if conexion.in_transaction:
+                conexion.rollback()
+        except Exception:
+            with self._lock:
+                self._estadisticas["conexiones_descartadas"] += 1
+            self._descartar(conexion)
+            return
+        with self._lock:
+            self._libres.append((conexion, creada_en, time.monotonic()))
+            self._disponible.notify()
+
+    def cerrar_todas(self):
+        with self._lock:
+            libres = list(self._libres)
+            self._libres.clear()
+        for conexion, _, _ in libres:
+            self._descartar(conexion)
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._estadisticas)
+            datos["tamano"] = self.tamano
+            datos["abiertas"] = self._abiertas
+            datos["libres"] = len(self._libres)
+        datos["en_uso"] = datos["abiertas"] - datos["libres"]
+        datos["tiempo_checkout_promedio"] = (
+            datos["tiempo_checkout_total"] / datos["checkouts"] if datos["checkouts"] else 0.0
+        )
+        return datos
+
+
+# Pool único del proceso
+pool = PoolConexiones()
+
+metricas.estadisticas("prvzu_pool", lambda: pool.estadisticas(), {
+    "checkouts": ("counter", "Conexiones entregadas por el pool"),
+    "esperas": ("counter", "Checkouts que tuvieron que esperar una conexión libre"),
+    "timeouts": ("counter", "Checkouts que agotaron la espera"),
+    "conexiones_creadas": ("counter", "Conexiones MySQL abiertas"),
+    "conexiones_recicladas": ("counter", "Conexiones cerradas por antigüedad"),
+    "conexiones_descartadas": ("counter", "Conexiones descartadas por fallar el ping o al devolverlas"),
+    "abiertas": ("gauge", "Conexiones abiertas"),
+    "en_uso": ("gauge", "Conexiones prestadas en este momento"),
+    "tamano": ("gauge", "Tamaño máximo del pool"),
+})
+
+# Función para conectar con la base de datos
+# Devuelve una conexión del pool; al llamar close() vuelve al pool
+def get_db_connection():
+    return pool.obtener()
+
+# Uso recomendado: garantiza que la conexión siempre vuelve al pool
+@contextmanager
+def conexion_bd():
+    conexion = get_db_connection()
+    try:
+        yield conexion
+    finally:
+        conexion.close()
+
+# Contadores del pool (checkouts, esperas, tiempos de checkout)
+def estadisticas_pool():
+    return pool.estadisticas()
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import ssl
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+from conexion import config, POOL_TIMEOUT, POOL_RECYCLE
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# Pool del servidor asíncrono (app_async.py): una conexión atiende una petición a la vez,
+# pero mientras espera a MySQL el proceso sigue atendiendo otras
+ASYNC_DB_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", 1))  # Conexiones abiertas al arrancar
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 20))  # Conexiones máximas del proceso
+
+_pool = None
+
+
+# Mismo certificado que las conexiones síncronas (None con DATABASE_SSL=0)
+def _contexto_ssl():
+    if config.get("ssl_disabled"):
+        return None
+    ca = config.get("ssl_ca")
+    if ca and os.path.exists(ca):
+        return ssl.create_default_context(cafile=ca)
+    return ssl.create_default_context()
+
+
+async def iniciar_pool():
+    global _pool
+    if _pool is None:
+        _pool = await aiomysql.create_pool(
+            host=config["host"],
+            port=config["port"],
+            user=config["user"],
+            password=config["password"] or "",
+            db=config["database"],
+            ssl=_contexto_ssl(),
+            minsize=ASYNC_DB_POOL_MIN,
+            maxsize=ASYNC_DB_POOL_SIZE,
+            pool_recycle=POOL_RECYCLE,
+            autocommit=True,
+            charset="utf8mb4",
+        )
+        logger.info(f"✅ Pool asíncrono listo ({ASYNC_DB_POOL_MIN}-{ASYNC_DB_POOL_SIZE} conexiones)")
+    return _pool
+
+
+async def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+@asynccontextmanager
+async def conexion_bd_async():
+    """
+    Toma una conexión del pool asíncrono y la devuelve al salir del bloque.
+    Si el bloque termina con una excepción (o se cancela, p. ej. porque el
+    cliente se desconectó a mitad de un streaming) la conexión se cierra en
+    lugar de reutilizarse, por si quedaron filas sin leer.
+    """
+    pool = await iniciar_pool()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), POOL_TIMEOUT)
+    except Exception as e:
+        logger.error(f"❌ Error al conectar a MySQL: {e}")
+        raise Exception(f"No se pudo conectar a la base de datos: {e}")
+    try:
+        yield conn
+    except BaseException:
+        conn.close()
+        raise
+    finally:
+        pool.release(conn)
+
+
+def estadisticas_pool_async():
+    if _pool is None:
+        return {"abiertas": 0, "libres": 0, "en_uso": 0, "maximo": ASYNC_DB_POOL_SIZE}
+    return {"abiertas": _pool.size, "libres": _pool.freesize, "en_uso": _pool.size - _pool.freesize,
+            "maximo": _pool.maxsize}
+
+
+metricas.estadisticas("prvzu_pool_async", estadisticas_pool_async, {
+    "abiertas": ("gauge", "Conexiones abiertas del pool asíncrono"),
+    "libres": ("gauge", "Conexiones del pool asíncrono libres"),
+    "en_uso": ("gauge", "Conexiones del pool asíncrono prestadas en este momento"),
+    "maximo": ("gauge", "Conexiones máximas del pool asíncrono"),
+})
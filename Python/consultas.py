@@ -0,0 +1,382 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta
+
+# Consultas y validaciones compartidas por la API síncrona (app.py) y la asíncrona (app_async.py)
+# No dependen del framework: reciben los parámetros de la petición como diccionarios
+
+# Tamaño máximo de página para la paginación por cursor
+PAGINA_MAX = int(os.getenv("PAGINA_MAX", 1000))
+
+# Porcentajes de riesgo de los últimos 30 días a partir del resumen diario (~30 filas por delegación)
+ZONAS_RIESGO_RESUMEN = '''
+    SELECT
+        d.id,
+        d.nombre,
+        ROUND((SUM(CASE WHEN rd.codigo_color = 'danger' THEN rd.total ELSE 0 END) / SUM(rd.total)) * 100) AS red,
+        ROUND((SUM(CASE WHEN rd.codigo_color = 'warning' THEN rd.total ELSE 0 END) / SUM(rd.total)) * 100) AS yellow,
+        ROUND((SUM(CASE WHEN rd.codigo_color = 'success' THEN rd.total ELSE 0 END) / SUM(rd.total)) * 100) AS green,
+        CAST(SUM(rd.total) AS SIGNED) AS total
+    FROM delegaciones d
+    JOIN incidentes_resumen_diario rd ON d.id = rd.delegacion_id
+    WHERE rd.fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+    GROUP BY d.id
+'''
+
+# Sin la migración sql/002 se calcula directamente sobre incidentes
+ZONAS_RIESGO_INCIDENTES = '''
+    SELECT
+        d.id,
+        d.nombre,
+        ROUND((SUM(CASE WHEN nr.codigo_color = 'danger' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS red,
+        ROUND((SUM(CASE WHEN nr.codigo_color = 'warning' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS yellow,
+        ROUND((SUM(CASE WHEN nr.codigo_color = 'success' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS green,
+        COUNT(i.id) AS total
+    FROM delegaciones d
+    LEFT JOIN incidentes i ON d.id = i.delegacion_id
+    LEFT JOIN niveles_riesgo nr ON i.nivel_riesgo_id = nr.id
+    WHERE i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+    GROUP BY d.id
+'''
+
+# Siguiente lote de predicciones confirmadas pendientes de migrar (id > ?), para /migrar_predicciones
+CONFIRMADAS_PENDIENTES = """
+    SELECT id, delegacion_id
+    FROM predicciones_confirmadas
+    WHERE confirmado = TRUE AND migrado = FALSE AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+# Consulta base de incidentes históricos; el orden (fecha, hora, id) es también la clave de paginación
+SELECT_INCIDENTES = """
+    SELECT
+        i.id,
+        i.tipo,
+        i.ubicacion,
+        TIME_FORMAT(i.hora_incidente, '%H:%i') AS hora,
+        r.nombre AS riesgo,
+        r.codigo_color,
+        i.fecha_incidente AS fecha{columnas_extra}
+    FROM
+        incidentes i
+    JOIN
+        niveles_riesgo r ON i.nivel_riesgo_id = r.id
+    WHERE
+        i.delegacion_id = %s
+        AND {filtro_fechas}{filtro_cursor}
+    ORDER BY
+        i.fecha_incidente, i.hora_incidente, i.id{limite}
+"""
+
+# Validar la fecha de /incidentes según el periodo: devuelve (fecha, fecha_consulta, error)
+# Sin fecha se usa el mes o el día actual; con un periodo desconocido no se valida (lo rechaza consulta_incidentes)
+def interpretar_fecha(periodo, fecha):
+    fecha_consulta = None
+
+    # Manejo de fecha para predicciones mensuales
+    if periodo == "month":
+        if not fecha or fecha.strip() == "":
+            # Si no se proporciona fecha, usar el mes actual
+            fecha = datetime.now().strftime("%Y-%m")
+
+        try:
+            # Validar formato de fecha para mes
+            year, month = map(int, fecha.split('-'))
+            fecha_consulta = datetime(year, month, 1)
+        except (ValueError, TypeError):
+            return fecha, None, "Formato de fecha inválido para periodo 'month'. Usa 'YYYY-MM'"
+
+    elif periodo in ["day", "week"]:
+        # Validación de fecha para día y semana
+        if not fecha or fecha.strip() == "":
+            fecha = datetime.now().strftime("%Y-%m-%d")
+
+        try:
+            fecha_consulta = datetime.strptime(fecha, "%Y-%m-%d")
+        except ValueError:
+            return fecha, None, "Formato de fecha inválido. Usa 'YYYY-MM-DD'"
+
+    return fecha, fecha_consulta, None
+
+# Consulta SQL de incidentes históricos por periodo: devuelve (query, parámetros) o None si el periodo no es válido
+# Con `pagina` = (cursor, limite) se añade la condición de keyset y el LIMIT
+def consulta_incidentes(delegacion_id, periodo, fecha, fecha_consulta, pagina=None):
+    if periodo == "month":
+        # Rango semiabierto [primer día del mes, primer día del mes siguiente) para usar el índice
+        inicio_mes = fecha_consulta.date()
+        fin_mes = (fecha_consulta.replace(day=28) + timedelta(days=4)).replace(day=1).date()
+        filtro_fechas = "i.fecha_incidente >= %s AND i.fecha_incidente < %s"
+        parametros = [delegacion_id, inicio_mes, fin_mes]
+    elif periodo == "week":
+        filtro_fechas = "i.fecha_incidente >= %s AND i.fecha_incidente <= DATE_ADD(%s, INTERVAL 6 DAY)"
+        parametros = [delegacion_id, fecha, fecha]
+    elif periodo == "day":
+        filtro_fechas = "i.fecha_incidente = %s"
+        parametros = [delegacion_id, fecha]
+    else:
+        return None
+
+    return armar_consulta_paginada(SELECT_INCIDENTES, filtro_fechas, parametros, pagina)
+
+# Completar una consulta con la condición de keyset (fecha, hora, id) > cursor y el LIMIT de la página
+# La condición va desarrollada (fecha > f OR (fecha = f AND ...)): MySQL no usa el índice como rango
+# con la comparación de tuplas (a, b, c) > (x, y, z)
+def armar_consulta_paginada(plantilla, filtro_fechas, parametros, pagina=None):
+    partes = {"filtro_fechas": filtro_fechas, "columnas_extra": "", "filtro_cursor": "", "limite": ""}
+    parametros = list(parametros)
+    if pagina:
+        cursor_pagina, limite = pagina
+        partes["columnas_extra"] = ",\n        TIME_FORMAT(i.hora_incidente, '%T') AS _cursor_hora"
+        if cursor_pagina:
+            fecha_cursor, hora_cursor, id_cursor = cursor_pagina
+            partes["filtro_cursor"] = (
+                "\n        AND (i.fecha_incidente > %s OR (i.fecha_incidente = %s"
+                " AND (i.hora_incidente > %s OR (i.hora_incidente = %s AND i.id > %s))))"
+            )
+            parametros.extend([fecha_cursor, fecha_cursor, hora_cursor, hora_cursor, id_cursor])
+        # Una fila de más para saber si existe una página siguiente
+        partes["limite"] = "\n    LIMIT %s"
+        parametros.append(limite + 1)
+    return plantilla.format(**partes), tuple(parametros)
+
+# Clave (fecha, hora, id) de la última fila de una página de incidentes, leída del token
+def _cursor_incidentes(clave):
+    fecha_cursor, hora_cursor, id_cursor = clave
+    datetime.strptime(fecha_cursor, "%Y-%m-%d")
+    datetime.strptime(hora_cursor, "%H:%M:%S")
+    return fecha_cursor, hora_cursor, int(id_cursor)
+
+# Clave de la última fila de una página de resultados ordenados en memoria (ver clave_fila)
+def _cursor_filas(clave):
+    if not isinstance(clave, list) or not all(isinstance(valor, str) for valor in clave):
+        raise ValueError("clave inválida")
+    return clave
+
+# Token opaco (base64 de la clave en JSON) para el cursor de la página siguiente
+def _token(clave):
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode().rstrip("=")
+
+# Parámetros de paginación (?limit=N&cursor=...): (cursor, limite), None si no se pide paginar, o un mensaje de error
+# `leer_cursor` valida la clave decodificada del token (por defecto, la de incidentes)
+def leer_paginacion(args, leer_cursor=_cursor_incidentes):
+    limite = args.get("limit")
+    if limite is None:
+        return None, None
+    try:
+        limite = int(limite)
+    except ValueError:
+        return None, "El parámetro 'limit' debe ser un número entero"
+    if limite < 1:
+        return None, "El parámetro 'limit' debe ser mayor que 0"
+    limite = min(limite, PAGINA_MAX)
+
+    token = args.get("cursor")
+    if not token:
+        return (None, limite), None
+    try:
+        relleno = "=" * (-len(token) % 4)
+        return (leer_cursor(json.loads(base64.urlsafe_b64decode(token + relleno))), limite), None
+    except (ValueError, TypeError, binascii.Error):
+        return None, "Cursor de paginación inválido"
+
+# Cortar la página y generar el token opaco de la siguiente a partir de la última fila
+def cortar_pagina(filas, limite):
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = _token([ultima["fecha"].isoformat(), ultima["_cursor_hora"], ultima["id"]])
+    for fila in filas:
+        fila.pop("_cursor_hora", None)
+    return {"datos": filas, "siguiente_cursor": siguiente}
+
+# Paginación de resultados que no se pueden limitar en SQL (p. ej. un procedimiento almacenado)
+def leer_paginacion_filas(args):
+    return leer_paginacion(args, leer_cursor=_cursor_filas)
+
+# Orden estable de una fila: sus valores como texto, por nombre de columna
+# Las filas de un GROUP BY son distintas entre sí, así que la clave identifica cada fila
+def clave_fila(fila):
+    return ["" if fila[columna] is None else str(fila[columna]) for columna in sorted(fila)]
+
+# Página de `filas` ordenadas por clave_fila a partir del cursor (clave de la última fila de la página anterior)
+def paginar_filas(filas, pagina):
+    cursor, limite = pagina
+    ordenadas = sorted(filas, key=clave_fila)
+    if cursor is not None:
+        ordenadas = [fila for fila in ordenadas if clave_fila(fila) > cursor]
+    siguiente = None
+    if len(ordenadas) > limite:
+        ordenadas = ordenadas[:limite]
+        siguiente = _token(clave_fila(ordenadas[-1]))
+    return {"datos": ordenadas, "siguiente_cursor": siguiente}
+
+# Formato de streaming solicitado: "ndjson", "json" o None si la respuesta no se transmite por partes
+def formato_streaming(args, headers):
+    stream = args.get("stream", "").lower()
+    if stream == "ndjson" or "application/x-ndjson" in headers.get("Accept", ""):
+        return "ndjson"
+    if stream in ("1", "true", "json"):
+        return "json"
+    return None
+
+# Agrupaciones de /agregados: nombre -> expresión sobre incidentes
+# dia_semana sigue a DAYOFWEEK de MySQL: 1 = domingo ... 7 = sábado
+AGRUPACIONES = {
+    "hora": "HOUR(i.hora_incidente)",
+    "dia_semana": "DAYOFWEEK(i.fecha_incidente)",
+    "dia": "DATE_FORMAT(i.fecha_incidente, '%Y-%m-%d')",
+    "tipo": "i.tipo",
+    "ubicacion": "i.ubicacion",
+    "codigo_color": "COALESCE(r.codigo_color, '')",
+}
+
+# Rango máximo (días) que se puede agregar en una sola consulta
+AGREGADOS_RANGO_MAX = int(os.getenv("AGREGADOS_RANGO_MAX", 1100))
+
+# Validar los parámetros de /agregados: devuelve (parámetros, error)
+# ?delegacion_id=&agrupar=hora,codigo_color&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&top=N
+# Sin rango se usan los últimos 30 días hasta hoy
+def leer_agregacion(args):
+    try:
+        delegacion_id = int(args.get("delegacion_id"))
+    except (TypeError, ValueError):
+        return None, "Falta el parámetro 'delegacion_id' o no es un número entero"
+
+    grupos = [g.strip() for g in args.get("agrupar", "").split(",") if g.strip()]
+    if not grupos:
+        return None, f"Falta el parámetro 'agrupar'. Usa uno o varios de: {', '.join(AGRUPACIONES)}"
+    invalidos = [g for g in grupos if g not in AGRUPACIONES]
+    if invalidos:
+        return None, f"Agrupación inválida '{invalidos[0]}'. Usa uno o varios de: {', '.join(AGRUPACIONES)}"
+    grupos = list(dict.fromkeys(grupos))
+
+    try:
+        hasta = datetime.strptime(args["hasta"], "%Y-%m-%d").date() if args.get("hasta") else datetime.now().date()
+        desde = datetime.strptime(args["desde"], "%Y-%m-%d").date() if args.get("desde") else hasta - timedelta(days=29)
+    except ValueError:
+        return None, "Formato de fecha inválido. Usa 'YYYY-MM-DD'"
+    if desde > hasta:
+        return None, "'desde' no puede ser posterior a 'hasta'"
+    if (hasta - desde).days + 1 > AGREGADOS_RANGO_MAX:
+        return None, f"El rango no puede superar {AGREGADOS_RANGO_MAX} días"
+
+    top = args.get("top")
+    if top is not None:
+        try:
+            top = int(top)
+        except ValueError:
+            return None, "El parámetro 'top' debe ser un número entero"
+        if top < 1:
+            return None, "El parámetro 'top' debe ser mayor que 0"
+
+    return {"delegacion_id": delegacion_id, "grupos": grupos, "desde": desde, "hasta": hasta, "top": top}, None
+
+# Escenarios simulados por /pronostico: por defecto y máximo por petición
+ESCENARIOS_POR_DEFECTO = int(os.getenv("ESCENARIOS_POR_DEFECTO", 500))
+ESCENARIOS_MAX = int(os.getenv("ESCENARIOS_MAX", 5000))
+
+# Validar los parámetros de /pronostico: devuelve (parámetros, error)
+# ?delegacion_id=&fecha=&periodo=day|week|month&escenarios=N (fecha como en /incidentes)
+def leer_pronostico(args):
+    delegacion_id = args.get("delegacion_id")
+    if not delegacion_id:
+        return None, "Falta el parámetro 'delegacion_id'"
+
+    periodo = args.get("periodo", "day")
+    if periodo not in ("day", "week", "month"):
+        return None, "Periodo inválido. Usa 'day', 'week' o 'month'"
+    fecha, _, error_fecha = interpretar_fecha(periodo, args.get("fecha"))
+    if error_fecha:
+        return None, error_fecha
+
+    try:
+        escenarios = int(args.get("escenarios", ESCENARIOS_POR_DEFECTO))
+    except ValueError:
+        return None, "El parámetro 'escenarios' debe ser un número entero"
+    if not 1 <= escenarios <= ESCENARIOS_MAX:
+        return None, f"El parámetro 'escenarios' debe estar entre 1 y {ESCENARIOS_MAX}"
+
+    return {"delegacion_id": delegacion_id, "fecha_base": fecha, "periodo": periodo, "escenarios": escenarios}, None
+
+# Delegaciones máximas por petición de /predicciones/lote
+PREDICCION_LOTE_MAX = int(os.getenv("PREDICCION_LOTE_MAX", 50))
+
+# Validar los parámetros de /predicciones/lote: devuelve (parámetros, error)
+# ?delegaciones=1,2,3&fecha=&periodo=day|week|month (fecha futura, como en /incidentes)
+# Sin `delegaciones`, parametros["delegaciones"] es None: todas
+def leer_prediccion_lote(args):
+    delegaciones = None
+    if args.get("delegaciones"):
+        try:
+            delegaciones = [int(d) for d in args["delegaciones"].split(",") if d.strip()]
+        except ValueError:
+            return None, "El parámetro 'delegaciones' debe ser una lista de ids separados por comas"
+        delegaciones = list(dict.fromkeys(delegaciones))
+        if len(delegaciones) > PREDICCION_LOTE_MAX:
+            return None, f"No se pueden pedir más de {PREDICCION_LOTE_MAX} delegaciones por petición"
+
+    periodo = args.get("periodo", "day")
+    if periodo not in ("day", "week", "month"):
+        return None, "Periodo inválido. Usa 'day', 'week' o 'month'"
+    fecha, fecha_consulta, error_fecha = interpretar_fecha(periodo, args.get("fecha"))
+    if error_fecha:
+        return None, error_fecha
+    if fecha_consulta <= datetime.now():
+        return None, "Solo se generan predicciones para fechas futuras; el historial se consulta en /incidentes"
+
+    return {"delegaciones": delegaciones, "fecha_base": fecha, "periodo": periodo}, None
+
+# Consulta de conteos agrupados: (query, parámetros). Con `top` se devuelven los N grupos con más incidentes
+# Todas las agrupaciones salen de la misma fuente (incidentes), así que sus totales siempre coinciden
+def consulta_agregados(delegacion_id, grupos, desde, hasta, top=None):
+    expresiones = [AGRUPACIONES[g] for g in grupos]
+    total = "COUNT(*)"
+    # LEFT JOIN y '' para los incidentes sin nivel de riesgo, igual que el resumen diario
+    origen = "incidentes i\n    LEFT JOIN\n        niveles_riesgo r ON i.nivel_riesgo_id = r.id"
+    filtro = "i.delegacion_id = %s AND i.fecha_incidente >= %s AND i.fecha_incidente <= %s"
+    columnas = [f"{expresion} AS {g}" for expresion, g in zip(expresiones, grupos)]
+    parametros = [delegacion_id, desde, hasta]
+
+    orden = ", ".join(grupos)
+    limite = ""
+    total_rango = ""
+    if top:
+        # El total del rango se calcula sobre todos los grupos, antes del LIMIT
+        total_rango = f",\n        SUM({total}) OVER () AS total_rango"
+        orden = f"total DESC, {orden}"
+        limite = "\n    LIMIT %s"
+        parametros.append(top)
+
+    query = f"""
+    SELECT
+        {', '.join(columnas)},
+        {total} AS total{total_rango}
+    FROM
+        {origen}
+    WHERE
+        {filtro}
+    GROUP BY
+        {', '.join(expresiones)}
+    ORDER BY
+        {orden}{limite}
+"""
+    return query, tuple(parametros)
+
+# Cuerpo de la respuesta de /agregados; "total" es el de todo el rango aunque `datos` sean solo los top-N
+def armar_agregados(parametros, filas):
+    total = sum(fila["total"] for fila in filas)
+    if parametros.get("top"):
+        total = filas[0]["total_rango"] if filas else 0
+        filas = [{campo: valor for campo, valor in fila.items() if campo != "total_rango"} for fila in filas]
+    return {
+        "delegacion_id": parametros["delegacion_id"],
+        "desde": parametros["desde"].isoformat(),
+        "hasta": parametros["hasta"].isoformat(),
+        "agrupar": parametros["grupos"],
+        "total": int(total),
+        "datos": filas,
+    }
@@ -0,0 +1,495 @@
+import argparse
+import copy
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+# numpy, pandas, scikit-learn y el codificador se importan dentro de las funciones que entrenan
+# para que importar este módulo (y la cola) no cargue la pila de ML (ver modelos.precargar_ml)
+from conexion import conexion_bd
+from modelos import MODELS_DIR, registro, guardar_artefacto
+from instantaneas import actualizar_instantanea
+from cache_predicciones import cache_predicciones
+from cache_respuestas import cache_respuestas
+from metricas import medir_entrenamiento, registrar_entrenamiento
+
+# Configuración de la cola de entrenamiento en segundo plano
+ENTRENAMIENTO_WORKERS = int(os.getenv("ENTRENAMIENTO_WORKERS", 1))  # Hilos que entrenan en paralelo
+ENTRENAMIENTO_DEBOUNCE = float(os.getenv("ENTRENAMIENTO_DEBOUNCE", 5))  # Segundos de espera para agrupar solicitudes
+ENTRENAMIENTO_ESPERA_MAX = float(os.getenv("ENTRENAMIENTO_ESPERA_MAX", 60))  # Retraso máximo de un trabajo por el debounce
+ENTRENAMIENTO_HISTORIAL = int(os.getenv("ENTRENAMIENTO_HISTORIAL", 200))  # Trabajos terminados que se conservan
+
+# Incidentes más recientes (por fecha y hora) con los que se entrena un modelo completo
+ENTRENAMIENTO_FILAS = int(os.getenv("ENTRENAMIENTO_FILAS", 1000))
+
+# Paralelismo del entrenamiento
+MODEL_N_JOBS = int(os.getenv("MODEL_N_JOBS", 1))  # Núcleos por RandomForest (n_jobs de sklearn)
+ENTRENAMIENTO_MAX_PROCESOS = int(os.getenv("ENTRENAMIENTO_MAX_PROCESOS", os.cpu_count() or 1))  # Tope global de núcleos
+
+# Entrenamiento incremental desde la marca de agua (último id de incidente incluido)
+REFIT_COMPLETO_HORAS = float(os.getenv("REFIT_COMPLETO_HORAS", 24))  # Reentrenamiento completo programado
+INCREMENTAL_ARBOLES = int(os.getenv("INCREMENTAL_ARBOLES", 10))  # Árboles nuevos (sustituyen a los más antiguos) por actualización
+INCREMENTAL_REPASO = int(os.getenv("INCREMENTAL_REPASO", 200))  # Filas recientes ya vistas que acompañan a las nuevas
+INCREMENTAL_DERIVA_MAX = float(os.getenv("INCREMENTAL_DERIVA_MAX", 0.2))  # Fracción de categorías nuevas que fuerza un refit
+
+
+# Guardar el modelo y las distribuciones en un solo artefacto (escritura atómica) y publicarlos en el registro
+def _guardar_y_publicar(delegacion_id, model_data, tipos_incidentes, ubicaciones):
+    # Versión única por guardado: forma parte de la clave de la cache de predicciones
+    model_data['version'] = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    guardar_artefacto(delegacion_id, model_data, tipos_incidentes, ubicaciones)
+    registro.publicar(delegacion_id, model_data, tipos_incidentes, ubicaciones)
+    # Las predicciones calculadas con el modelo anterior ya no son válidas, tampoco los /pronostico cacheados
+    cache_predicciones.invalidar(delegacion_id, model_data['version'])
+    cache_respuestas.invalidar("/pronostico?")
+
+
+# Función para entrenar o actualizar el modelo de predicción
+@medir_entrenamiento("completo")
+def entrenar_modelo(delegacion_id, n_jobs=None):
+    from sklearn.ensemble import RandomForestClassifier
+    from codificador import CodificadorIncidentes
+
+    try:
+        # Datos históricos desde la instantánea local: solo se consultan los incidentes nuevos
+        instantanea = actualizar_instantanea(delegacion_id)
+        if instantanea is None:
+            print("❌ No se pudo conectar a la base de datos para entrenar el modelo")
+            return None
+
+        if instantanea.filas < 10:
+            print(f"⚠️ Datos insuficientes para entrenar modelo de delegación {delegacion_id}")
+            return None
+
+        # Preparar datos para el modelo; el mayor id incluido es la marca de agua para actualizaciones incrementales
+        df = instantanea.dataframe(instantanea.recientes(ENTRENAMIENTO_FILAS))
+        watermark = int(df['id'].max())
+        df = df.drop('id', axis=1)
+
+        # Codificar variables categóricas con un codificador que se guarda junto al modelo
+        codificador = CodificadorIncidentes().ajustar(df)
+
+        # Características (X) y objetivo (y)
+        X = codificador.transformar(df)
+        y = df['nivel_riesgo_id'].to_numpy()
+
+        # Entrenar modelo (RandomForest como ejemplo)
+        model = RandomForestClassifier(n_estimators=100, n_jobs=n_jobs or MODEL_N_JOBS)
+        model.fit(X, y)
+
+        # Guardar también la estructura de las columnas para usar en predicciones
+        model_data = {
+            'model': model,
+            'columns': codificador.columns,
+            'codificador': codificador,
+            'watermark': watermark,
+            'entrenado_en': datetime.now().isoformat(timespec='seconds'),
+            'actualizaciones_incrementales': 0,
+            # Distribución horaria de todo el historial: pesos de la hora en las simulaciones (simulacion.py)
+            'pesos_hora': instantanea.pesos_hora(),
+        }
+
+        # Distribuciones de tipos y ubicaciones de todo el historial, contadas sobre la instantánea
+        tipos_incidentes = instantanea.conteos_tipos()
+        ubicaciones = instantanea.conteos_ubicaciones()
+
+        _guardar_y_publicar(delegacion_id, model_data, tipos_incidentes, ubicaciones)
+
+        print(f"     Modelo entrenado y guardado para delegación {delegacion_id}")
+        return model_data
+
+    except Exception as e:
+        print(f"❌ Error al entrenar modelo: {e}")
+        return None
+
+
+# Motivo por el que una actualización incremental no es posible o conveniente (None si lo es)
+def _motivo_refit_completo(model_data):
+    if not model_data or 'watermark' not in model_data:
+        return "sin modelo o sin marca de agua"
+    try:
+        entrenado_en = datetime.fromisoformat(model_data['entrenado_en'])
+    except (KeyError, TypeError, ValueError):
+        return "sin fecha de entrenamiento"
+    if datetime.now() - entrenado_en > timedelta(hours=REFIT_COMPLETO_HORAS):
+        return "refit programado"
+    if model_data.get('actualizaciones_incrementales', 0) * INCREMENTAL_ARBOLES >= len(model_data['model'].estimators_):
+        return "todos los árboles ya fueron sustituidos incrementalmente"
+    return None
+
+
+def actualizar_modelo(delegacion_id, n_jobs=None):
+    """
+    Actualiza el modelo con los incidentes posteriores a su marca de agua.
+
+    Solo consulta las filas con id mayor que la marca de agua; si no hay
+    ninguna, no hace nada. Si las hay, entrena INCREMENTAL_ARBOLES árboles
+    nuevos (warm start) con ellas más INCREMENTAL_REPASO filas recientes y
+    sustituye a los árboles más antiguos, de modo que el bosque conserva su
+    tamaño. Hace un reentrenamiento completo cuando toca por calendario, cuando
+    hay demasiadas categorías desconocidas (deriva) o cuando cambian las clases.
+    """
+    import numpy as np
+    import pandas as pd
+    from codificador import codificador_de
+
+    model_data = registro.obtener(delegacion_id).model_data
+    motivo = _motivo_refit_completo(model_data)
+    if motivo:
+        print(f"     Reentrenamiento completo de delegación {delegacion_id}: {motivo}")
+        return entrenar_modelo(delegacion_id, n_jobs=n_jobs)
+
+    instantanea = actualizar_instantanea(delegacion_id)
+    if instantanea is None:
+        print("❌ No se pudo conectar a la base de datos para actualizar el modelo")
+        return None
+
+    nuevas = instantanea.posteriores(model_data['watermark'])
+    if not len(nuevas):
+        return model_data
+
+    # Filas ya vistas para que el lote contenga todas las clases y no sobreajuste a lo nuevo
+    repaso = instantanea.recientes(INCREMENTAL_REPASO, hasta_id=model_data['watermark'])
+
+    model = model_data['model']
+    codificador = codificador_de(model_data)
+    df_nuevas = instantanea.dataframe(nuevas)
+
+    # Deriva: categorías que el modelo no conoce (sin columna propia ni columna "otros" en el codificador)
+    desconocidas = sum(
+        1 for tipo, ubicacion in zip(df_nuevas['tipo'], df_nuevas['ubicacion'])
+        if not codificador.conoce('tipo', tipo) or not codificador.conoce('ubicacion', ubicacion)
+    )
+    if desconocidas / len(nuevas) > INCREMENTAL_DERIVA_MAX:
+        print(f"     Reentrenamiento completo de delegación {delegacion_id}: "
+              f"{desconocidas}/{len(nuevas)} incidentes con categorías nuevas")
+        return entrenar_modelo(delegacion_id, n_jobs=n_jobs)
+
+    df = pd.concat([df_nuevas, instantanea.dataframe(repaso)], ignore_index=True)
+    y = df['nivel_riesgo_id'].to_numpy()
+    if not np.array_equal(np.unique(y), model.classes_):
+        print(f"     Reentrenamiento completo de delegación {delegacion_id}: cambiaron las clases de riesgo")
+        return entrenar_modelo(delegacion_id, n_jobs=n_jobs)
+
+    # Codificar con las mismas columnas del modelo (las categorías desconocidas van a "otros" o quedan en cero)
+    X = codificador.transformar(df)
+
+    inicio = time.perf_counter()
+    # Copia superficial: los árboles existentes se comparten, las predicciones en curso no ven cambios a medias
+    nuevo_modelo = copy.copy(model)
+    nuevo_modelo.estimators_ = list(model.estimators_)
+    tamano = len(model.estimators_)
+    nuevo_modelo.set_params(warm_start=True, n_estimators=tamano + INCREMENTAL_ARBOLES,
+                            n_jobs=n_jobs or MODEL_N_JOBS)
+    nuevo_modelo.fit(X, y)
+    # Retirar los árboles más antiguos para conservar el tamaño del bosque
+    nuevo_modelo.estimators_ = nuevo_modelo.estimators_[-tamano:]
+    nuevo_modelo.set_params(warm_start=False, n_estimators=tamano)
+
+    nuevo_model_data = dict(model_data)
+    nuevo_model_data.update({
+        'model': nuevo_modelo,
+        'watermark': int(df_nuevas['id'].max()),
+        'actualizaciones_incrementales': model_data.get('actualizaciones_incrementales', 0) + 1,
+        'pesos_hora': instantanea.pesos_hora(),
+    })
+
+    # Las distribuciones se cuentan sobre la instantánea, sin volver a agrupar en la base de datos
+    tipos_incidentes = instantanea.conteos_tipos()
+    ubicaciones = instantanea.conteos_ubicaciones()
+
+    _guardar_y_publicar(delegacion_id, nuevo_model_data, tipos_incidentes, ubicaciones)
+    registrar_entrenamiento("incremental", time.perf_counter() - inicio)
+    print(f"     Modelo de delegación {delegacion_id} actualizado con {len(nuevas)} incidentes nuevos")
+    return nuevo_model_data
+
+
+# Entrenar una delegación dentro de un proceso del pool y medir cuánto tarda
+def _entrenar_en_proceso(delegacion_id, n_jobs):
+    inicio = time.perf_counter()
+    try:
+        resultado = entrenar_modelo(delegacion_id, n_jobs=n_jobs)
+        error = None if resultado else "Datos insuficientes o error al entrenar"
+    except Exception as e:
+        resultado, error = None, str(e)
+    return {
+        'delegacion_id': delegacion_id,
+        'estado': 'completado' if resultado else 'fallido',
+        'duracion_s': round(time.perf_counter() - inicio, 3),
+        'error': error,
+    }
+
+
+# Calcular procesos y núcleos por modelo sin pasar del tope global
+def _repartir_nucleos(num_delegaciones, workers=None, n_jobs=None):
+    n_jobs = max(1, n_jobs or MODEL_N_JOBS)
+    tope = max(1, ENTRENAMIENTO_MAX_PROCESOS)
+    n_jobs = min(n_jobs, tope)
+    max_workers = max(1, tope // n_jobs)
+    workers = min(workers or max_workers, max_workers, max(1, num_delegaciones))
+    return workers, n_jobs
+
+
+def entrenar_en_paralelo(delegaciones, workers=None, n_jobs=None):
+    """
+    Reentrena varias delegaciones repartiéndolas en un pool de procesos.
+
+    Usa `workers` procesos con `n_jobs` núcleos cada uno; el producto nunca
+    supera ENTRENAMIENTO_MAX_PROCESOS. Devuelve un reporte con el tiempo de
+    cada delegación y el tiempo total.
+    """
+    delegaciones = [int(d) for d in dict.fromkeys(delegaciones)]
+    workers, n_jobs = _repartir_nucleos(len(delegaciones), workers, n_jobs)
+    inicio = time.perf_counter()
+    resultados = []
+
+    if delegaciones:
+        # "spawn" evita heredar hilos y sockets del proceso web
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+            futuros = [executor.submit(_entrenar_en_proceso, d, n_jobs) for d in delegaciones]
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+
+    # Los procesos hijos escribieron en disco; el registro recarga por mtime, pero se fuerza por claridad
+    for resultado in resultados:
+        registro.invalidar(resultado['delegacion_id'])
+    # Los hijos no comparten la cache de respuestas de este proceso
+    if resultados:
+        cache_respuestas.invalidar("/pronostico?")
+
+    resultados.sort(key=lambda r: r['duracion_s'], reverse=True)
+    return {
+        'workers': workers,
+        'n_jobs': n_jobs,
+        'total_s': round(time.perf_counter() - inicio, 3),
+        'suma_entrenamientos_s': round(sum(r['duracion_s'] for r in resultados), 3),
+        'completados': sum(1 for r in resultados if r['estado'] == 'completado'),
+        'fallidos': sum(1 for r in resultados if r['estado'] != 'completado'),
+        'delegaciones': resultados,
+    }
+
+
+# Todas las delegaciones registradas
+def ids_delegaciones():
+    with conexion_bd() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM delegaciones ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+
+# Bloqueo entre procesos (workers de gunicorn) sobre un archivo por delegación en MODELS_DIR
+@contextmanager
+def bloqueo_entrenamiento(delegacion_id):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(MODELS_DIR, f".entrenando_{int(delegacion_id)}.lock"), "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class ColaEntrenamiento:
+    """
+    Cola de reentrenamientos en segundo plano.
+
+    Las solicitudes para una delegación que ya tiene un trabajo pendiente se
+    fusionan con él y retrasan su inicio `debounce` segundos (como máximo
+    `espera_max` desde la primera solicitud), de modo que una ráfaga de
+    retroalimentación produce un solo entrenamiento. Nunca se entrena la misma
+    delegación en dos hilos a la vez, ni en dos procesos (bloqueo_entrenamiento).
+
+    La cola y el estado de los trabajos son de cada proceso: con varios
+    workers de gunicorn, GET /entrenamiento/<id> solo encuentra el trabajo en
+    el worker que lo programó (los ids son uuid4, así que otro worker responde
+    404, nunca con un trabajo ajeno) y el debounce agrupa solo las solicitudes
+    que llegan al mismo worker.
+    """
+
+    def __init__(self, entrenar=actualizar_modelo, workers=ENTRENAMIENTO_WORKERS,
+                 debounce=ENTRENAMIENTO_DEBOUNCE, espera_max=ENTRENAMIENTO_ESPERA_MAX,
+                 historial=ENTRENAMIENTO_HISTORIAL):
+        self.entrenar = entrenar
+        self.workers = max(1, workers)
+        self.debounce = debounce
+        self.espera_max = max(espera_max, debounce)
+        self.historial = historial
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Condition(self._lock)
+        self._heap = []  # (momento_inicio, trabajo_id)
+        self._pendientes = {}  # delegacion_id -> trabajo pendiente
+        self._en_curso = set()  # delegaciones entrenándose
+        self._trabajos = OrderedDict()  # trabajo_id -> trabajo
+        self._hilos = []
+        self._pid = None
+
+    def _arrancar(self):
+        # Los hilos se crean en el primer uso de cada proceso (gunicorn hace fork después de importar)
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._heap, self._pendientes, self._en_curso = [], {}, set()
+        self._hilos = [
+            threading.Thread(target=self._bucle, name=f"entrenamiento-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def programar(self, delegacion_id):
+        delegacion_id = int(delegacion_id)
+        ahora = time.monotonic()
+        with self._lock:
+            self._arrancar()
+            trabajo = self._pendientes.get(delegacion_id)
+            if trabajo:
+                # Fusionar con el trabajo pendiente y reiniciar el debounce
+                trabajo['solicitudes'] += 1
+                limite = trabajo['_primera_solicitud'] + self.espera_max
+                trabajo['_inicio_programado'] = min(ahora + self.debounce, limite)
+            else:
+                trabajo = {
+                    'id': uuid.uuid4().hex,
+                    'delegacion_id': delegacion_id,
+                    'estado': 'pendiente',
+                    'solicitudes': 1,
+                    'creado': datetime.now().isoformat(timespec='seconds'),
+                    'inicio': None,
+                    'fin': None,
+                    'duracion_s': None,
+                    'error': None,
+                    '_primera_solicitud': ahora,
+                    '_inicio_programado': ahora + self.debounce,
+                }
+                self._pendientes[delegacion_id] = trabajo
+                self._trabajos[trabajo['id']] = trabajo
+                self._recortar_historial()
+            heapq.heappush(self._heap, (trabajo['_inicio_programado'], trabajo['id']))
+            self._hay_trabajo.notify()
+            return self._publico(trabajo)
+
+    def _recortar_historial(self):
+        terminados = [tid for tid, t in self._trabajos.items() if t['estado'] in ('completado', 'fallido')]
+        for tid in terminados[:max(0, len(self._trabajos) - self.historial)]:
+            del self._trabajos[tid]
+
+    def _siguiente(self):
+        with self._lock:
+            while True:
+                ahora = time.monotonic()
+                while self._heap:
+                    momento, trabajo_id = self._heap[0]
+                    trabajo = self._trabajos.get(trabajo_id)
+                    # Entradas obsoletas del heap (trabajo reprogramado o ya iniciado)
+                    if not trabajo or trabajo['estado'] != 'pendiente' or momento != trabajo['_inicio_programado']:
+                        heapq.heappop(self._heap)
+                        continue
+                    break
+                if not self._heap:
+                    self._hay_trabajo.wait()
+                    continue
+
+                momento, trabajo_id = self._heap[0]
+                if momento > ahora:
+                    self._hay_trabajo.wait(momento - ahora)
+                    continue
+
+                heapq.heappop(self._heap)
+                trabajo = self._trabajos[trabajo_id]
+                if trabajo['delegacion_id'] in self._en_curso:
+                    # Otro hilo entrena esta delegación: reintentar cuando termine
+                    trabajo['_inicio_programado'] = ahora + max(self.debounce, 0.5)
+                    heapq.heappush(self._heap, (trabajo['_inicio_programado'], trabajo_id))
+                    continue
+
+                del self._pendientes[trabajo['delegacion_id']]
+                self._en_curso.add(trabajo['delegacion_id'])
+                trabajo['estado'] = 'en_curso'
+                trabajo['inicio'] = datetime.now().isoformat(timespec='seconds')
+                return trabajo
+
+    def _bucle(self):
+        while True:
+            trabajo = self._siguiente()
+            inicio = time.perf_counter()
+            try:
+                # Si otro worker entrena ya esta delegación se espera a que termine
+                with bloqueo_entrenamiento(trabajo['delegacion_id']):
+                    resultado = self.entrenar(trabajo['delegacion_id'])
+                estado = 'completado' if resultado else 'fallido'
+                error = None if resultado else "No se pudo entrenar el modelo (datos insuficientes o error)"
+            except Exception as e:
+                estado, error = 'fallido', str(e)
+            with self._lock:
+                trabajo['estado'] = estado
+                trabajo['error'] = error
+                trabajo['fin'] = datetime.now().isoformat(timespec='seconds')
+                trabajo['duracion_s'] = round(time.perf_counter() - inicio, 3)
+                self._en_curso.discard(trabajo['delegacion_id'])
+                self._hay_trabajo.notify_all()
+
+    @staticmethod
+    def _publico(trabajo):
+        return {k: v for k, v in trabajo.items() if not k.startswith('_')}
+
+    def estado(self, trabajo_id):
+        with self._lock:
+            trabajo = self._trabajos.get(str(trabajo_id))
+            return self._publico(trabajo) if trabajo else None
+
+    def listar(self, delegacion_id=None):
+        with self._lock:
+            return [
+                self._publico(t) for t in reversed(self._trabajos.values())
+                if delegacion_id is None or t['delegacion_id'] == int(delegacion_id)
+            ]
+
+
+# Cola única del proceso
+cola_entrenamiento = ColaEntrenamiento()
+
+
+# Reentrenamiento masivo desde la línea de comandos:
+#   python entrenamiento.py --todas --workers 4 --n-jobs 2 --json reporte.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reentrenar modelos de varias delegaciones en paralelo")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--todas", action="store_true", help="reentrenar todas las delegaciones")
+    grupo.add_argument("--delegaciones", type=int, nargs="+", help="ids de delegación a reentrenar")
+    parser.add_argument("--workers", type=int, default=None, help="procesos de entrenamiento")
+    parser.add_argument("--n-jobs", type=int, default=None, help="núcleos por modelo")
+    parser.add_argument("--json", help="guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    delegaciones = ids_delegaciones() if args.todas else args.delegaciones
+    reporte = entrenar_en_paralelo(delegaciones, workers=args.workers, n_jobs=args.n_jobs)
+
+    for r in reporte['delegaciones']:
+        print(f"  delegación {r['delegacion_id']:>4}: {r['estado']:<10} {r['duracion_s']:8.2f} s"
+              + (f"  ({r['error']})" if r['error'] else ""))
+    print(f"     {reporte['completados']} modelos entrenados, {reporte['fallidos']} fallidos en "
+          f"{reporte['total_s']:.2f} s ({reporte['workers']} procesos x {reporte['n_jobs']} núcleos)")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(reporte, file, indent=2)
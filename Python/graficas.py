@@ -1,6 +1,6 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from conexion import get_db_connection  # Importamos la función desde conexion.py
+from conexion import conexion_bd, ErrorConexion  # Importamos las funciones desde conexion.py
 
 app = Flask(__name__)
 
@@ -15,34 +15,35 @@ CORS(app, resources={
     }
 })
 
+# Sin conexión a la base de datos cualquier ruta responde con el mismo error JSON
+@app.errorhandler(ErrorConexion)
+def error_conexion(e):
+    return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
+
 # Ruta para obtener las zonas de riesgo
 @app.route('/api/zonas_riesgo', methods=['GET'])
 def get_zonas_riesgo():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-
-    cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
     
-    # Consulta para calcular los porcentajes de riesgo
-    cursor.execute(''' 
-        SELECT 
-            d.id, 
-            d.nombre,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'danger' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS red,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'warning' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS yellow,
-            ROUND((SUM(CASE WHEN nr.codigo_color = 'success' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS green,
-            COUNT(i.id) AS total
-        FROM delegaciones d
-        LEFT JOIN incidentes i ON d.id = i.delegacion_id
-        LEFT JOIN niveles_riesgo nr ON i.nivel_riesgo_id = nr.id
-        WHERE i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-        GROUP BY d.id
-    ''')
+        # Consulta para calcular los porcentajes de riesgo
+        cursor.execute(''' 
+            SELECT 
+                d.id, 
+                d.nombre,
+                ROUND((SUM(CASE WHEN nr.codigo_color = 'danger' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS red,
+                ROUND((SUM(CASE WHEN nr.codigo_color = 'warning' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS yellow,
+                ROUND((SUM(CASE WHEN nr.codigo_color = 'success' THEN 1 ELSE 0 END) / COUNT(i.id)) * 100) AS green,
+                COUNT(i.id) AS total
+            FROM delegaciones d
+            LEFT JOIN incidentes i ON d.id = i.delegacion_id
+            LEFT JOIN niveles_riesgo nr ON i.nivel_riesgo_id = nr.id
+            WHERE i.fecha_incidente >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+            GROUP BY d.id
+        ''')
     
-    zonas_riesgo = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        zonas_riesgo = cursor.fetchall()
+        cursor.close()
     
     return jsonify(zonas_riesgo)
 
@@ -52,21 +53,17 @@ def get_estimaciones_riesgo():
     delegacion_id = request.args.get('delegacion_id', default=None, type=int)
     dias = request.args.get('dias', default=7, type=int)
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "No se pudo conectar a la base de datos"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    with conexion_bd() as conn:
+        cursor = conn.cursor(dictionary=True)
     
-    # Llamada al procedimiento almacenado para obtener las predicciones
-    cursor.callproc('obtener_predicciones', [delegacion_id, dias])
+        # Llamada al procedimiento almacenado para obtener las predicciones
+        cursor.callproc('obtener_predicciones', [delegacion_id, dias])
     
-    estimaciones_riesgo = []
-    for result in cursor.stored_results():
-        estimaciones_riesgo = result.fetchall()
+        estimaciones_riesgo = []
+        for result in cursor.stored_results():
+            estimaciones_riesgo = result.fetchall()
     
-    cursor.close()
-    conn.close()
+        cursor.close()
     
     return jsonify(estimaciones_riesgo)
 
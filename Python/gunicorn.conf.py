@@ -0,0 +1,62 @@
+"""
+Configuración de gunicorn para servir app.py con varios workers:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Con MODELOS_COMPARTIDOS=1 (por defecto) el proceso maestro importa la app, la
+pila de ML y los modelos de todas las delegaciones antes de crear los workers.
+Los workers nacen por fork y comparten esas páginas de memoria (copy-on-write)
+en lugar de cargar cada uno su copia, así que añadir un worker apenas suma
+memoria de modelos.
+
+Los modelos reentrenados llegan a todos los workers sin reiniciar: el registro
+de cada worker compara el mtime del artefacto en cada consulta y recarga el
+que cambió (esa copia ya es propia del worker). Antes de cada fork el maestro
+recarga los artefactos que cambiaron, de modo que los workers que se reciclan
+(GUNICORN_MAX_REQUESTS) vuelven a compartir los modelos vigentes.
+"""
+import gc
+import os
+import threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# Reciclar workers cada N peticiones (0 = nunca); los nuevos heredan del maestro los modelos al día
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+MODELOS_COMPARTIDOS = os.getenv("MODELOS_COMPARTIDOS", "1") == "1"
+preload_app = MODELOS_COMPARTIDOS
+
+if MODELOS_COMPARTIDOS:
+    # La app lee estas variables al importarse en el maestro
+    os.environ.setdefault("PRECARGAR_ML", "1")
+    os.environ.setdefault("PRECARGAR_MODELOS", "1")
+    # Todas las delegaciones en memoria (la memoria es compartida y el LRU descartaría copias comunes),
+    # con el límite en el número de delegaciones con modelo al precargar, no sin límite
+    os.environ.setdefault("MODEL_CACHE_MAX", "auto")
+
+
+def pre_fork(server, worker):
+    if not MODELOS_COMPARTIDOS:
+        return
+    from conexion import pool
+    from modelos import registro
+
+    # El fork solo copia el hilo actual: esperar a la verificación de índices del arranque
+    for hilo in threading.enumerate():
+        if hilo.name == "verificar-indices":
+            hilo.join(timeout=30)
+
+    # Recargar los artefactos que cambiaron desde el último fork (solo un stat por delegación si no cambió nada)
+    gc.unfreeze()
+    registro.precargar()
+    # Las conexiones del maestro no deben heredarse: cada worker abre las suyas
+    pool.cerrar_todas()
+    # Mover los objetos vivos a la generación permanente: el GC de los workers no los recorre
+    # y no ensucia (copia) las páginas compartidas
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,308 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+# numpy y pandas se importan al leer o escribir, no al importar el módulo (ver modelos.precargar_ml)
+from conexion import conexion_bd, ErrorConexion
+from modelos import MODELS_DIR, guardar_atomico
+
+# Instantáneas columnares de los datos de entrenamiento: una carpeta por delegación con un .npy por columna
+INSTANTANEAS_DIR = os.path.join(MODELS_DIR, "instantaneas")
+
+# Reconstruir la instantánea desde cero cada N horas (recoge ediciones hechas directamente en la base de datos)
+INSTANTANEA_RECONSTRUIR_HORAS = float(os.getenv("INSTANTANEA_RECONSTRUIR_HORAS", 168))
+
+# Las filas nuevas se escriben como trozos aparte; con más de N trozos se fusionan en una generación nueva
+INSTANTANEA_TROZOS_MAX = int(os.getenv("INSTANTANEA_TROZOS_MAX", 64))
+
+# Columnas y su tipo en disco. tipo y ubicacion son códigos sobre las listas de categorías de meta.json;
+# orden = TO_SECONDS(fecha + hora) para elegir los incidentes más recientes; nivel_riesgo_id NULL se guarda como 0
+COLUMNAS = {
+    "id": "int64",
+    "orden": "int64",
+    "hora": "int8",
+    "dia_semana": "int8",
+    "mes": "int8",
+    "tipo": "int32",
+    "ubicacion": "int32",
+    "nivel_riesgo_id": "int32",
+}
+NIVEL_NULO = 0
+
+# Solo las filas posteriores a la marca de agua de la instantánea; ORDER BY id mantiene la columna id ordenada
+CONSULTA_NUEVAS = """
+    SELECT
+        i.id,
+        TO_SECONDS(TIMESTAMP(i.fecha_incidente, i.hora_incidente)) as orden,
+        HOUR(i.hora_incidente) as hora,
+        DAYOFWEEK(i.fecha_incidente) as dia_semana,
+        MONTH(i.fecha_incidente) as mes,
+        i.tipo,
+        i.ubicacion,
+        i.nivel_riesgo_id
+    FROM
+        incidentes i
+    WHERE
+        i.delegacion_id = %s AND i.id > %s
+    ORDER BY
+        i.id
+"""
+
+
+def ruta_instantanea(delegacion_id):
+    return os.path.join(INSTANTANEAS_DIR, f"delegacion_{delegacion_id}")
+
+
+class Instantanea:
+    """
+    Datos de entrenamiento de una delegación leídos de disco con mmap (sin copiarlos).
+
+    `columnas` son arrays de NumPy paralelos, uno por columna de COLUMNAS, con
+    las filas ordenadas por id. `tipos` y `ubicaciones` traducen los códigos a
+    los valores originales. Los conteos por tipo, ubicación y hora salen de la
+    instantánea con bincount, sin consultar la base de datos.
+    """
+
+    def __init__(self, meta, columnas):
+        self.meta = meta
+        self.columnas = columnas
+        self.tipos = meta["tipos"]
+        self.ubicaciones = meta["ubicaciones"]
+        self.watermark = meta["watermark"]
+
+    @property
+    def filas(self):
+        return len(self.columnas["id"])
+
+    def _conteos(self, columna, categorias):
+        import numpy as np
+        conteos = np.bincount(self.columnas[columna], minlength=len(categorias))
+        return {categoria: int(n) for categoria, n in zip(categorias, conteos) if n}
+
+    def conteos_tipos(self):
+        return self._conteos("tipo", self.tipos)
+
+    def conteos_ubicaciones(self):
+        return self._conteos("ubicacion", self.ubicaciones)
+
+    def pesos_hora(self):
+        import numpy as np
+        return np.bincount(self.columnas["hora"], minlength=24)[:24].tolist()
+
+    def recientes(self, limite, hasta_id=None):
+        # Índices de las `limite` filas más recientes por fecha y hora (opcionalmente con id <= hasta_id)
+        import numpy as np
+        fin = self.filas if hasta_id is None else int(np.searchsorted(self.columnas["id"], hasta_id, side="right"))
+        if fin <= limite:
+            return np.arange(fin)
+        return np.argpartition(self.columnas["orden"][:fin], fin - limite)[fin - limite:]
+
+    def posteriores(self, desde_id):
+        # Índices de las filas con id mayor que `desde_id`
+        import numpy as np
+        inicio = int(np.searchsorted(self.columnas["id"], desde_id, side="right"))
+        return np.arange(inicio, self.filas)
+
+    def dataframe(self, indices):
+        """DataFrame con las columnas de la consulta de entrenamiento para las filas `indices`."""
+        import numpy as np
+        import pandas as pd
+        c = self.columnas
+        niveles = c["nivel_riesgo_id"][indices].astype(np.int64)
+        if (niveles == NIVEL_NULO).any():
+            niveles = np.where(niveles == NIVEL_NULO, np.nan, niveles)
+        return pd.DataFrame({
+            "id": c["id"][indices],
+            "hora": c["hora"][indices].astype(np.int64),
+            "dia_semana": c["dia_semana"][indices].astype(np.int64),
+            "mes": c["mes"][indices].astype(np.int64),
+            "tipo": np.asarray(self.tipos, dtype=object)[c["tipo"][indices]],
+            "ubicacion": np.asarray(self.ubicaciones, dtype=object)[c["ubicacion"][indices]],
+            "nivel_riesgo_id": niveles,
+        })
+
+
+def _leer_meta(carpeta):
+    try:
+        with open(os.path.join(carpeta, "meta.json"), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _ruta_columna(carpeta, nombre, parte):
+    # `parte`: la generación (columna base) o "<generación>_<trozo>" (filas añadidas después)
+    return os.path.join(carpeta, f"{nombre}.{parte}.npy")
+
+
+def _cargar_columnas(carpeta, meta):
+    # Base con mmap más los trozos añadidos; con trozos, la columna se concatena en memoria (sin escribir)
+    import numpy as np
+    partes = [meta["generacion"]] + [f"{meta['generacion']}_{trozo}" for trozo in meta.get("trozos", [])]
+    columnas = {}
+    for nombre in COLUMNAS:
+        arrays = [np.load(_ruta_columna(carpeta, nombre, parte), mmap_mode="r") for parte in partes]
+        columnas[nombre] = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+    return columnas
+
+
+def leer_instantanea(delegacion_id):
+    # Instantánea vigente en disco, o None si no existe
+    carpeta = ruta_instantanea(delegacion_id)
+    for _ in range(3):
+        meta = _leer_meta(carpeta)
+        if meta is None:
+            return None
+        try:
+            columnas = _cargar_columnas(carpeta, meta)
+        except FileNotFoundError:
+            # Otra escritura publicó una generación nueva y borró esta mientras leíamos: volver a intentar
+            continue
+        return Instantanea(meta, columnas)
+    return None
+
+
+def _guardar_columnas(carpeta, parte, columnas):
+    import numpy as np
+    for nombre, valores in columnas.items():
+        guardar_atomico(_ruta_columna(carpeta, nombre, parte), valores,
+                        serializar=lambda arr, file: np.save(file, arr, allow_pickle=False))
+
+
+def _guardar_meta(carpeta, meta):
+    guardar_atomico(os.path.join(carpeta, "meta.json"), meta,
+                    serializar=lambda obj, file: file.write(json.dumps(obj, ensure_ascii=False).encode("utf-8")))
+
+
+def _escribir(delegacion_id, meta, columnas):
+    carpeta = ruta_instantanea(delegacion_id)
+    os.makedirs(carpeta, exist_ok=True)
+
+    # Cada escritura completa es una generación nueva: meta.json (escrito al final, de forma atómica) decide
+    # cuál es la vigente, así que un lector nunca mezcla columnas de dos generaciones
+    generacion = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    _guardar_columnas(carpeta, generacion, columnas)
+    meta = dict(meta, generacion=generacion, trozos=[])
+    _guardar_meta(carpeta, meta)
+
+    # Las generaciones anteriores y sus trozos ya no se leen (los mmap abiertos siguen siendo válidos tras borrarlos)
+    for nombre in os.listdir(carpeta):
+        partes = nombre.split(".")
+        if len(partes) == 3 and partes[2] == "npy" and partes[1].split("_")[0] < generacion:
+            os.remove(os.path.join(carpeta, nombre))
+    return Instantanea(meta, _cargar_columnas(carpeta, meta))
+
+
+def _anadir_trozo(delegacion_id, actual, meta, nuevas_columnas):
+    # Solo se escriben las filas nuevas; las columnas existentes no se reescriben hasta la próxima fusión
+    import numpy as np
+    carpeta = ruta_instantanea(delegacion_id)
+    trozo = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    _guardar_columnas(carpeta, f"{meta['generacion']}_{trozo}", nuevas_columnas)
+    meta = dict(meta, trozos=list(meta.get("trozos", [])) + [trozo])
+    _guardar_meta(carpeta, meta)
+    return Instantanea(meta, {nombre: np.concatenate([actual.columnas[nombre], nuevas_columnas[nombre]])
+                              for nombre in COLUMNAS})
+
+
+def _reconstruir(meta):
+    try:
+        construida = datetime.fromisoformat(meta["construida"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.now() - construida > timedelta(hours=INSTANTANEA_RECONSTRUIR_HORAS)
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_delegacion(delegacion_id):
+    with _locks_lock:
+        return _locks.setdefault(str(delegacion_id), threading.Lock())
+
+
+def actualizar_instantanea(delegacion_id):
+    """
+    Añade a la instantánea de la delegación los incidentes con id mayor que su
+    marca de agua (una consulta que solo devuelve las filas nuevas) y la
+    devuelve. Las filas nuevas se escriben como un trozo aparte, así que el
+    coste de escritura es el de las filas nuevas y no el de todo el historial;
+    con más de INSTANTANEA_TROZOS_MAX trozos se fusionan. La primera vez, y
+    cada INSTANTANEA_RECONSTRUIR_HORAS, la construye desde cero. Los incidentes
+    sin fecha u hora se omiten. Devuelve None si no hay conexión a la base de datos.
+    """
+    import numpy as np
+
+    with _lock_delegacion(delegacion_id):
+        actual = leer_instantanea(delegacion_id)
+        if actual is not None and _reconstruir(actual.meta):
+            print(f"     Reconstruyendo la instantánea de entrenamiento de delegación {delegacion_id}")
+            actual = None
+
+        try:
+            with conexion_bd() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(CONSULTA_NUEVAS, (delegacion_id, actual.watermark if actual else 0))
+                    nuevas = cursor.fetchall()
+                finally:
+                    cursor.close()
+        except ErrorConexion:
+            print("❌ No se pudo conectar a la base de datos para actualizar la instantánea de entrenamiento")
+            return None
+
+        if actual is not None and not nuevas:
+            return actual
+
+        meta = dict(actual.meta) if actual else {
+            "delegacion_id": delegacion_id,
+            "construida": datetime.now().isoformat(timespec="seconds"),
+            "tipos": [],
+            "ubicaciones": [],
+            "watermark": 0,
+        }
+        # Los códigos de categorías existentes no cambian; las nuevas se añaden al final
+        codigos = {}
+        for campo in ("tipos", "ubicaciones"):
+            meta[campo] = list(meta[campo])
+            codigos[campo] = {valor: i for i, valor in enumerate(meta[campo])}
+
+        def codificar(campo, valor):
+            codigo = codigos[campo].get(valor)
+            if codigo is None:
+                codigo = codigos[campo][valor] = len(meta[campo])
+                meta[campo].append(valor)
+            return codigo
+
+        # La marca de agua avanza también sobre las filas omitidas para no volver a leerlas
+        watermark = max((fila[0] for fila in nuevas), default=meta["watermark"])
+        # Sin fecha u hora (orden, hora, día o mes NULL) la fila no se puede situar en el tiempo
+        completas = [fila for fila in nuevas if None not in fila[1:5]]
+        if len(completas) < len(nuevas):
+            print(f"⚠️ {len(nuevas) - len(completas)} incidentes sin fecha u hora omitidos de la instantánea "
+                  f"de delegación {delegacion_id}")
+
+        ids, orden, hora, dia_semana, mes, tipos, ubicaciones, niveles = zip(*completas) if completas else ([],) * 8
+        nuevas_columnas = {
+            "id": ids,
+            "orden": orden,
+            "hora": hora,
+            "dia_semana": dia_semana,
+            "mes": mes,
+            "tipo": [codificar("tipos", t) for t in tipos],
+            "ubicacion": [codificar("ubicaciones", u) for u in ubicaciones],
+            "nivel_riesgo_id": [NIVEL_NULO if n is None else n for n in niveles],
+        }
+        nuevas_columnas = {nombre: np.asarray(nuevas_columnas[nombre], dtype=dtype) for nombre, dtype in COLUMNAS.items()}
+        meta["watermark"] = int(watermark)
+
+        if actual is None:
+            return _escribir(delegacion_id, meta, nuevas_columnas)
+        if len(meta.get("trozos", [])) >= INSTANTANEA_TROZOS_MAX:
+            # Fusionar la base y los trozos en una generación nueva (sin volver a consultar la base de datos)
+            return _escribir(delegacion_id, meta, {
+                nombre: np.concatenate([actual.columnas[nombre], nuevas_columnas[nombre]]) for nombre in COLUMNAS
+            })
+        return _anadir_trozo(delegacion_id, actual, meta, nuevas_columnas)
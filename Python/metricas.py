@@ -0,0 +1,232 @@
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+# Registro estructurado (una línea JSON por petición lenta)
+logger_lentas = logging.getLogger("prvzu.peticiones_lentas")
+
+# Peticiones más lentas que este umbral (ms) se registran con el desglose por etapa
+METRICAS_LENTA_MS = float(os.getenv("METRICAS_LENTA_MS", 1000))
+# Fracción de las peticiones lentas que se registran (1 = todas)
+METRICAS_LENTA_MUESTREO = float(os.getenv("METRICAS_LENTA_MUESTREO", 1.0))
+
+# Límites (segundos) de los histogramas de latencia y de entrenamiento
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_ENTRENAMIENTO = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _etiquetas_texto(nombres, valores, extra=()):
+    pares = [f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for n, v in list(zip(nombres, valores)) + list(extra)]
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # valores de etiquetas -> [conteos por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for etiquetas, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), serie):
+                acumulado += conteo
+                le = (("le", limite if limite == "+Inf" else _numero(limite)),)
+                lineas.append(f"{self.nombre}_bucket{_etiquetas_texto(self.etiquetas, etiquetas, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas_texto(self.etiquetas, etiquetas)} {serie[-2]:.6f}")
+            lineas.append(f"{self.nombre}_count{_etiquetas_texto(self.etiquetas, etiquetas)} {serie[-1]}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, *etiquetas):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = dict(self._valores)
+        for etiquetas, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas_texto(self.etiquetas, etiquetas)} {_numero(valor)}")
+        return lineas
+
+
+class RegistroMetricas:
+    """
+    Métricas del proceso en formato de texto de Prometheus (GET /metrics).
+
+    Además de histogramas y contadores propios, exporta las estadísticas que ya
+    llevan otros componentes (pool de conexiones, caches, registro de modelos):
+    cada uno se registra con estadisticas() y se lee en el momento de exportar.
+    Con varios workers cada proceso tiene sus propias métricas; Prometheus
+    las distingue por instancia.
+    """
+
+    def __init__(self):
+        self._metricas = []
+        self._estadisticas = []
+        self._lock = threading.Lock()
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        metrica = Histograma(nombre, ayuda, etiquetas, buckets)
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        metrica = Contador(nombre, ayuda, etiquetas)
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def estadisticas(self, prefijo, funcion, campos):
+        # `campos`: {clave del dict que devuelve funcion(): ("counter" | "gauge", ayuda)}
+        with self._lock:
+            self._estadisticas.append((prefijo, funcion, campos))
+
+    def exportar(self):
+        with self._lock:
+            metricas = list(self._metricas)
+            estadisticas = list(self._estadisticas)
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exportar())
+        for prefijo, funcion, campos in estadisticas:
+            try:
+                valores = funcion()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudieron leer las estadísticas de {prefijo}: {e}")
+                continue
+            for clave, (tipo, ayuda) in campos.items():
+                if clave not in valores:
+                    continue
+                nombre = f"{prefijo}_{clave}" + ("_total" if tipo == "counter" else "")
+                lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}", f"{nombre} {_numero(valores[clave])}"]
+        return "\n".join(lineas) + "\n"
+
+
+# Registro único del proceso
+metricas = RegistroMetricas()
+
+duracion_peticiones = metricas.histograma(
+    "prvzu_peticion_segundos", "Duración de las peticiones HTTP", ("ruta", "metodo", "status")
+)
+duracion_etapas = metricas.histograma(
+    "prvzu_etapa_segundos",
+    "Duración de cada etapa de una petición (conexion, consulta, lectura, carga_modelo, entrenamiento, "
+    "inferencia, serializacion)",
+    ("ruta", "etapa")
+)
+duracion_entrenamientos = metricas.histograma(
+    "prvzu_entrenamiento_segundos", "Duración de los entrenamientos de modelos", ("tipo", "resultado"),
+    BUCKETS_ENTRENAMIENTO
+)
+peticiones_lentas = metricas.contador(
+    "prvzu_peticiones_lentas_total", f"Peticiones de más de {METRICAS_LENTA_MS:g} ms", ("ruta",)
+)
+
+# Petición en curso del hilo o de la tarea asíncrona: ruta, método, inicio y tiempo acumulado por etapa
+_peticion = ContextVar("peticion", default=None)
+
+# Ruta con la que se etiquetan las etapas fuera de una petición (cola de entrenamiento, scripts)
+SIN_PETICION = "segundo_plano"
+
+
+def iniciar_peticion(ruta, metodo="GET"):
+    _peticion.set({"ruta": ruta, "metodo": metodo, "inicio": time.perf_counter(), "etapas": {}})
+
+
+def terminar_peticion(status):
+    peticion = _peticion.get()
+    if peticion is None or "duracion" in peticion:
+        return
+    duracion = peticion["duracion"] = time.perf_counter() - peticion["inicio"]
+    duracion_peticiones.observar(duracion, peticion["ruta"], peticion["metodo"], str(status))
+    if duracion * 1000 >= METRICAS_LENTA_MS:
+        peticiones_lentas.incrementar(1, peticion["ruta"])
+        if random.random() < METRICAS_LENTA_MUESTREO:
+            logger_lentas.warning(json.dumps({
+                "evento": "peticion_lenta",
+                "ruta": peticion["ruta"],
+                "metodo": peticion["metodo"],
+                "status": status,
+                "duracion_ms": round(duracion * 1000, 1),
+                "etapas_ms": {etapa: round(s * 1000, 1) for etapa, s in peticion["etapas"].items()},
+            }, ensure_ascii=False))
+
+
+def observar_etapa(etapa, segundos):
+    peticion = _peticion.get()
+    ruta = SIN_PETICION
+    if peticion is not None:
+        ruta = peticion["ruta"]
+        peticion["etapas"][etapa] = peticion["etapas"].get(etapa, 0.0) + segundos
+    duracion_etapas.observar(segundos, ruta, etapa)
+
+
+@contextmanager
+def tramo(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar_etapa(etapa, time.perf_counter() - inicio)
+
+
+def registrar_entrenamiento(tipo, segundos, resultado="ok"):
+    duracion_entrenamientos.observar(segundos, tipo, resultado)
+    observar_etapa("entrenamiento", segundos)
+
+
+def medir_entrenamiento(tipo):
+    """Decorador: registra la duración de un entrenamiento y si produjo modelo (ok, sin_modelo o error)."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = "error"
+            try:
+                model_data = funcion(*args, **kwargs)
+                resultado = "ok" if model_data else "sin_modelo"
+                return model_data
+            finally:
+                registrar_entrenamiento(tipo, time.perf_counter() - inicio, resultado)
+        return envoltura
+    return decorador
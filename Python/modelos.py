@@ -0,0 +1,285 @@
+import importlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from metricas import metricas, tramo
+
+# Ruta para modelos de aprendizaje
+# Usar una ruta relativa al directorio de trabajo actual
+MODELS_DIR = os.path.join(os.getcwd(), "models")
+os.makedirs(MODELS_DIR, exist_ok=True)
+
+# Máximo de delegaciones con artefactos en memoria (0 = sin límite). Con "auto" el límite es el
+# número de delegaciones con modelo en disco al precargar (nunca menos de 32)
+MODEL_CACHE_AUTO = os.getenv("MODEL_CACHE_MAX", "32") == "auto"
+MODEL_CACHE_MAX = 32 if MODEL_CACHE_AUTO else int(os.getenv("MODEL_CACHE_MAX", 32))
+
+# Locks para que una sola petición cargue de disco cada delegación (las delegaciones se reparten entre ellos)
+LOCKS_CARGA = 64
+
+# Artefactos de una delegación; cualquiera puede ser None si no existe el archivo
+ArtefactosDelegacion = namedtuple("ArtefactosDelegacion", ["model_data", "tipos", "ubicaciones"])
+
+# Artefacto versionado: modelo, columnas y distribuciones en un solo archivo
+FORMATO_ARTEFACTO = "prvzu-modelo"
+VERSION_ARTEFACTO = 2
+
+_PATRON_MODELO = re.compile(r"^(?:modelo_delegacion_(\d+)\.pkl|delegacion_(\d+)\.modelo)$")
+
+
+def ruta_artefacto(delegacion_id):
+    return os.path.join(MODELS_DIR, f"delegacion_{delegacion_id}.modelo")
+
+
+# Rutas del formato anterior (tres .pkl por delegación), que se siguen leyendo
+def ruta_modelo(delegacion_id):
+    return os.path.join(MODELS_DIR, f"modelo_delegacion_{delegacion_id}.pkl")
+
+
+def ruta_tipos(delegacion_id):
+    return os.path.join(MODELS_DIR, f"tipos_delegacion_{delegacion_id}.pkl")
+
+
+def ruta_ubicaciones(delegacion_id):
+    return os.path.join(MODELS_DIR, f"ubicaciones_delegacion_{delegacion_id}.pkl")
+
+
+def _mtime(ruta):
+    try:
+        return os.path.getmtime(ruta)
+    except OSError:
+        return None
+
+
+# Fecha de modificación del modelo vigente de una delegación (artefacto o .pkl anterior)
+def mtime_modelo(delegacion_id):
+    return _mtime(ruta_artefacto(delegacion_id)) or _mtime(ruta_modelo(delegacion_id))
+
+
+# Guardar un objeto en disco de forma atómica (archivo temporal + rename)
+# Un proceso que lea a la vez ve el archivo anterior completo o el nuevo completo, nunca uno a medias
+def guardar_atomico(ruta, objeto, serializar=None):
+    fd, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            if serializar:
+                serializar(objeto, file)
+            else:
+                pickle.dump(objeto, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(ruta_tmp, ruta)
+    except Exception:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+
+def guardar_artefacto(delegacion_id, model_data, tipos, ubicaciones):
+    """
+    Escribe el artefacto versionado de una delegación y elimina los .pkl del
+    formato anterior. Se guarda con joblib sin compresión para que los arrays
+    de NumPy puedan abrirse con mmap al cargar.
+    """
+    artefacto = {
+        'formato': FORMATO_ARTEFACTO,
+        'version': VERSION_ARTEFACTO,
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        'model_data': model_data,
+        'tipos': tipos,
+        'ubicaciones': ubicaciones,
+    }
+    import joblib
+    guardar_atomico(ruta_artefacto(delegacion_id), artefacto, serializar=lambda obj, file: joblib.dump(obj, file))
+    for ruta in (ruta_modelo(delegacion_id), ruta_tipos(delegacion_id), ruta_ubicaciones(delegacion_id)):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def cargar_artefacto(delegacion_id):
+    ruta = ruta_artefacto(delegacion_id)
+    if not os.path.exists(ruta):
+        return None
+    import joblib
+    try:
+        # mmap_mode='r': los arrays grandes se leen del archivo mapeado, compartido entre procesos
+        artefacto = joblib.load(ruta, mmap_mode='r')
+    except Exception as e:
+        print(f"❌ Artefacto dañado {os.path.basename(ruta)}: {e}")
+        return None
+    if not isinstance(artefacto, dict) or artefacto.get('formato') != FORMATO_ARTEFACTO:
+        print(f"❌ {os.path.basename(ruta)} no es un artefacto de modelo válido")
+        return None
+    if artefacto.get('version', 0) > VERSION_ARTEFACTO:
+        print(f"❌ {os.path.basename(ruta)} usa la versión {artefacto['version']} del formato, no soportada")
+        return None
+    return ArtefactosDelegacion(artefacto['model_data'], artefacto['tipos'], artefacto['ubicaciones'])
+
+
+def _cargar_pickle(ruta):
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'rb') as file:
+            return pickle.load(file)
+    except Exception as e:
+        print(f"❌ Error al cargar {os.path.basename(ruta)}: {e}")
+        return None
+
+
+# Bibliotecas de ML que se importan en el primer entrenamiento o predicción, no al arrancar:
+# las rutas que solo leen de la base de datos nunca las cargan
+MODULOS_ML = ("numpy", "scipy.sparse", "pandas", "sklearn.ensemble", "joblib", "codificador", "simulacion")
+
+
+def precargar_ml():
+    # Importarlas de antemano (p. ej. en el proceso maestro antes del fork, con PRECARGAR_ML=1)
+    inicio = time.perf_counter()
+    for nombre in MODULOS_ML:
+        importlib.import_module(nombre)
+    duracion = time.perf_counter() - inicio
+    print(f"     Bibliotecas de ML importadas en {duracion:.2f} s")
+    return duracion
+
+
+class RegistroModelos:
+    """
+    Mantiene en memoria el modelo, la distribución de tipos y las ubicaciones
+    de cada delegación para no deserializarlos de disco en cada petición.
+
+    Una entrada se recarga cuando cambia el mtime de alguno de sus archivos o
+    cuando se invalida/publica explícitamente tras un reentrenamiento. Las
+    delegaciones menos usadas se descartan al superar `max_entradas`.
+    """
+
+    def __init__(self, max_entradas=MODEL_CACHE_MAX, ajustar_al_precargar=MODEL_CACHE_AUTO):
+        self.max_entradas = max_entradas
+        self.ajustar_al_precargar = ajustar_al_precargar
+        self._entradas = OrderedDict()  # delegacion_id -> (mtimes, ArtefactosDelegacion)
+        self._lock = threading.Lock()
+        # Locks de carga repartidos por delegación: un número fijo, por muchos ids distintos que lleguen
+        self._locks_carga = [threading.Lock() for _ in range(LOCKS_CARGA)]
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _clave(delegacion_id):
+        return str(delegacion_id)
+
+    @staticmethod
+    def _mtimes(delegacion_id):
+        return (
+            _mtime(ruta_artefacto(delegacion_id)),
+            _mtime(ruta_modelo(delegacion_id)),
+            _mtime(ruta_tipos(delegacion_id)),
+            _mtime(ruta_ubicaciones(delegacion_id)),
+        )
+
+    def _lock_carga(self, clave):
+        return self._locks_carga[hash(clave) % len(self._locks_carga)]
+
+    def _guardar(self, clave, mtimes, artefactos):
+        with self._lock:
+            self._entradas[clave] = (mtimes, artefactos)
+            self._entradas.move_to_end(clave)
+            while self.max_entradas and len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def _vigente(self, clave, mtimes):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] == mtimes:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+        return None
+
+    def obtener(self, delegacion_id):
+        clave = self._clave(delegacion_id)
+        mtimes = self._mtimes(delegacion_id)
+
+        artefactos = self._vigente(clave, mtimes)
+        if artefactos is not None:
+            return artefactos
+
+        # Un solo hilo carga cada delegación; el resto espera y reutiliza el resultado
+        with self._lock_carga(clave):
+            mtimes = self._mtimes(delegacion_id)
+            artefactos = self._vigente(clave, mtimes)
+            if artefactos is not None:
+                return artefactos
+
+            with self._lock:
+                self.fallos += 1
+            with tramo("carga_modelo"):
+                artefactos = cargar_artefacto(delegacion_id)
+                if artefactos is None:
+                    # Formato anterior: tres .pkl por delegación
+                    artefactos = ArtefactosDelegacion(
+                        _cargar_pickle(ruta_modelo(delegacion_id)),
+                        _cargar_pickle(ruta_tipos(delegacion_id)),
+                        _cargar_pickle(ruta_ubicaciones(delegacion_id)),
+                    )
+            self._guardar(clave, mtimes, artefactos)
+            return artefactos
+
+    def publicar(self, delegacion_id, model_data, tipos, ubicaciones):
+        # Sustituye la entrada con artefactos recién entrenados, sin volver a leerlos de disco
+        clave = self._clave(delegacion_id)
+        artefactos = ArtefactosDelegacion(model_data, tipos, ubicaciones)
+        self._guardar(clave, self._mtimes(delegacion_id), artefactos)
+        return artefactos
+
+    def invalidar(self, delegacion_id=None):
+        with self._lock:
+            if delegacion_id is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(self._clave(delegacion_id), None)
+
+    def delegaciones_en_disco(self):
+        ids = []
+        for nombre in os.listdir(MODELS_DIR):
+            coincidencia = _PATRON_MODELO.match(nombre)
+            if coincidencia:
+                ids.append(int(coincidencia.group(1) or coincidencia.group(2)))
+        return sorted(set(ids))
+
+    def precargar(self, delegaciones=None):
+        # Carga anticipada (p. ej. al arrancar) para que la primera petición no pague el unpickle
+        delegaciones = self.delegaciones_en_disco() if delegaciones is None else delegaciones
+        if self.ajustar_al_precargar:
+            # Caben todas las delegaciones reales, y el límite sigue siendo finito
+            with self._lock:
+                self.max_entradas = max(self.max_entradas, len(delegaciones))
+        if self.max_entradas:
+            delegaciones = delegaciones[:self.max_entradas]
+        for delegacion_id in delegaciones:
+            self.obtener(delegacion_id)
+        print(f"     Modelos precargados en memoria: {len(delegaciones)}")
+        return delegaciones
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+
+# Registro único del proceso
+registro = RegistroModelos()
+
+metricas.estadisticas("prvzu_modelos_cache", lambda: registro.estadisticas(), {
+    "aciertos": ("counter", "Modelos servidos desde memoria"),
+    "fallos": ("counter", "Modelos cargados desde disco"),
+    "entradas": ("gauge", "Delegaciones con modelo en memoria"),
+})
@@ -0,0 +1,397 @@
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+
+# El motor de simulación (numpy, pandas, codificador) se importa al generar, no al importar el módulo
+from conexion import get_db_connection, ErrorConexion, POOL_SIZE
+from modelos import registro, mtime_modelo
+from cache_predicciones import cache_predicciones
+from entrenamiento import entrenar_modelo, cola_entrenamiento, ids_delegaciones
+
+# Hilos que calculan en paralelo las predicciones de un lote de delegaciones
+# Nunca más que conexiones tiene el pool del proceso (DB_POOL_SIZE): los hilos sobrantes solo esperarían una
+PREDICCION_LOTE_WORKERS = min(int(os.getenv("PREDICCION_LOTE_WORKERS", min(8, os.cpu_count() or 1))), POOL_SIZE)
+
+
+class ErrorPrediccion(Exception):
+    # Error con el código HTTP que debe devolver la API
+    def __init__(self, mensaje, status=500):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+
+# Cargar modelo existente o entrenar uno nuevo
+def cargar_o_entrenar_modelo(delegacion_id):
+
+    # Verificar si existe un modelo entrenado (el registro lo mantiene en memoria)
+    model_data = registro.obtener(delegacion_id).model_data
+    if model_data:
+        try:
+            # Verificar si el modelo tiene más de 30 días
+            if mtime_modelo(delegacion_id) < (datetime.now() - timedelta(days=30)).timestamp():
+                # Se reentrena en segundo plano; mientras tanto se usa el modelo actual
+                print("⚠️ Modelo existente pero antiguo, reentrenando en segundo plano...")
+                cola_entrenamiento.programar(delegacion_id)
+            return model_data
+        except Exception as e:
+            print(f"❌ Error al cargar modelo existente: {e}")
+
+    # Si no existe o hubo error, entrenar nuevo modelo
+    return entrenar_modelo(delegacion_id)
+
+# Versión del modelo con la que se calcula (y se cachea) una predicción
+def version_modelo(delegacion_id, model_data):
+    if not model_data:
+        return "sin-modelo"
+    if model_data.get('version'):
+        return model_data['version']
+    # Modelos guardados antes de versionarlos: se identifican por la fecha del archivo
+    return f"mtime-{int(mtime_modelo(delegacion_id) or 0)}"
+
+# Semilla determinista: la misma delegación, fecha, periodo y modelo dan siempre las mismas predicciones
+def semilla_prediccion(delegacion_id, fecha_base, periodo, version):
+    clave = f"{delegacion_id}|{fecha_base}|{periodo}|{version}".encode()
+    return int.from_bytes(hashlib.sha256(clave).digest()[:8], "big")
+
+# Serialización idéntica a la de jsonify (claves ordenadas, sin espacios)
+def serializar_predicciones(predicciones):
+    return json.dumps(predicciones, sort_keys=True, separators=(",", ":")) + "\n"
+
+# Ids de delegación ya confirmados en la base de datos. Solo crece con delegaciones reales,
+# así que un id inventado nunca llega al registro de modelos ni a la cache de predicciones
+_delegaciones_conocidas = set()
+_delegaciones_lock = threading.Lock()
+
+# Las delegaciones de `delegaciones` (enteros) que existen; solo se consultan las que aún no se conocen
+def delegaciones_existentes(delegaciones):
+    with _delegaciones_lock:
+        faltan = [d for d in delegaciones if d not in _delegaciones_conocidas]
+    if faltan:
+        try:
+            conn = get_db_connection()
+        except ErrorConexion:
+            raise ErrorPrediccion("No se pudo conectar a la base de datos", 500)
+        cursor = conn.cursor()
+        try:
+            marcadores = ", ".join(["%s"] * len(faltan))
+            cursor.execute(f"SELECT id FROM delegaciones WHERE id IN ({marcadores})", tuple(faltan))
+            encontradas = {fila[0] for fila in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+        with _delegaciones_lock:
+            _delegaciones_conocidas.update(encontradas)
+    with _delegaciones_lock:
+        return [d for d in delegaciones if d in _delegaciones_conocidas]
+
+# Id de delegación de la petición como entero; ErrorPrediccion 400 si no es un número y 404 si no existe
+def validar_delegacion(delegacion_id):
+    try:
+        delegacion_id = int(delegacion_id)
+    except (TypeError, ValueError):
+        raise ErrorPrediccion("delegacion_id inválido", 400)
+    if not delegaciones_existentes([delegacion_id]):
+        raise ErrorPrediccion("Delegación no encontrada", 404)
+    return delegacion_id
+
+# Predicción ya guardada en la cache para la versión vigente del modelo, o None
+def prediccion_en_cache(delegacion_id, fecha_base, periodo):
+    model_data = registro.obtener(delegacion_id).model_data
+    if not model_data:
+        return None
+    return cache_predicciones.obtener(delegacion_id, fecha_base, periodo, version_modelo(delegacion_id, model_data))
+
+# Calcular, serializar y guardar en la cache las predicciones de un periodo
+def calcular_y_guardar(delegacion_id, fecha_base, periodo, compartidos=None):
+    predicciones, version = calcular_prediccion(delegacion_id, fecha_base, periodo, compartidos)
+    payload = serializar_predicciones(predicciones)
+    # Sin modelo las predicciones son provisionales: no se guardan
+    if version != "sin-modelo":
+        cache_predicciones.guardar(delegacion_id, fecha_base, periodo, version, payload)
+    return payload
+
+# Predicciones de un periodo futuro como JSON ya serializado, desde la cache si es posible
+def obtener_prediccion(delegacion_id, fecha_base, periodo):
+    # Antes de tocar el registro de modelos o la cache, que se indexan por este id
+    delegacion_id = validar_delegacion(delegacion_id)
+    payload = prediccion_en_cache(delegacion_id, fecha_base, periodo)
+    if payload is not None:
+        return payload
+    return calcular_y_guardar(delegacion_id, fecha_base, periodo)
+
+# Datos comunes a las predicciones de varias delegaciones, con una sola conexión:
+# ({id: nombre} de las delegaciones que existen, {id: nivel de riesgo})
+def datos_compartidos(delegaciones):
+    try:
+        conn = get_db_connection()
+    except ErrorConexion:
+        raise ErrorPrediccion("No se pudo conectar a la base de datos", 500)
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        marcadores = ", ".join(["%s"] * len(delegaciones))
+        cursor.execute(f"SELECT id, nombre FROM delegaciones WHERE id IN ({marcadores})", tuple(delegaciones))
+        nombres = {str(fila['id']): fila['nombre'] for fila in cursor.fetchall()}
+
+        # Obtener los niveles de riesgo y crear el mapa de ID a nivel de riesgo
+        cursor.execute("SELECT id, nombre, codigo_color FROM niveles_riesgo ORDER BY id")
+        riesgo_map = {nivel['id']: nivel for nivel in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+    return nombres, riesgo_map
+
+# Distribuciones de una delegación sin artefactos guardados, leídas de la base de datos
+def _distribuciones_desde_bd(delegacion_id, tipos_incidentes, ubicaciones):
+    try:
+        conn = get_db_connection()
+    except ErrorConexion:
+        raise ErrorPrediccion("No se pudo conectar a la base de datos", 500)
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if tipos_incidentes is None:
+            cursor.execute("""
+                SELECT tipo, COUNT(*) as count
+                FROM incidentes
+                WHERE delegacion_id = %s
+                GROUP BY tipo
+                ORDER BY count DESC, tipo
+                LIMIT 10
+            """, (delegacion_id,))
+            tipos_incidentes = {row['tipo']: row['count'] for row in cursor.fetchall()}
+
+        if ubicaciones is None:
+            # Orden fijo para que la semilla reproduzca el resultado
+            cursor.execute("""
+                SELECT ubicacion
+                FROM incidentes
+                WHERE delegacion_id = %s
+                GROUP BY ubicacion
+                ORDER BY COUNT(*) DESC, ubicacion
+                LIMIT 20
+            """, (delegacion_id,))
+            ubicaciones = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return tipos_incidentes, ubicaciones
+
+# Modelo, distribuciones y niveles de riesgo con los que se simula una delegación:
+# (tipos_incidentes, ubicaciones, riesgo_map, model_data, version)
+# `compartidos`: resultado de datos_compartidos() si ya se consultó para varias delegaciones
+def contexto_prediccion(delegacion_id, compartidos=None):
+    nombres, riesgo_map = compartidos or datos_compartidos([delegacion_id])
+    nombre = nombres.get(str(delegacion_id))
+    if nombre is None:
+        raise ErrorPrediccion("Delegación no encontrada", 404)
+
+    # Cargar o entrenar modelo para esta delegación
+    model_data = cargar_o_entrenar_modelo(delegacion_id)
+    version = version_modelo(delegacion_id, model_data)
+
+    # Cargar distribuciones de tipos y ubicaciones (desde el registro en memoria)
+    artefactos = registro.obtener(delegacion_id)
+    tipos_incidentes = artefactos.tipos
+    ubicaciones = None
+    if artefactos.ubicaciones is not None:
+        ubicaciones = [{"ubicacion": ubicacion} for ubicacion in artefactos.ubicaciones.keys()]
+    if tipos_incidentes is None or ubicaciones is None:
+        # Si no existen, obtenerlas de la base de datos
+        tipos_incidentes, ubicaciones = _distribuciones_desde_bd(delegacion_id, tipos_incidentes, ubicaciones)
+
+    # Si no hay ubicaciones, crear algunas genéricas
+    if not ubicaciones:
+        ubicaciones = [
+            {"ubicacion": f"Calle Principal {i}, {nombre}"}
+            for i in range(1, 6)
+        ]
+
+    # Si no hay tipos de incidentes, crear algunos genéricos
+    if not tipos_incidentes:
+        tipos_incidentes = {
+            "Asalto a transeúnte": 10,
+            "Robo de vehículo": 8,
+            "Asalto a negocio": 6,
+            "Robo a casa habitación": 5,
+            "Asalto con violencia": 4
+        }
+
+    return tipos_incidentes, ubicaciones, riesgo_map, model_data, version
+
+# Función mejorada para generar predicciones de incidentes
+def calcular_prediccion(delegacion_id, fecha_base, periodo, compartidos=None):
+    tipos_incidentes, ubicaciones, riesgo_map, model_data, version = contexto_prediccion(delegacion_id, compartidos)
+
+    # Generar predicciones según el periodo
+    semilla = semilla_prediccion(delegacion_id, fecha_base, periodo, version)
+    predicciones = generar_predicciones(fecha_base, periodo, tipos_incidentes, ubicaciones, riesgo_map, model_data, semilla)
+
+    return predicciones, version
+
+# Bandas de percentiles de `escenarios` simulaciones del periodo (reproducibles, como las predicciones)
+def calcular_pronostico(delegacion_id, fecha_base, periodo, escenarios):
+    import numpy as np
+    from simulacion import MotorSimulacion, PERCENTILES
+
+    delegacion_id = validar_delegacion(delegacion_id)
+    tipos_incidentes, ubicaciones, riesgo_map, model_data, version = contexto_prediccion(delegacion_id)
+    motor = MotorSimulacion(tipos_incidentes, ubicaciones, riesgo_map, model_data)
+    rng = np.random.default_rng(semilla_prediccion(delegacion_id, fecha_base, f"{periodo}|{escenarios}", version))
+    pronostico = {
+        "delegacion_id": delegacion_id,
+        "fecha": fecha_base,
+        "periodo": periodo,
+        "escenarios": escenarios,
+        "percentiles": list(PERCENTILES),
+        "version_modelo": version,
+    }
+    pronostico.update(motor.pronostico(fecha_base, periodo, rng, escenarios))
+    return pronostico
+
+# Generar las predicciones de un periodo con el motor de simulación (un escenario)
+# `rng`: semilla o numpy.random.Generator; sin ella el resultado es aleatorio
+def generar_predicciones(fecha_base, periodo, tipos_incidentes, ubicaciones, riesgo_map, model_data, rng=None):
+    import numpy as np
+    from simulacion import MotorSimulacion
+
+    motor = MotorSimulacion(tipos_incidentes, ubicaciones, riesgo_map, model_data)
+    return motor.predicciones(fecha_base, periodo, np.random.default_rng(rng))
+
+_ejecutor_lote = None
+_ejecutor_lote_lock = threading.Lock()
+
+def _ejecutor():
+    # Pool compartido por todas las peticiones de lote; se crea en la primera (no al importar, por el fork)
+    global _ejecutor_lote
+    with _ejecutor_lote_lock:
+        if _ejecutor_lote is None:
+            _ejecutor_lote = ThreadPoolExecutor(max_workers=PREDICCION_LOTE_WORKERS, thread_name_prefix="prediccion-lote")
+        return _ejecutor_lote
+
+# Versión del modelo de una delegación (lo carga en el registro si hace falta), o None sin modelo
+def _version_delegacion(delegacion_id):
+    model_data = registro.obtener(delegacion_id).model_data
+    return version_modelo(delegacion_id, model_data) if model_data else None
+
+def obtener_predicciones_lote(delegaciones, fecha_base, periodo):
+    """
+    Predicciones del mismo periodo para varias delegaciones.
+
+    Los modelos se cargan en paralelo y la cache se consulta con una sola
+    consulta para todas las delegaciones. Para las que faltan, los nombres de
+    delegación y los niveles de riesgo se consultan una sola vez y la inferencia
+    de cada delegación se ejecuta en paralelo (PREDICCION_LOTE_WORKERS hilos).
+    Devuelve ({id: JSON ya serializado}, {id: ErrorPrediccion}). Sin
+    `delegaciones`, todas.
+    """
+    if delegaciones is None:
+        try:
+            delegaciones = ids_delegaciones()
+        except Exception as e:
+            raise ErrorPrediccion(f"No se pudieron listar las delegaciones: {e}", 500)
+
+    # Las que no existen no llegan al registro de modelos ni a la cache
+    existentes = delegaciones_existentes(delegaciones)
+    errores = {d: ErrorPrediccion("Delegación no encontrada", 404) for d in delegaciones if d not in existentes}
+    delegaciones = existentes
+
+    # copy_context: las etapas medidas en cada hilo se atribuyen a esta petición
+    futuros = {
+        delegacion_id: _ejecutor().submit(contextvars.copy_context().run, _version_delegacion, delegacion_id)
+        for delegacion_id in delegaciones
+    }
+    versiones = {}
+    for delegacion_id, futuro in futuros.items():
+        try:
+            version = futuro.result()
+        except Exception as e:
+            # Sin versión no hay cache; el cálculo de abajo devuelve el error de la delegación
+            print(f"⚠️ No se pudo cargar el modelo de la delegación {delegacion_id}: {e}")
+            continue
+        if version:
+            versiones[delegacion_id] = version
+
+    payloads = cache_predicciones.obtener_lote(versiones, fecha_base, periodo)
+    pendientes = [delegacion_id for delegacion_id in delegaciones if delegacion_id not in payloads]
+    if not pendientes:
+        return payloads, errores
+
+    compartidos = datos_compartidos(pendientes)
+    futuros = {
+        delegacion_id: _ejecutor().submit(
+            contextvars.copy_context().run, calcular_y_guardar, delegacion_id, fecha_base, periodo, compartidos
+        )
+        for delegacion_id in pendientes
+    }
+    for delegacion_id, futuro in futuros.items():
+        try:
+            payloads[delegacion_id] = futuro.result()
+        except ErrorPrediccion as e:
+            errores[delegacion_id] = e
+        except Exception as e:
+            print(f"❌ Error al predecir la delegación {delegacion_id}: {e}")
+            errores[delegacion_id] = ErrorPrediccion(f"Error al calcular la predicción: {e}", 500)
+    return payloads, errores
+
+# Respuesta del lote como JSON, incrustando las predicciones ya serializadas sin volver a decodificarlas
+# Mismo formato que jsonify: claves ordenadas y sin espacios
+def serializar_lote(fecha_base, periodo, payloads, errores):
+    def objeto(pares):
+        return "{" + ",".join(f"{json.dumps(str(clave))}:{valor}" for clave, valor in sorted(pares, key=lambda p: str(p[0]))) + "}"
+
+    errores_json = objeto(
+        (d, json.dumps({"error": e.mensaje, "status": e.status}, sort_keys=True, separators=(",", ":")))
+        for d, e in errores.items()
+    )
+    predicciones_json = objeto((d, payload.rstrip("\n")) for d, payload in payloads.items())
+    return (f'{{"errores":{errores_json},"fecha":{json.dumps(fecha_base)},'
+            f'"periodo":{json.dumps(periodo)},"predicciones":{predicciones_json}}}\n')
+
+# Fechas futuras más consultadas: los próximos días, las próximas semanas (desde el lunes) y los próximos meses
+def fechas_a_pregenerar(dias=7, semanas=4, meses=2, hoy=None):
+    hoy = hoy or date.today()
+    fechas = [("day", (hoy + timedelta(days=i)).isoformat()) for i in range(1, dias + 1)]
+    proximo_lunes = hoy + timedelta(days=7 - hoy.weekday())
+    fechas += [("week", (proximo_lunes + timedelta(weeks=i)).isoformat()) for i in range(semanas)]
+    year, month = hoy.year, hoy.month
+    for _ in range(meses):
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        fechas.append(("month", f"{year:04d}-{month:02d}"))
+    return fechas
+
+# Trabajo nocturno: calcular de antemano las predicciones futuras de cada delegación
+def pregenerar(delegaciones=None, dias=7, semanas=4, meses=2):
+    delegaciones = ids_delegaciones() if delegaciones is None else delegaciones
+    fechas = fechas_a_pregenerar(dias, semanas, meses)
+    generadas, errores = 0, 0
+    for delegacion_id in delegaciones:
+        for periodo, fecha in fechas:
+            try:
+                obtener_prediccion(delegacion_id, fecha, periodo)
+                generadas += 1
+            except Exception as e:
+                errores += 1
+                print(f"❌ Error al pregenerar {periodo} {fecha} de la delegación {delegacion_id}: {e}")
+    print(f"     Predicciones pregeneradas: {generadas} ({len(delegaciones)} delegaciones), errores: {errores}")
+    return {"generadas": generadas, "errores": errores, "delegaciones": len(delegaciones)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pregenerar la cache de predicciones futuras (trabajo nocturno)")
+    parser.add_argument("--pregenerar", action="store_true", required=True)
+    parser.add_argument("--delegaciones", type=int, nargs="+", help="ids de delegación (por defecto, todas)")
+    parser.add_argument("--dias", type=int, default=7, help="próximos días a pregenerar")
+    parser.add_argument("--semanas", type=int, default=4, help="próximas semanas (a partir del lunes)")
+    parser.add_argument("--meses", type=int, default=2, help="próximos meses")
+    args = parser.parse_args()
+
+    pregenerar(args.delegaciones, dias=args.dias, semanas=args.semanas, meses=args.meses)
@@ -0,0 +1,63 @@
+import argparse
+
+from conexion import conexion_bd
+
+# Error de MySQL cuando la tabla no existe (migración sql/002 sin aplicar)
+ER_NO_SUCH_TABLE = 1146
+
+
+# El resumen lo mantienen al día los triggers de incidentes (sql/002_resumen_diario_incidentes.sql);
+# reconstruir() solo hace falta al instalarlos sobre datos existentes o si cambian los colores de los niveles
+
+# Reconstruir el resumen a partir de la tabla incidentes (completo o desde una fecha / para una delegación)
+def reconstruir(delegacion_id=None, desde=None):
+    condiciones, parametros = [], []
+    if delegacion_id is not None:
+        condiciones.append("delegacion_id = %s")
+        parametros.append(delegacion_id)
+    if desde is not None:
+        condiciones.append("fecha >= %s")
+        parametros.append(desde)
+    where_resumen = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    where_incidentes = where_resumen.replace("fecha >=", "i.fecha_incidente >=").replace("delegacion_id =", "i.delegacion_id =")
+
+    with conexion_bd() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM incidentes_resumen_diario {where_resumen}", parametros)
+            cursor.execute(f"""
+                INSERT INTO incidentes_resumen_diario (delegacion_id, fecha, codigo_color, total)
+                SELECT
+                    i.delegacion_id,
+                    i.fecha_incidente,
+                    COALESCE(nr.codigo_color, ''),
+                    COUNT(*)
+                FROM
+                    incidentes i
+                LEFT JOIN
+                    niveles_riesgo nr ON i.nivel_riesgo_id = nr.id
+                {where_incidentes}
+                GROUP BY
+                    i.delegacion_id, i.fecha_incidente, COALESCE(nr.codigo_color, '')
+            """, parametros)
+            filas = cursor.rowcount
+            conn.commit()
+            return filas
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Reconstrucción desde la línea de comandos:
+#   python resumen_diario.py --backfill [--delegacion 3] [--desde 2024-01-01]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruir el resumen diario de incidentes")
+    parser.add_argument("--backfill", action="store_true", required=True, help="recalcular desde la tabla incidentes")
+    parser.add_argument("--delegacion", type=int, default=None, help="solo esta delegación")
+    parser.add_argument("--desde", default=None, help="solo desde esta fecha (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    filas = reconstruir(args.delegacion, args.desde)
+    print(f"     Resumen diario reconstruido: {filas} filas")
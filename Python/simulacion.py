@@ -0,0 +1,210 @@
+import calendar
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from codificador import codificador_de
+from metricas import tramo
+
+# Incidentes simulados por día según el periodo: (mínimo, máximo)
+INCIDENTES_POR_DIA = {"day": (3, 8), "week": (2, 6), "month": (1, 5)}
+
+# Pesos por hora del día para modelos entrenados antes de aprenderlos del historial
+PESOS_HORA_POR_DEFECTO = [3, 2, 1, 1, 1, 2, 3, 5, 7, 6, 5, 6, 7, 6, 5, 6, 7, 8, 10, 12, 15, 13, 10, 5]
+
+# Incidentes ficticios que se suman a cada hora del historial para que ninguna tenga probabilidad cero
+SUAVIZADO_HORA = 1
+
+# Percentiles de las bandas de /pronostico
+PERCENTILES = (10, 50, 90)
+
+# Incidentes simulados de uno o varios escenarios, como arrays paralelos de índices
+Muestras = namedtuple("Muestras", ["escenario", "dia", "tipo", "ubicacion", "hora", "minuto"])
+
+
+# Días del periodo (day: uno, week: siete desde la fecha, month: todos los del mes)
+def dias_del_periodo(fecha_base, periodo):
+    if periodo == "month":
+        year, month = map(int, fecha_base.split('-')[:2])
+        return [datetime(year, month, i + 1) for i in range(calendar.monthrange(year, month)[1])]
+    fecha_base_obj = datetime.strptime(fecha_base, "%Y-%m-%d")
+    if periodo == "week":
+        return [fecha_base_obj + timedelta(days=i) for i in range(7)]
+    if periodo == "day":
+        return [fecha_base_obj]
+    return []
+
+
+# Probabilidad de cada hora del día: la distribución histórica de la delegación (o la genérica)
+def probabilidades_hora(model_data):
+    pesos = (model_data or {}).get('pesos_hora')
+    pesos = np.asarray(pesos if pesos else PESOS_HORA_POR_DEFECTO, dtype=float) + SUAVIZADO_HORA
+    return pesos / pesos.sum()
+
+
+class MotorSimulacion:
+    """
+    Simulación Monte Carlo de los incidentes de un periodo futuro.
+
+    Muestrea con un numpy.random.Generator todos los incidentes de todos los
+    escenarios a la vez: número por día, tipo (según su frecuencia), ubicación,
+    hora (según la distribución horaria de la delegación) y minuto. El modelo
+    solo evalúa las combinaciones distintas de sus variables, que dejan de
+    crecer al aumentar los escenarios; por eso muchos escenarios cuestan casi
+    lo mismo que uno.
+    """
+
+    def __init__(self, tipos_incidentes, ubicaciones, riesgo_map, model_data):
+        self.tipos = list(tipos_incidentes.keys())
+        pesos_tipos = np.asarray(list(tipos_incidentes.values()), dtype=float)
+        self.prob_tipos = pesos_tipos / pesos_tipos.sum()
+        self.ubicaciones = [u['ubicacion'] for u in ubicaciones]
+        self.prob_horas = probabilidades_hora(model_data)
+        self.riesgo_map = riesgo_map
+        self.niveles = list(riesgo_map.values())
+        self.model_data = model_data
+
+    def muestrear(self, fechas, periodo, rng, escenarios=1):
+        minimo, maximo = INCIDENTES_POR_DIA[periodo]
+        conteos = rng.integers(minimo, maximo + 1, size=(escenarios, len(fechas)))
+        n = int(conteos.sum())
+        return Muestras(
+            escenario=np.repeat(np.arange(escenarios), conteos.sum(axis=1)),
+            dia=np.repeat(np.tile(np.arange(len(fechas)), escenarios), conteos.ravel()),
+            tipo=rng.choice(len(self.tipos), size=n, p=self.prob_tipos),
+            ubicacion=rng.integers(len(self.ubicaciones), size=n),
+            hora=rng.choice(24, size=n, p=self.prob_horas),
+            minuto=rng.integers(60, size=n),
+        )
+
+    def probabilidades_riesgo(self, muestras, fechas):
+        """
+        Probabilidad de cada nivel de riesgo (columnas en el orden de
+        self.niveles) para cada incidente, o None si no hay modelo o falla.
+        """
+        if not self.model_data or not len(muestras.dia):
+            return None
+        import pandas as pd
+        try:
+            model = self.model_data['model']
+            dia_semana = np.array([f.weekday() + 1 for f in fechas])  # 1-7 para día de la semana
+            mes = np.array([f.month for f in fechas])
+            # Evaluar cada combinación distinta (día de la semana, mes, hora, tipo, ubicación) una sola vez
+            clave_dia = (dia_semana * 13 + mes)[muestras.dia]
+            clave = ((clave_dia * 24 + muestras.hora) * len(self.tipos) + muestras.tipo) * len(self.ubicaciones) \
+                + muestras.ubicacion
+            _, unicos, inversa = np.unique(clave, return_index=True, return_inverse=True)
+
+            # Modelos del formato anterior: entrenados con un DataFrame de pd.get_dummies
+            con_nombres = hasattr(model, 'feature_names_in_')
+            X = codificador_de(self.model_data).transformar({
+                'hora': muestras.hora[unicos].tolist(),
+                'dia_semana': dia_semana[muestras.dia[unicos]].tolist(),
+                'mes': mes[muestras.dia[unicos]].tolist(),
+                'tipo': [self.tipos[i] for i in muestras.tipo[unicos]],
+                'ubicacion': [self.ubicaciones[i] for i in muestras.ubicacion[unicos]],
+            }, disperso=False if con_nombres else None)
+            if con_nombres:
+                X = pd.DataFrame(X, columns=model.feature_names_in_)
+            with tramo("inferencia"):
+                probabilidades = model.predict_proba(X)
+
+            # Reordenar las clases del modelo según los niveles; las que no existen se reparten entre todos
+            por_nivel = np.zeros((len(unicos), len(self.niveles)))
+            ids_niveles = [nivel['id'] for nivel in self.niveles]
+            for columna, nivel_id in enumerate(model.classes_):
+                if nivel_id in self.riesgo_map:
+                    por_nivel[:, ids_niveles.index(nivel_id)] += probabilidades[:, columna]
+                else:
+                    por_nivel += probabilidades[:, [columna]] / len(self.niveles)
+            return por_nivel[inversa.ravel()]
+        except Exception as e:
+            print(f"❌ Error al usar modelo para predicción: {e}")
+            return None
+
+    def niveles_mas_probables(self, muestras, fechas, rng):
+        # Índice en self.niveles del nivel que predice el modelo; al azar sin modelo
+        probabilidades = self.probabilidades_riesgo(muestras, fechas)
+        if probabilidades is None:
+            return rng.integers(len(self.niveles), size=len(muestras.dia))
+        return probabilidades.argmax(axis=1)
+
+    def niveles_muestreados(self, muestras, fechas, rng):
+        # Índice en self.niveles muestreado de la probabilidad del modelo (para escenarios)
+        probabilidades = self.probabilidades_riesgo(muestras, fechas)
+        if probabilidades is None:
+            return rng.integers(len(self.niveles), size=len(muestras.dia))
+        acumuladas = probabilidades.cumsum(axis=1)
+        sorteo = rng.random(len(muestras.dia))[:, None] * acumuladas[:, -1:]
+        return np.minimum((sorteo >= acumuladas).sum(axis=1), len(self.niveles) - 1)
+
+    def predicciones(self, fecha_base, periodo, rng):
+        """Un escenario como lista de incidentes (el formato de /incidentes), ordenada por fecha y hora."""
+        fechas = dias_del_periodo(fecha_base, periodo)
+        if not fechas:
+            return []
+        muestras = self.muestrear(fechas, periodo, rng)
+        niveles = self.niveles_mas_probables(muestras, fechas, rng)
+        ids = rng.integers(10000, 100000, size=len(niveles))
+
+        orden = np.lexsort((muestras.minuto, muestras.hora, muestras.dia))
+        textos_fecha = [f.strftime("%Y-%m-%d") for f in fechas]
+        predicciones = []
+        for i in orden.tolist():
+            nivel_riesgo = self.niveles[niveles[i]]
+            predicciones.append({
+                'id': f"pred-{ids[i]}",
+                'tipo': self.tipos[muestras.tipo[i]],
+                'ubicacion': self.ubicaciones[muestras.ubicacion[i]],
+                'hora': f"{muestras.hora[i]:02d}:{muestras.minuto[i]:02d}",
+                'riesgo': nivel_riesgo['nombre'],
+                'codigo_color': nivel_riesgo['codigo_color'],
+                'fecha': textos_fecha[muestras.dia[i]],
+                'es_prediccion': True
+            })
+        return predicciones
+
+    def pronostico(self, fecha_base, periodo, rng, escenarios):
+        """
+        Bandas de percentiles (PERCENTILES) y media sobre `escenarios`
+        simulaciones: total del periodo, por día (total y por color de riesgo),
+        por tipo y por hora del día.
+        """
+        fechas = dias_del_periodo(fecha_base, periodo)
+        muestras = self.muestrear(fechas, periodo, rng, escenarios)
+        niveles = self.niveles_muestreados(muestras, fechas, rng)
+
+        # Conteos por escenario con bincount: (escenarios, categorías)
+        def conteos(indices, categorias):
+            return np.bincount(muestras.escenario * categorias + indices,
+                               minlength=escenarios * categorias).reshape(escenarios, categorias)
+
+        n_dias, n_niveles = len(fechas), len(self.niveles)
+        por_dia_nivel = conteos(muestras.dia * n_niveles + niveles, n_dias * n_niveles).reshape(
+            escenarios, n_dias, n_niveles)
+        por_dia = por_dia_nivel.sum(axis=2)
+        por_tipo = conteos(muestras.tipo, len(self.tipos))
+        por_hora = conteos(muestras.hora, 24)
+
+        colores = [nivel['codigo_color'] for nivel in self.niveles]
+        return {
+            "total": bandas(por_dia.sum(axis=1)),
+            "por_dia": [
+                {
+                    "fecha": fecha.strftime("%Y-%m-%d"),
+                    "total": bandas(por_dia[:, d]),
+                    "por_color": {colores[k]: bandas(por_dia_nivel[:, d, k]) for k in range(n_niveles)},
+                }
+                for d, fecha in enumerate(fechas)
+            ],
+            "por_tipo": {tipo: bandas(por_tipo[:, t]) for t, tipo in enumerate(self.tipos)},
+            "por_hora": [bandas(por_hora[:, h]) for h in range(24)],
+        }
+
+
+# Percentiles y media de un conteo a lo largo de los escenarios
+def bandas(valores):
+    resultado = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(valores, PERCENTILES))}
+    resultado["media"] = round(float(valores.mean()), 2)
+    return resultado
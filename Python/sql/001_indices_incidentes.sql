@@ -0,0 +1,32 @@
+-- Índices para las consultas frecuentes sobre `incidentes` y `predicciones_confirmadas`.
+-- Idempotente: solo crea los índices que no existan.
+--
+--   mysql -h $DATABASE_HOST -u $DATABASE_USERNAME -p $DATABASE < sql/001_indices_incidentes.sql
+
+DROP PROCEDURE IF EXISTS crear_indice_si_no_existe;
+
+DELIMITER $$
+CREATE PROCEDURE crear_indice_si_no_existe(IN tabla VARCHAR(64), IN indice VARCHAR(64), IN columnas VARCHAR(255))
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = tabla AND index_name = indice
+    ) THEN
+        SET @ddl = CONCAT('CREATE INDEX ', indice, ' ON ', tabla, ' (', columnas, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+DELIMITER ;
+
+-- /incidentes (day/week/month), /api/zonas_riesgo y el entrenamiento:
+-- filtran por delegación y rango de fechas y ordenan por fecha y hora
+CALL crear_indice_si_no_existe('incidentes', 'idx_incidentes_delegacion_fecha_hora',
+                               'delegacion_id, fecha_incidente, hora_incidente');
+
+-- Distribución de tipos por delegación (GROUP BY tipo)
+CALL crear_indice_si_no_existe('incidentes', 'idx_incidentes_delegacion_tipo',
+                               'delegacion_id, tipo');
+
+DROP PROCEDURE crear_indice_si_no_existe;
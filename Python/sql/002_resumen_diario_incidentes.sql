@@ -0,0 +1,66 @@
+-- Resumen diario de incidentes por delegación y color de riesgo.
+-- Lo mantienen los triggers de `incidentes` de este archivo (INSERT, UPDATE y DELETE por cualquier vía).
+-- Al aplicarlo sobre una base con datos, o si cambia el codigo_color de un nivel de riesgo, se reconstruye con:
+--   python resumen_diario.py --backfill
+--
+--   mysql -h $DATABASE_HOST -u $DATABASE_USERNAME -p $DATABASE < sql/002_resumen_diario_incidentes.sql
+
+CREATE TABLE IF NOT EXISTS incidentes_resumen_diario (
+    delegacion_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    codigo_color VARCHAR(20) NOT NULL DEFAULT '',  -- '' = incidente sin nivel de riesgo
+    total INT UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (delegacion_id, fecha, codigo_color),
+    KEY idx_resumen_fecha (fecha)
+);
+
+DROP TRIGGER IF EXISTS trg_incidentes_resumen_insert;
+DROP TRIGGER IF EXISTS trg_incidentes_resumen_update;
+DROP TRIGGER IF EXISTS trg_incidentes_resumen_delete;
+DROP PROCEDURE IF EXISTS resumen_diario_sumar;
+
+DELIMITER $$
+-- Sumar (p_delta = 1) o restar (p_delta = -1) un incidente al resumen de su delegación, día y color
+CREATE PROCEDURE resumen_diario_sumar(IN p_delegacion_id INT, IN p_fecha DATE, IN p_nivel_riesgo_id INT, IN p_delta INT)
+BEGIN
+    DECLARE v_codigo_color VARCHAR(20);
+    SET v_codigo_color = COALESCE((SELECT codigo_color FROM niveles_riesgo WHERE id = p_nivel_riesgo_id), '');
+
+    IF p_delta > 0 THEN
+        INSERT INTO incidentes_resumen_diario (delegacion_id, fecha, codigo_color, total)
+        VALUES (p_delegacion_id, p_fecha, v_codigo_color, p_delta)
+        ON DUPLICATE KEY UPDATE total = total + p_delta;
+    ELSE
+        -- GREATEST evita el desbordamiento del UNSIGNED si el resumen aún no se había reconstruido
+        UPDATE incidentes_resumen_diario
+        SET total = GREATEST(total, -p_delta) + p_delta
+        WHERE delegacion_id = p_delegacion_id AND fecha = p_fecha AND codigo_color = v_codigo_color;
+        DELETE FROM incidentes_resumen_diario
+        WHERE delegacion_id = p_delegacion_id AND fecha = p_fecha AND codigo_color = v_codigo_color AND total = 0;
+    END IF;
+END$$
+
+CREATE TRIGGER trg_incidentes_resumen_insert AFTER INSERT ON incidentes
+FOR EACH ROW
+BEGIN
+    CALL resumen_diario_sumar(NEW.delegacion_id, NEW.fecha_incidente, NEW.nivel_riesgo_id, 1);
+END$$
+
+CREATE TRIGGER trg_incidentes_resumen_update AFTER UPDATE ON incidentes
+FOR EACH ROW
+BEGIN
+    -- Solo si cambia la clave del resumen (otras columnas no afectan a los conteos)
+    IF NOT (OLD.delegacion_id <=> NEW.delegacion_id
+            AND OLD.fecha_incidente <=> NEW.fecha_incidente
+            AND OLD.nivel_riesgo_id <=> NEW.nivel_riesgo_id) THEN
+        CALL resumen_diario_sumar(OLD.delegacion_id, OLD.fecha_incidente, OLD.nivel_riesgo_id, -1);
+        CALL resumen_diario_sumar(NEW.delegacion_id, NEW.fecha_incidente, NEW.nivel_riesgo_id, 1);
+    END IF;
+END$$
+
+CREATE TRIGGER trg_incidentes_resumen_delete AFTER DELETE ON incidentes
+FOR EACH ROW
+BEGIN
+    CALL resumen_diario_sumar(OLD.delegacion_id, OLD.fecha_incidente, OLD.nivel_riesgo_id, -1);
+END$$
+DELIMITER ;
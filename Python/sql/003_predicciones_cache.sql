@@ -0,0 +1,16 @@
+-- Cache compartida de predicciones futuras, por delegación, periodo, fecha y versión del modelo.
+-- La llenan la API y el trabajo nocturno:
+--   python prediccion.py --pregenerar --dias 7 --semanas 4 --meses 2
+--
+--   mysql -h $DATABASE_HOST -u $DATABASE_USERNAME -p $DATABASE < sql/003_predicciones_cache.sql
+
+CREATE TABLE IF NOT EXISTS predicciones_cache (
+    delegacion_id INT NOT NULL,
+    periodo VARCHAR(10) NOT NULL,            -- day, week o month
+    fecha VARCHAR(10) NOT NULL,              -- YYYY-MM-DD (day/week) o YYYY-MM (month)
+    version_modelo VARCHAR(40) NOT NULL,
+    payload MEDIUMTEXT NOT NULL,             -- respuesta JSON ya serializada
+    creado TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (delegacion_id, periodo, fecha, version_modelo),
+    KEY idx_predicciones_cache_creado (creado)
+);
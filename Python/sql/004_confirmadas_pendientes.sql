@@ -0,0 +1,47 @@
+-- /migrar_predicciones recorre las predicciones confirmadas pendientes en lotes por id:
+--   WHERE confirmado = TRUE AND migrado = FALSE AND id > ? ORDER BY id LIMIT ?
+-- Con este índice cada lote lee solo sus filas, sin ordenar todas las pendientes.
+-- Sustituye a idx_confirmadas_confirmado_migrado (confirmado, migrado, delegacion_id), que ya no usa
+-- ninguna consulta y cuyo prefijo cubre este índice: se elimina si una versión anterior de 001 lo creó.
+-- Idempotente: solo crea el índice si no existe y solo elimina el anterior si existe.
+--
+--   mysql -h $DATABASE_HOST -u $DATABASE_USERNAME -p $DATABASE < sql/004_confirmadas_pendientes.sql
+
+DROP PROCEDURE IF EXISTS crear_indice_si_no_existe;
+
+DELIMITER $$
+CREATE PROCEDURE crear_indice_si_no_existe(IN tabla VARCHAR(64), IN indice VARCHAR(64), IN columnas VARCHAR(255))
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = tabla AND index_name = indice
+    ) THEN
+        SET @ddl = CONCAT('CREATE INDEX ', indice, ' ON ', tabla, ' (', columnas, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+
+DROP PROCEDURE IF EXISTS eliminar_indice_si_existe$$
+CREATE PROCEDURE eliminar_indice_si_existe(IN tabla VARCHAR(64), IN indice VARCHAR(64))
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = tabla AND index_name = indice
+    ) THEN
+        SET @ddl = CONCAT('DROP INDEX ', indice, ' ON ', tabla);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+DELIMITER ;
+
+CALL crear_indice_si_no_existe('predicciones_confirmadas', 'idx_confirmadas_pendientes',
+                               'confirmado, migrado, id');
+
+CALL eliminar_indice_si_existe('predicciones_confirmadas', 'idx_confirmadas_confirmado_migrado');
+
+DROP PROCEDURE crear_indice_si_no_existe;
+DROP PROCEDURE eliminar_indice_si_existe;
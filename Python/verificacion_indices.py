@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from cache_predicciones import CONSULTA_CACHE, CONSULTA_CACHE_LOTE
+from conexion import conexion_bd
+from consultas import ZONAS_RIESGO_RESUMEN, CONFIRMADAS_PENDIENTES, consulta_incidentes, consulta_agregados
+from instantaneas import CONSULTA_NUEVAS
+
+logger = logging.getLogger(__name__)
+
+# Ejecutar la verificación al arrancar (se puede desactivar con VERIFICAR_INDICES=0)
+VERIFICAR_INDICES = os.getenv("VERIFICAR_INDICES", "1") == "1"
+
+# Tablas grandes en las que un recorrido completo es un problema
+TABLAS_VIGILADAS = {"incidentes", "predicciones_confirmadas", "incidentes_resumen_diario", "predicciones_cache"}
+
+
+# Consultas frecuentes de la API con parámetros de ejemplo: (nombre, sql, parámetros)
+# Se arman con las mismas constantes y funciones que usan las rutas, así que no se quedan atrás si cambian
+def consultas_criticas(delegacion_id=1):
+    hoy = date.today()
+    inicio_mes = hoy.replace(day=1)
+    fecha_mes = datetime.combine(inicio_mes, datetime.min.time())
+    cursor_pagina = (inicio_mes.isoformat(), "12:00:00", 0)
+    return [
+        ("incidentes_mes",) + consulta_incidentes(delegacion_id, "month", None, fecha_mes),
+        ("incidentes_semana",) + consulta_incidentes(delegacion_id, "week", hoy.isoformat(), None),
+        ("incidentes_dia",) + consulta_incidentes(delegacion_id, "day", hoy.isoformat(), None),
+        # Segunda página de /incidentes?limit=: la condición de keyset debe resolverse como rango del índice
+        ("incidentes_paginado",) + consulta_incidentes(
+            delegacion_id, "month", None, fecha_mes, pagina=(cursor_pagina, 100)
+        ),
+        ("zonas_riesgo", ZONAS_RIESGO_RESUMEN, ()),
+        ("agregados",) + consulta_agregados(delegacion_id, ["hora", "codigo_color"], hoy - timedelta(days=29), hoy),
+        # Instantánea de entrenamiento: filas nuevas desde la marca de agua
+        ("instantanea_nuevas", CONSULTA_NUEVAS, (delegacion_id, 0)),
+        ("prediccion_cache", CONSULTA_CACHE, (delegacion_id, "day", hoy.isoformat(), "")),
+        ("prediccion_cache_lote", CONSULTA_CACHE_LOTE.format(marcadores="%s, %s"),
+         (delegacion_id, delegacion_id + 1, "day", hoy.isoformat())),
+        ("predicciones_por_migrar", CONFIRMADAS_PENDIENTES, (0, 1000)),
+    ]
+
+
+def verificar_planes():
+    """
+    Ejecuta EXPLAIN sobre las consultas frecuentes y registra un aviso por cada
+    una que recorre completa una tabla vigilada (type = ALL) o no usa índice.
+    Devuelve la lista de avisos.
+    """
+    avisos = []
+    try:
+        with conexion_bd() as conn:
+            cursor = conn.cursor(dictionary=True)
+            for nombre, sql, parametros in consultas_criticas():
+                try:
+                    cursor.execute("EXPLAIN " + sql, parametros)
+                    plan = cursor.fetchall()
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo ejecutar EXPLAIN para '{nombre}': {e}")
+                    continue
+                for paso in plan:
+                    tabla = paso.get("table")
+                    tabla_real = {"i": "incidentes", "rd": "incidentes_resumen_diario"}.get(tabla, tabla)
+                    if tabla_real not in TABLAS_VIGILADAS:
+                        continue
+                    if paso.get("type") == "ALL" or not paso.get("key"):
+                        aviso = (f"⚠️ La consulta '{nombre}' recorre completa la tabla {tabla_real} "
+                                 f"(type={paso.get('type')}, key={paso.get('key')}, filas≈{paso.get('rows')}). "
+                                 f"Revisa las migraciones de sql/")
+                        logger.warning(aviso)
+                        avisos.append(aviso)
+            cursor.close()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron verificar los índices: {e}")
+        return avisos
+
+    if not avisos:
+        logger.info("✅ Las consultas frecuentes usan índices")
+    return avisos
+
+
+# Verificación en segundo plano para no retrasar el arranque
+def verificar_planes_al_iniciar():
+    if VERIFICAR_INDICES:
+        threading.Thread(target=verificar_planes, name="verificar-indices", daemon=True).start()